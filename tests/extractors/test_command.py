@@ -3,9 +3,9 @@ from unittest import mock
 
 import pytest
 
-from unblob.extractors import Command
+from unblob.extractors import Command, StreamingCommand
 from unblob.extractors.command import InvalidCommandTemplate
-from unblob.models import ExtractError
+from unblob.models import ExtractError, File, ValidChunk
 from unblob.report import ExtractCommandFailedReport, ExtractorDependencyNotFoundReport
 
 
@@ -72,3 +72,32 @@ def test_command_not_found(tmpdir: Path):
                 dependencies=["this-command-should-not-exist-in-any-system"],
             )
         ]
+
+
+def test_streaming_command_rejects_inpath():
+    with pytest.raises(InvalidCommandTemplate):
+        StreamingCommand("cat", "{inpath}")
+
+
+def test_streaming_command_extract_from_file(tmp_path: Path):
+    content = bytes(range(256)) * 64 * 1024
+    file = File.from_bytes(b"prefix" + content + b"suffix")
+    chunk = ValidChunk(start_offset=6, end_offset=6 + len(content))
+    # writes the input to stdout as well, both pipes fill up meanwhile
+    command = StreamingCommand("sh", "-c", "tee {outdir}/{infile}")
+
+    command.extract_from_file(file, chunk, "6-16777222.test", tmp_path)
+
+    assert (tmp_path / "6-16777222").read_bytes() == content
+
+
+def test_streaming_command_extract(tmp_path: Path):
+    inpath = tmp_path / "input.test"
+    inpath.write_bytes(b"content")
+    outdir = tmp_path / "output"
+    outdir.mkdir()
+    command = StreamingCommand("sh", "-c", "cat > {outdir}/{infile}")
+
+    command.extract(inpath, outdir)
+
+    assert (outdir / "input").read_bytes() == b"content"
@@ -0,0 +1,105 @@
+import bz2
+import gzip
+import lzma
+import zlib
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from unblob.extractors import Command, DecompressorExtractor
+from unblob.extractors.decompressor import BufferReader
+from unblob.handlers.compression.gzip import GZIPHandler
+from unblob.handlers.compression.lzip import LZipHandler
+from unblob.handlers.compression.xz import XZHandler
+from unblob.models import ExtractError, File, ValidChunk
+from unblob.report import DecompressionFailedReport
+
+CONTENT = b"content " * 1024
+
+
+def make_lzip(content: bytes) -> bytes:
+    stream = lzma.compress(
+        content,
+        format=lzma.FORMAT_ALONE,
+        filters=[{"id": lzma.FILTER_LZMA1, "dict_size": 1 << 20}],
+    )
+    # lzip member: magic, version, coded dictionary size, LZMA stream, trailer
+    member = b"LZIP\x01\x14" + stream[13:]
+    member_size = len(member) + 20
+    return (
+        member
+        + zlib.crc32(content).to_bytes(4, "little")
+        + len(content).to_bytes(8, "little")
+        + member_size.to_bytes(8, "little")
+    )
+
+
+def test_buffer_reader():
+    with BufferReader(b"ab", memoryview(b""), memoryview(b"cde")) as reader:
+        assert reader.read(1) == b"a"
+        assert reader.read(3) == b"b"
+        assert reader.read() == b"cde"
+        assert reader.read() == b""
+
+
+@pytest.mark.parametrize(
+    "extractor, compressed",
+    [
+        pytest.param(
+            DecompressorExtractor(bz2.BZ2File, fallback=Command("false")),
+            bz2.compress(CONTENT[:10]) + bz2.compress(CONTENT[10:]),
+            id="bzip2-multistream",
+        ),
+        pytest.param(
+            XZHandler.EXTRACTOR,
+            lzma.compress(CONTENT[:10]) + b"\x00" * 4 + lzma.compress(CONTENT[10:]),
+            id="xz-padded-multistream",
+        ),
+        pytest.param(LZipHandler.EXTRACTOR, make_lzip(CONTENT), id="lzip"),
+        pytest.param(
+            GZIPHandler.EXTRACTOR, gzip.compress(CONTENT, mtime=0), id="gzip-nameless"
+        ),
+    ],
+)
+def test_decompressor_extract_from_file(
+    extractor: DecompressorExtractor, compressed: bytes, tmp_path: Path
+):
+    file = File.from_bytes(b"prefix" + compressed + b"suffix")
+    chunk = ValidChunk(start_offset=6, end_offset=6 + len(compressed))
+
+    extractor.extract_from_file(file, chunk, "6-100.chunk", tmp_path)
+
+    assert (tmp_path / "6-100").read_bytes() == CONTENT
+    file.close()
+
+
+def test_gzip_extract_uses_stored_name(tmp_path: Path):
+    inpath = tmp_path / "input.gz"
+    with inpath.open("wb") as f, gzip.GzipFile(
+        filename="../dir/stored.txt", mode="wb", fileobj=f
+    ) as gz:
+        gz.write(CONTENT)
+    outdir = tmp_path / "output"
+    outdir.mkdir()
+
+    GZIPHandler.EXTRACTOR.extract(inpath, outdir)
+
+    assert [p.name for p in outdir.iterdir()] == ["stored.txt"]
+    assert (outdir / "stored.txt").read_bytes() == CONTENT
+
+
+def test_decompressor_failure(tmp_path: Path):
+    compressed = lzma.compress(CONTENT, format=lzma.FORMAT_ALONE)[:-10]
+    file = File.from_bytes(compressed)
+    chunk = ValidChunk(start_offset=0, end_offset=len(compressed))
+    extractor = DecompressorExtractor(lzma.LZMAFile, fallback=Command("false"))
+
+    with pytest.raises(ExtractError) as exc_info:
+        extractor.extract_from_file(file, chunk, "0-100.lzma", tmp_path)
+
+    assert list(exc_info.value.reports) == [
+        DecompressionFailedReport(path=tmp_path / "0-100", error=mock.ANY)
+    ]
+    # no buffer of the file is left referenced
+    file.close()
@@ -0,0 +1,121 @@
+import sys
+import zlib
+from pathlib import Path
+
+import pytest
+
+import unblob.budget
+from unblob.budget import (
+    ExtractionBudget,
+    ExtractionBudgetExceeded,
+    ExtractionGuard,
+    guard_extraction,
+    measure,
+)
+from unblob.extractors.command import Command
+from unblob.file_utils import File
+from unblob.handlers.compression.zlib import ZlibHandler
+from unblob.models import ValidChunk
+from unblob.report import ExtractionBudgetExceededReport
+
+
+@pytest.fixture
+def budget(tmp_path: Path) -> ExtractionBudget:
+    directory = tmp_path / "budget"
+    directory.mkdir()
+    return ExtractionBudget(directory, max_size=10, max_files=3)
+
+
+@pytest.fixture
+def no_check_interval(monkeypatch):
+    monkeypatch.setattr(unblob.budget, "CHECK_INTERVAL", 0)
+
+
+def test_budget_charge(budget: ExtractionBudget, tmp_path: Path):
+    extract_root = tmp_path / "extract"
+
+    assert budget.charge(extract_root, (6, 1))
+    assert not budget.charge(extract_root, (6, 1))
+    assert budget.charge(extract_root, (4, 2))
+    assert not budget.charge(extract_root, (0, 1))
+
+    assert budget.get_usage(extract_root) == (10, 3)
+    # extract roots have their own budget
+    assert budget.get_usage(tmp_path / "other") == (0, 0)
+
+
+@pytest.mark.parametrize(
+    "max_size, max_files, exceeded",
+    [(0, 0, False), (100, 0, True), (0, 2, True), (1000, 10, False)],
+)
+def test_budget_is_exceeded(
+    tmp_path: Path, max_size: int, max_files: int, exceeded: bool
+):
+    budget = ExtractionBudget(tmp_path, max_size=max_size, max_files=max_files)
+
+    assert budget.is_exceeded((500, 5)) == exceeded
+
+
+def test_measure(tmp_path: Path):
+    (tmp_path / "dir").mkdir()
+    (tmp_path / "dir" / "file").write_bytes(b"12345")
+    (tmp_path / "link").symlink_to("dir/file")
+
+    assert measure(tmp_path) == (5, 3)
+
+
+def test_guard_counts_on_commit(budget: ExtractionBudget, tmp_path: Path):
+    outdir = tmp_path / "out"
+    outdir.mkdir()
+    (outdir / "file").write_bytes(b"12345")
+    guard = ExtractionGuard(budget, tmp_path, outdir)
+
+    guard.count(outdir / "file")
+    guard.commit()
+
+    assert budget.get_usage(tmp_path) == (5, 1)
+
+
+def test_guard_count_over_budget(budget: ExtractionBudget, tmp_path: Path):
+    budget.charge(tmp_path, (8, 0))
+    outdir = tmp_path / "out"
+    outdir.mkdir()
+    (outdir / "file").write_bytes(b"12345")
+    guard = ExtractionGuard(budget, tmp_path, outdir)
+
+    with pytest.raises(ExtractionBudgetExceeded) as exc_info:
+        guard.count(outdir / "file")
+
+    assert exc_info.value.reports == (
+        ExtractionBudgetExceededReport(
+            path=outdir, size=5, file_count=1, max_size=10, max_files=3
+        ),
+    )
+
+
+def test_guard_stops_decompression(
+    budget: ExtractionBudget, tmp_path: Path, no_check_interval
+):
+    content = zlib.compress(b"x" * 1024 * 1024)
+    file = File.from_bytes(content)
+    outdir = tmp_path / "out"
+    outdir.mkdir()
+    guard = ExtractionGuard(budget, tmp_path, outdir)
+
+    with guard_extraction(guard), pytest.raises(ExtractionBudgetExceeded):
+        ZlibHandler.EXTRACTOR.extract_from_file(
+            file, ValidChunk(0, len(content)), "input.zlib", outdir
+        )
+
+
+def test_guard_stops_command(
+    budget: ExtractionBudget, tmp_path: Path, no_check_interval
+):
+    outdir = tmp_path / "out"
+    outdir.mkdir()
+    guard = ExtractionGuard(budget, tmp_path, outdir)
+    script = "import pathlib, time; pathlib.Path('{outdir}/big').write_bytes(b'x' * 100); time.sleep(60)"
+    extractor = Command(sys.executable, "-c", script)
+
+    with guard_extraction(guard), pytest.raises(ExtractionBudgetExceeded):
+        extractor.extract(tmp_path / "input", outdir)
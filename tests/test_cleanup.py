@@ -2,6 +2,7 @@
 
 The tests use zip files as inputs - for simplicity
 """
+import gzip
 import io
 import zipfile
 from pathlib import Path
@@ -101,3 +102,52 @@ def test_keep_chunks_with_null_extractor(input_file: Path, output_dir: Path):
     all_reports = process_file(config, input_file)
     assert list(output_dir.glob("**/*.null"))
     check_result(all_reports)
+
+
+def wrapgzip(filename: str, content: bytes) -> bytes:
+    bio = io.BytesIO()
+    with gzip.GzipFile(filename, mode="wb", fileobj=bio, mtime=0) as f:
+        f.write(content)
+    return bio.getvalue()
+
+
+# extracted in process, to inner.bin, then to content.txt
+NESTED_GZIP_BYTES = b"prefix" + wrapgzip(
+    "inner.bin", b"prefix" + wrapgzip("content.txt", _ZIP_CONTENT)
+)
+
+
+@pytest.mark.parametrize("process_num", [1, 2])
+def test_cleanup_extracted(input_file: Path, output_dir: Path, process_num: int):
+    input_file.write_bytes(NESTED_GZIP_BYTES)
+    config = ExtractionConfig(
+        extract_root=output_dir,
+        entropy_depth=0,
+        process_num=process_num,
+        cleanup_extracted=True,
+    )
+
+    all_reports = process_file(config, input_file)
+
+    # content.txt was processed, then deleted
+    assert any(r.task.path.name == "content.txt" for r in all_reports.results)
+    assert list(output_dir.iterdir()) == [output_dir / "input_file_extract"]
+    assert list((output_dir / "input_file_extract").iterdir()) == []
+    check_result(all_reports)
+
+
+def test_cleanup_extracted_keeps_matching_files(input_file: Path, output_dir: Path):
+    input_file.write_bytes(NESTED_GZIP_BYTES)
+    config = ExtractionConfig(
+        extract_root=output_dir,
+        entropy_depth=0,
+        process_num=1,
+        cleanup_extracted=True,
+        keep_patterns=["*/content.txt"],
+    )
+
+    process_file(config, input_file)
+
+    kept_files = [p for p in output_dir.rglob("*") if p.is_file()]
+    assert [p.name for p in kept_files] == ["content.txt"]
+    assert kept_files[0].read_bytes() == _ZIP_CONTENT
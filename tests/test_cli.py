@@ -9,7 +9,12 @@ import unblob.cli
 from unblob.extractors import Command
 from unblob.handlers import BUILTIN_HANDLERS
 from unblob.models import Handler, HexString
-from unblob.processing import DEFAULT_DEPTH, DEFAULT_PROCESS_NUM, ExtractionConfig
+from unblob.processing import (
+    DEFAULT_DEPTH,
+    DEFAULT_PROCESS_NUM,
+    BatchInput,
+    ExtractionConfig,
+)
 
 
 class TestHandler(Handler):
@@ -239,3 +244,79 @@ def test_keep_extracted_chunks(
         process_file_mock.call_args.args[0].keep_extracted_chunks
         == keep_extracted_chunks
     ), fail_message
+
+
+def test_multiple_files(tmp_path: Path):
+    in_paths = []
+    for name in ["a/input", "b/input", "c/other"]:
+        in_path = tmp_path / name
+        in_path.parent.mkdir()
+        in_path.write_bytes(b"content")
+        in_paths.append(in_path)
+    file_list = tmp_path / "files.txt"
+    file_list.write_text(f"{in_paths[1]}\n\n{in_paths[2]}\n")
+    out_path = tmp_path / "out"
+    report_dir = tmp_path / "reports"
+    params = ["--extract-dir", str(out_path), "--report", str(report_dir)]
+    params += ["--files-from", str(file_list), str(in_paths[0])]
+
+    process_files_mock = mock.MagicMock(return_value=[])
+    with mock.patch.object(unblob.cli, "process_files", process_files_mock):
+        result = runner_invoke(params)
+
+    assert result.exit_code == 0
+    assert process_files_mock.call_args.args[1] == [
+        BatchInput(in_paths[0], out_path / "input", report_dir / "input.json"),
+        BatchInput(in_paths[1], out_path / "input.2", report_dir / "input.2.json"),
+        BatchInput(in_paths[2], out_path / "other", report_dir / "other.json"),
+    ]
+    assert report_dir.is_dir()
+
+
+def test_file_list_with_non_existing_file(tmp_path: Path):
+    file_list = tmp_path / "files.txt"
+    file_list.write_text("non/existing/path/54\n")
+
+    result = runner_invoke(
+        ["--extract-dir", str(tmp_path), "--files-from", str(file_list)]
+    )
+
+    assert result.exit_code == 2
+    assert "Invalid value for '--files-from'" in result.output
+
+
+@pytest.mark.parametrize("value", ["gzip", "gzip=x", "=1", "gzip=-1"])
+def test_invalid_handler_timeout(tmp_path: Path, value: str):
+    in_path = tmp_path / "input"
+    in_path.write_bytes(b"content")
+
+    result = runner_invoke(["--handler-timeout", value, str(in_path)])
+
+    assert result.exit_code == 2
+    assert "is not in the NAME=SECONDS format" in result.output
+
+
+def test_handler_timeouts(tmp_path: Path):
+    in_path = tmp_path / "input"
+    in_path.write_bytes(b"content")
+    process_file_mock = mock.MagicMock()
+
+    with mock.patch.object(unblob.cli, "process_file", process_file_mock):
+        runner_invoke(
+            [
+                "--extract-dir",
+                str(tmp_path / "out"),
+                "--handler-timeout",
+                "gzip=1.5",
+                "--handler-timeout",
+                "xz=2",
+                str(in_path),
+            ]
+        )
+
+    config = process_file_mock.call_args.args[0]
+    assert config.handler_timeouts == {"gzip": 1.5, "xz": 2}
+
+
+def runner_invoke(params: List[str]):
+    return CliRunner().invoke(unblob.cli.cli, params)
@@ -0,0 +1,260 @@
+import contextlib
+import json
+import socket
+import stat
+import threading
+import time
+from pathlib import Path
+from typing import Iterator
+from unittest import mock
+
+import pytest
+
+from unblob.daemon import Daemon
+from unblob.models import Extractor, Handler, Regex, ValidChunk
+from unblob.processing import ExtractionConfig, InputRun
+
+
+class WaitingCopyExtractor(Extractor):
+    """Copies chunks, after the release file exists in signal_dir."""
+
+    signal_dir = Path()
+
+    def extract(self, inpath: Path, outdir: Path):
+        (self.signal_dir / "started").touch()
+        while not (self.signal_dir / "release").exists():
+            time.sleep(0.01)
+        outdir.mkdir(exist_ok=True)
+        (outdir / "content").write_bytes(inpath.read_bytes())
+
+
+class WaitingCopyHandler(Handler):
+    NAME = "waiting_copy"
+    PATTERNS = [Regex("CHUNK")]
+    EXTRACTOR = WaitingCopyExtractor()
+
+    def calculate_chunk(self, file, start_offset: int):
+        return ValidChunk(start_offset=start_offset, end_offset=start_offset + 8)
+
+
+class Client:
+    def __init__(self, socket_path: Path):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(str(socket_path))
+        # responses of a stopped daemon are not waited for forever
+        self._socket.settimeout(30)
+        self._file = self._socket.makefile("rwb")
+
+    def send(self, request: dict):
+        self._file.write(json.dumps(request).encode() + b"\n")
+        self._file.flush()
+
+    def receive(self) -> dict:
+        return json.loads(self._file.readline())
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+
+@pytest.fixture
+def config(tmp_path: Path, request) -> ExtractionConfig:
+    """Config of the daemon, with the options of an indirect parameter."""
+    return ExtractionConfig(
+        extract_root=tmp_path,
+        entropy_depth=0,
+        process_num=2,
+        handlers=(WaitingCopyHandler,),
+        **getattr(request, "param", {}),
+    )
+
+
+def is_listening(socket_path: Path) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(str(socket_path))
+        except OSError:
+            return False
+    return True
+
+
+@contextlib.contextmanager
+def run_daemon(config: ExtractionConfig, socket_path: Path) -> Iterator[None]:
+    """Serve jobs on socket_path in a thread, until the end of the context."""
+    # before the workers are started
+    WaitingCopyExtractor.signal_dir = config.extract_root
+    daemon = Daemon(config, socket_path)
+    errors = []
+
+    def serve():
+        try:
+            daemon.serve()
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    while thread.is_alive() and not is_listening(socket_path):
+        time.sleep(0.01)
+    try:
+        yield
+    finally:
+        daemon.stop()
+        thread.join()
+    assert errors == []
+    assert not socket_path.exists()
+
+
+@pytest.fixture
+def socket_path(tmp_path: Path, config: ExtractionConfig):
+    socket_path = tmp_path / "unblob.sock"
+    with run_daemon(config, socket_path):
+        yield socket_path
+
+
+def test_daemon_processes_jobs(tmp_path: Path, socket_path: Path):
+    (tmp_path / "release").touch()
+    input_file = tmp_path / "input"
+    input_file.write_bytes(b"__CHUNK123")
+    client = Client(socket_path)
+
+    client.send(
+        {
+            "input": str(input_file),
+            "extract_root": str(tmp_path / "extract"),
+            "report": str(tmp_path / "report.json"),
+        }
+    )
+    accepted = client.receive()
+    done = client.receive()
+    client.close()
+
+    assert accepted == {"job": accepted["job"], "status": "accepted"}
+    assert done["job"] == accepted["job"]
+    assert done["status"] == "done"
+    assert json.loads((tmp_path / "report.json").read_text()) == done["result"]
+    extract_dir = tmp_path / "extract" / "input_extract" / "2-10.waiting_copy_extract"
+    assert (extract_dir / "content").read_bytes() == b"CHUNK123"
+
+
+def test_daemon_socket_is_private(socket_path: Path):
+    assert stat.S_IMODE(socket_path.stat().st_mode) == 0o600
+
+
+def test_daemon_replaces_stale_socket(tmp_path: Path, config: ExtractionConfig):
+    socket_path = tmp_path / "unblob.sock"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale_socket:
+        stale_socket.bind(str(socket_path))
+
+    with run_daemon(config, socket_path):
+        client = Client(socket_path)
+        client.send({"cancel": "unknown"})
+        assert client.receive()["status"] == "error"
+        client.close()
+
+
+def test_daemon_keeps_socket_of_running_daemon(
+    tmp_path: Path, config: ExtractionConfig, socket_path: Path
+):
+    with pytest.raises(OSError):
+        Daemon(config, socket_path).serve()
+
+    assert socket_path.is_socket()
+
+
+def test_daemon_stops_without_socket(socket_path: Path):
+    socket_path.unlink()
+
+
+@pytest.mark.parametrize("config", [dict(skip_duplicates=True)], indirect=True)
+def test_daemon_processes_same_input_again(tmp_path: Path, socket_path: Path):
+    (tmp_path / "release").touch()
+    input_file = tmp_path / "input"
+    input_file.write_bytes(b"__CHUNK123")
+    client = Client(socket_path)
+
+    responses = []
+    for extract_root in (tmp_path / "first", tmp_path / "second"):
+        client.send({"input": str(input_file), "extract_root": str(extract_root)})
+        client.receive()
+        responses.append(client.receive())
+    client.close()
+
+    # duplicates are only skipped within a job
+    assert [response["status"] for response in responses] == ["done", "done"]
+    for extract_root in (tmp_path / "first", tmp_path / "second"):
+        extract_dir = extract_root / "input_extract" / "2-10.waiting_copy_extract"
+        assert (extract_dir / "content").read_bytes() == b"CHUNK123"
+
+
+def test_daemon_survives_job_failing_to_start(tmp_path: Path, socket_path: Path):
+    (tmp_path / "release").touch()
+    input_file = tmp_path / "input"
+    input_file.write_bytes(b"__CHUNK123")
+    start = InputRun.start
+
+    def remove_input_and_start(run: InputRun):
+        run.input.path.unlink(missing_ok=True)
+        return start(run)
+
+    client = Client(socket_path)
+    with mock.patch.object(
+        InputRun, "start", autospec=True, side_effect=remove_input_and_start
+    ):
+        client.send({"input": str(input_file), "extract_root": str(tmp_path / "a")})
+        accepted = client.receive()
+        failed = client.receive()
+
+    input_file.write_bytes(b"__CHUNK123")
+    client.send({"input": str(input_file), "extract_root": str(tmp_path / "b")})
+    client.receive()
+    done = client.receive()
+    client.close()
+
+    assert failed["job"] == accepted["job"]
+    assert failed["status"] == "error"
+    assert failed["error"].startswith("Job failed")
+    assert done["status"] == "done"
+
+
+def test_daemon_cancels_jobs(tmp_path: Path, socket_path: Path):
+    input_file = tmp_path / "input"
+    input_file.write_bytes(b"__CHUNK123")
+    client = Client(socket_path)
+    client.send({"input": str(input_file), "extract_root": str(tmp_path / "extract")})
+    job_id = client.receive()["job"]
+    while not (tmp_path / "started").exists():
+        time.sleep(0.01)
+
+    other_client = Client(socket_path)
+    other_client.send({"cancel": job_id})
+    cancelling = other_client.receive()
+    (tmp_path / "release").touch()
+    cancelled = client.receive()
+    other_client.send({"cancel": job_id})
+    unknown = other_client.receive()
+    client.close()
+    other_client.close()
+
+    assert cancelling == {"job": job_id, "status": "cancelling"}
+    assert cancelled["status"] == "cancelled"
+    # the extracted content is not processed
+    assert [r["task"]["depth"] for r in cancelled["result"]] == [0]
+    assert unknown == {"job": job_id, "status": "error", "error": "Unknown job"}
+
+
+@pytest.mark.parametrize(
+    "request_",
+    [
+        pytest.param({"extract_root": "/tmp"}, id="no-input"),
+        pytest.param({"input": "/non/existing", "extract_root": "/tmp"}, id="missing"),
+    ],
+)
+def test_daemon_rejects_invalid_jobs(socket_path: Path, request_: dict):
+    client = Client(socket_path)
+    client.send(request_)
+    response = client.receive()
+    client.close()
+
+    assert response["status"] == "error"
+    assert response["error"].startswith("Invalid job")
@@ -0,0 +1,12 @@
+from pathlib import Path
+
+from unblob.dedup import DedupRegistry
+
+
+def test_register(tmp_path: Path):
+    registry = DedupRegistry(tmp_path)
+
+    assert registry.register("digest", Path("first")) is None
+    assert registry.register("digest", Path("second")) == Path("first")
+    assert registry.register("other-digest", Path("second")) is None
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["digest", "other-digest"]
@@ -1,3 +1,4 @@
+import subprocess
 from pathlib import Path, PosixPath
 
 import pytest
@@ -7,8 +8,11 @@ from unblob.extractor import (
     fix_extracted_directory,
     fix_permission,
     fix_symlink,
+    is_chunk_window_supported,
+    open_valid_chunk_window,
 )
-from unblob.models import File, TaskResult, UnknownChunk
+from unblob.handlers.archive.tar import TarHandler
+from unblob.models import File, TaskResult, UnknownChunk, ValidChunk
 
 
 def test_carve_unknown_chunk(tmp_path: Path):
@@ -21,6 +25,30 @@ def test_carve_unknown_chunk(tmp_path: Path):
     assert written_path.read_bytes() == content[1:8]
 
 
+@pytest.mark.skipif(
+    not is_chunk_window_supported(), reason="needs memfd_create and /proc"
+)
+def test_open_valid_chunk_window(tmp_path: Path):
+    path = tmp_path / "input"
+    path.write_bytes(b"0123456789")
+    chunk = ValidChunk(2, 7)
+    chunk.handler = TarHandler()
+
+    with File.from_path(path) as file, open_valid_chunk_window(
+        file, chunk
+    ) as window_path:
+        assert window_path.name == "2-7.tar"
+        assert window_path.read_bytes() == b"23456"
+        # readable by other processes as well
+        res = subprocess.run(["cat", window_path], stdout=subprocess.PIPE, check=True)
+        assert res.stdout == b"23456"
+        with pytest.raises(PermissionError):
+            window_path.write_bytes(b"modified")
+
+    assert not window_path.exists()
+    assert list(tmp_path.iterdir()) == [path]
+
+
 def test_fix_permission(tmpdir: Path):
     tmpdir = PosixPath(tmpdir)
     tmpfile = PosixPath(tmpdir / "file.txt")
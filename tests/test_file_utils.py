@@ -1,9 +1,13 @@
+import errno
 import io
+import unittest.mock as mock
 from pathlib import Path
 from typing import List
 
+import hyperscan
 import pytest
 
+import unblob.file_utils
 from unblob.file_utils import (
     Endian,
     File,
@@ -13,16 +17,29 @@ from unblob.file_utils import (
     convert_int16,
     convert_int32,
     convert_int64,
+    copy_file_range,
     decode_multibyte_integer,
     get_endian,
     iterate_file,
     iterate_patterns,
     round_down,
     round_up,
+    scan_file_range,
     valid_path,
 )
 
 
+def _compile_database(*expressions: bytes) -> hyperscan.Database:
+    db = hyperscan.Database(mode=hyperscan.HS_MODE_VECTORED)
+    db.compile(
+        expressions=expressions,
+        ids=list(range(len(expressions))),
+        elements=len(expressions),
+        flags=[hyperscan.HS_FLAG_SOM_LEFTMOST] * len(expressions),
+    )
+    return db
+
+
 @pytest.mark.parametrize(
     "size, alignment, result",
     (
@@ -349,3 +366,87 @@ class TestGetEndian:
 )
 def test_valid_path(content: str, expected: bool):
     assert valid_path(Path(content)) == expected
+
+
+@pytest.mark.parametrize(
+    "start_offset, terminate, expected",
+    [
+        pytest.param(0, False, [(0, 0, 2), (1, 4, 6), (0, 8, 10)], id="whole-file"),
+        pytest.param(3, False, [(1, 4, 6), (0, 8, 10)], id="from-offset"),
+        pytest.param(4, True, [(1, 4, 6)], id="terminated"),
+        pytest.param(11, False, [], id="from-end"),
+    ],
+)
+def test_scan_file_range(start_offset: int, terminate: bool, expected: List):
+    db = _compile_database(b"AB", b"CD")
+    file = File.from_bytes(b"AB__CD__AB_")
+    matches = []
+
+    def on_match(pattern_id: int, offset: int, end: int, flags: int, context):
+        context.append((pattern_id, offset, end))
+        return terminate
+
+    scan_file_range(db, file, start_offset, on_match, matches)
+
+    assert matches == expected
+
+
+def _fail_copy(*_args):
+    raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+
+class TestCopyFileRange:
+    CONTENT = b"0123456789" * 1000
+
+    def _copy(self, tmp_path: Path, file: File, start_offset: int, size: int):
+        outpath = tmp_path / "out"
+        with outpath.open("wb", buffering=0) as outfile:
+            outfile.write(b"prefix")
+            method = copy_file_range(file, start_offset, size, outfile)
+        return method, outpath.read_bytes()
+
+    def test_copy_from_memory(self, tmp_path: Path):
+        file = File.from_bytes(self.CONTENT)
+
+        method, content = self._copy(tmp_path, file, 5, 20)
+
+        assert method == "buffered"
+        assert content == b"prefix" + self.CONTENT[5:25]
+
+    def test_copy_from_path(self, tmp_path: Path):
+        path = tmp_path / "input"
+        path.write_bytes(self.CONTENT)
+
+        with File.from_path(path) as file:
+            method, content = self._copy(tmp_path, file, 4096, 5000)
+
+        assert method in ("reflink", "copy_file_range", "sendfile")
+        assert content == b"prefix" + self.CONTENT[4096:9096]
+
+    @pytest.mark.parametrize(
+        "failing_methods, expected_method",
+        [
+            pytest.param(["reflink"], "copy_file_range", id="copy_file_range"),
+            pytest.param(["reflink", "copy_file_range"], "sendfile", id="sendfile"),
+            pytest.param(
+                ["reflink", "copy_file_range", "sendfile"], "buffered", id="buffered"
+            ),
+        ],
+    )
+    def test_copy_falls_back(
+        self, tmp_path: Path, failing_methods: List[str], expected_method: str
+    ):
+        path = tmp_path / "input"
+        path.write_bytes(self.CONTENT)
+        copy_methods = [
+            (method, _fail_copy if method in failing_methods else copy)
+            for method, copy in unblob.file_utils._KERNEL_COPY_METHODS
+        ]
+
+        with mock.patch.object(
+            unblob.file_utils, "_KERNEL_COPY_METHODS", copy_methods
+        ), File.from_path(path) as file:
+            method, content = self._copy(tmp_path, file, 1, 100)
+
+        assert method == expected_method
+        assert content == b"prefix" + self.CONTENT[1:101]
@@ -1,10 +1,25 @@
+import unittest.mock as mock
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
 import attr
+import hyperscan
 import pytest
 
+import unblob.finder
 from unblob.file_utils import InvalidInputFormat
-from unblob.finder import build_hyperscan_database, search_chunks
+from unblob.finder import (
+    CandidateThrottling,
+    build_hyperscan_database,
+    get_handlers_fingerprint,
+    get_max_match_width,
+    get_scratches,
+    prepare_search,
+    search_chunks,
+)
 from unblob.models import File, Handler, HexString, Regex, ValidChunk
 from unblob.parser import InvalidHexString
+from unblob.report import CalculateChunkExceptionReport, CandidateThrottlingReport
 
 
 class TestHandlerA(Handler):
@@ -57,6 +72,22 @@ class TestHandlerExc(Handler):
         raise Exception("Error")
 
 
+class TestHandlerRun(Handler):
+    NAME = "handlerRun"
+    PATTERNS = [Regex("AAAA")]
+
+    def calculate_chunk(self, file, start_offset: int):
+        return ValidChunk(start_offset=start_offset, end_offset=start_offset + 100)
+
+
+class TestHandlerSpan(Handler):
+    NAME = "handlerSpan"
+    PATTERNS = [Regex("BB[^X]{0,30}CC")]
+
+    def calculate_chunk(self, file, start_offset: int):
+        return ValidChunk(start_offset=start_offset, end_offset=start_offset + 200)
+
+
 def test_build_hyperscan_database():
     db, handler_map = build_hyperscan_database((TestHandlerA, TestHandlerB))
     matches = []
@@ -140,7 +171,19 @@ def test_invalid_hexstring_pattern_raises():
         ),
     ],
 )
-def test_search_chunks(content, expected_chunks, task_result):
+@pytest.mark.parametrize(
+    "segment_count, calculate_chunk_process_num",
+    [
+        pytest.param(1, 1, id="sequential"),
+        pytest.param(2, 1, id="2-segments"),
+        pytest.param(3, 1, id="3-segments"),
+        pytest.param(1, 2, id="concurrent-calculate-chunk"),
+        pytest.param(2, 2, id="2-segments-concurrent-calculate-chunk"),
+    ],
+)
+def test_search_chunks(
+    content, expected_chunks, segment_count, calculate_chunk_process_num, task_result
+):
     file = File.from_bytes(content)
 
     handlers = (
@@ -152,8 +195,352 @@ def test_search_chunks(content, expected_chunks, task_result):
         TestHandlerExc,
     )
 
-    chunks = search_chunks(file, len(content), handlers, task_result)
+    chunks = search_chunks(
+        file,
+        len(content),
+        handlers,
+        task_result,
+        segment_count=segment_count,
+        calculate_chunk_process_num=calculate_chunk_process_num,
+    )
 
     assert len(chunks) == len(expected_chunks)
     for expected_chunk, chunk in zip(expected_chunks, chunks):
         assert attr.evolve(chunk, id="") == attr.evolve(expected_chunk, id="")
+
+
+def test_hyperscan_database_is_stored_in_cache_dir(tmp_path: Path):
+    handlers = (TestHandlerA, TestHandlerB)
+    build_hyperscan_database(handlers, tmp_path)
+
+    assert [p.name for p in tmp_path.iterdir()] == [
+        f"hyperscan-{get_handlers_fingerprint(handlers)}.db"
+    ]
+
+
+def test_hyperscan_database_is_loaded_from_cache_dir(tmp_path: Path):
+    handlers = (TestHandlerA, TestHandlerB)
+    build_hyperscan_database(handlers, tmp_path)
+    build_hyperscan_database.cache_clear()
+
+    with mock.patch.object(
+        unblob.finder, "_compile_hyperscan_database"
+    ) as compile_mock:
+        db, handler_map = build_hyperscan_database(handlers, tmp_path)
+
+    compile_mock.assert_not_called()
+    matches = []
+    db.scan(
+        [bytearray(b"A123456789BB")],
+        match_event_handler=lambda pattern_id, start, end, flags, m: m.append(
+            (pattern_id, start, end)
+        ),
+        context=matches,
+    )
+    assert [(type(handler_map[m[0]]), m[1]) for m in matches] == [
+        (TestHandlerA, 0),
+        (TestHandlerB, 10),
+    ]
+
+
+def test_invalid_cached_hyperscan_database_is_recompiled(tmp_path: Path):
+    handlers = (TestHandlerA, TestHandlerB)
+    db_path = tmp_path / f"hyperscan-{get_handlers_fingerprint(handlers)}.db"
+    db_path.write_bytes(b"invalid")
+
+    db, _handler_map = build_hyperscan_database(handlers, tmp_path)
+
+    assert db_path.read_bytes() == hyperscan.dumpb(db)
+
+
+@pytest.mark.parametrize(
+    "other_handlers",
+    [
+        pytest.param((TestHandlerB, TestHandlerA), id="order"),
+        pytest.param((TestHandlerA,), id="subset"),
+        pytest.param((TestHandlerA, TestHandlerB, TestHandlerD), id="extended"),
+    ],
+)
+def test_handlers_fingerprint_differs(other_handlers):
+    assert get_handlers_fingerprint(
+        (TestHandlerA, TestHandlerB)
+    ) != get_handlers_fingerprint(other_handlers)
+
+
+def test_search_chunks_skips_scanning_found_chunks(task_result):
+    content = b"A" * 10
+    file = File.from_bytes(content)
+
+    with mock.patch.object(
+        unblob.finder, "_hyperscan_match", wraps=unblob.finder._hyperscan_match
+    ) as match_mock:
+        chunks = search_chunks(
+            file, len(content), (TestHandlerA, TestHandlerB), task_result
+        )
+
+    assert [attr.evolve(chunk, id="") for chunk in chunks] == [
+        ValidChunk(0, 5, id=""),
+        ValidChunk(5, 10, id=""),
+    ]
+    # one match at the start of each chunk, and the ones inside the first chunk,
+    # until the longest match ending there could only start inside it
+    assert match_mock.call_count == 4
+
+
+@pytest.mark.parametrize(
+    "segment_count, calculate_chunk_process_num",
+    [
+        pytest.param(1, 1, id="sequential"),
+        pytest.param(2, 1, id="2-segments"),
+        pytest.param(1, 2, id="concurrent-calculate-chunk"),
+    ],
+)
+def test_search_chunks_finds_match_starting_before_found_chunk(
+    segment_count, calculate_chunk_process_num, task_result
+):
+    # the span match starts before the run chunk, but ends after the run matches
+    # inside the chunk
+    content = b"0" * 10 + b"BB" + b"0" * 8 + b"A" * 20 + b"CC"
+    content += b"0" * (256 - len(content))
+    file = File.from_bytes(content)
+
+    chunks = search_chunks(
+        file,
+        len(content),
+        (TestHandlerRun, TestHandlerSpan),
+        task_result,
+        segment_count=segment_count,
+        calculate_chunk_process_num=calculate_chunk_process_num,
+    )
+
+    assert sorted((chunk.start_offset, chunk.end_offset) for chunk in chunks) == [
+        (0xA, 0xD2),
+        (0x14, 0x78),
+    ]
+
+
+def test_get_max_match_width():
+    assert get_max_match_width((TestHandlerA, TestHandlerB, TestHandlerD)) == 3
+
+
+def test_get_max_match_width_unbounded():
+    class UnboundedHandler(TestHandlerA):
+        PATTERNS = [Regex("A.*B")]
+
+    assert get_max_match_width((TestHandlerA, UnboundedHandler)) is None
+
+
+def test_search_chunks_in_segments_finds_matches_across_segment_boundary(
+    task_result,
+):
+    # 5 bytes long segments, the match at 4-6 crosses the first boundary
+    content = b"0123BB" + b"0" * 19
+    file = File.from_bytes(content)
+
+    chunks = search_chunks(
+        file, len(content), (TestHandlerA, TestHandlerB), task_result, segment_count=5
+    )
+
+    assert [attr.evolve(chunk, id="") for chunk in chunks] == [ValidChunk(3, 13, id="")]
+
+
+def test_search_chunks_concurrent_calculate_chunk_reports(task_result):
+    content = b"EXCA2345"
+    file = File.from_bytes(content)
+
+    search_chunks(
+        file,
+        len(content),
+        (TestHandlerA, TestHandlerExc),
+        task_result,
+        calculate_chunk_process_num=2,
+    )
+
+    assert [(type(r), r.handler, r.start_offset) for r in task_result.reports] == [
+        (CalculateChunkExceptionReport, "handlerEXC", 0)
+    ]
+
+
+@pytest.fixture
+def submitted_candidates():
+    """Offsets chunks are calculated for concurrently."""
+    offsets = []
+    original_map = ProcessPoolExecutor.map
+
+    def record_map(executor, fn, iterable):
+        args = list(iterable)
+        offsets.extend(real_offset for _file, _handler, real_offset, *_ in args)
+        return original_map(executor, fn, args)
+
+    with mock.patch.object(ProcessPoolExecutor, "map", record_map):
+        yield offsets
+
+
+def test_search_chunks_concurrently_skips_covered_candidates(
+    tmp_path: Path, task_result, submitted_candidates
+):
+    path = tmp_path / "file"
+    path.write_bytes(b"A" * 100 + b"0" * 100)
+    file = File.from_path(path)
+
+    chunks = search_chunks(
+        file, 200, (TestHandlerRun,), task_result, calculate_chunk_process_num=2
+    )
+
+    assert [(chunk.start_offset, chunk.end_offset) for chunk in chunks] == [(0, 100)]
+    # only the first wave is calculated, the other matches are inside its chunk
+    assert submitted_candidates == list(range(2 * unblob.finder.WAVE_SIZE_PER_PROCESS))
+
+
+def test_search_chunks_concurrently_respects_candidate_budget(
+    tmp_path: Path, task_result, submitted_candidates
+):
+    path = tmp_path / "file"
+    path.write_bytes(b"D" * 10)
+    file = File.from_path(path)
+    throttling = CandidateThrottling(candidate_budget=4)
+
+    search_chunks(
+        file,
+        10,
+        (TestHandlerD,),
+        task_result,
+        throttling=throttling,
+        calculate_chunk_process_num=2,
+    )
+
+    assert submitted_candidates == [0, 1, 2, 3]
+    assert [r.skipped_over_budget_count for r in task_result.reports] == [6]
+
+
+def test_search_chunks_concurrently_reuses_executor(tmp_path: Path, task_result):
+    executors = []
+    for content in (b"A2345", b"0A2345"):
+        path = tmp_path / "file"
+        path.write_bytes(content)
+        file = File.from_path(path)
+
+        chunks = search_chunks(
+            file,
+            len(content),
+            (TestHandlerA,),
+            task_result,
+            calculate_chunk_process_num=2,
+        )
+
+        assert [chunk.start_offset for chunk in chunks] == [content.index(b"A")]
+        executors.append(unblob.finder._chunk_executor)
+
+    assert executors[0] is not None
+    assert executors[0] is executors[1]
+
+
+def test_search_chunks_candidate_budget(task_result):
+    content = b"D" * 10
+    file = File.from_bytes(content)
+    throttling = CandidateThrottling(candidate_budget=4)
+
+    with mock.patch.object(
+        TestHandlerD, "calculate_chunk", return_value=None
+    ) as calculate_chunk_mock:
+        search_chunks(
+            file, len(content), (TestHandlerD,), task_result, throttling=throttling
+        )
+
+    assert calculate_chunk_mock.call_count == 4
+    assert task_result.reports == [
+        CandidateThrottlingReport(
+            handler="handlerD",
+            accepted_count=0,
+            rejected_count=4,
+            throttled_offset=None,
+            budget_exhausted_offset=4,
+            skipped_high_entropy_count=0,
+            skipped_over_budget_count=6,
+        )
+    ]
+
+
+def test_search_chunks_throttles_handler_in_high_entropy_data(task_result):
+    # a block of every byte value (including a "D" at 68), followed by false
+    # positive matches
+    content = bytes(range(256)) + b"D" * 20
+    file = File.from_bytes(content)
+    throttling = CandidateThrottling(
+        min_candidates=2,
+        max_rejection_ratio=0.5,
+        sample_interval=4,
+        entropy_block_size=256,
+        entropy_threshold=7.5,
+    )
+
+    with mock.patch.object(
+        TestHandlerD, "calculate_chunk", return_value=None
+    ) as calculate_chunk_mock:
+        search_chunks(
+            file, len(content), (TestHandlerD,), task_result, throttling=throttling
+        )
+
+    # 2 before throttling, then every 4th of the remaining 19
+    assert calculate_chunk_mock.call_count == 2 + 4
+    assert task_result.reports == [
+        CandidateThrottlingReport(
+            handler="handlerD",
+            accepted_count=0,
+            rejected_count=6,
+            throttled_offset=257,
+            budget_exhausted_offset=None,
+            skipped_high_entropy_count=15,
+            skipped_over_budget_count=0,
+        )
+    ]
+
+
+def test_search_chunks_does_not_throttle_in_low_entropy_data(task_result):
+    content = b"D" * 300
+    file = File.from_bytes(content)
+    throttling = CandidateThrottling(
+        min_candidates=2, max_rejection_ratio=0.5, entropy_block_size=256
+    )
+
+    with mock.patch.object(
+        TestHandlerD, "calculate_chunk", return_value=None
+    ) as calculate_chunk_mock:
+        search_chunks(
+            file, len(content), (TestHandlerD,), task_result, throttling=throttling
+        )
+
+    assert calculate_chunk_mock.call_count == 300
+    assert [r.throttled_offset for r in task_result.reports] == [2]
+
+
+def test_search_chunks_calculates_chunk_once_per_offset(task_result):
+    class MultiPatternHandler(TestHandlerExc):
+        PATTERNS = [Regex("EXC"), Regex("EX"), HexString("45 58")]
+
+    content = b"EXC EXC"
+    file = File.from_bytes(content)
+
+    with mock.patch.object(
+        MultiPatternHandler, "calculate_chunk", side_effect=Exception("Error")
+    ) as calculate_chunk_mock:
+        search_chunks(file, len(content), (MultiPatternHandler,), task_result)
+
+    assert calculate_chunk_mock.call_count == 2
+    assert [r.start_offset for r in task_result.reports] == [0, 4]
+
+
+def test_prepare_search_caches_database_and_scratches():
+    handlers = (TestHandlerA, TestHandlerB)
+
+    prepare_search(handlers, segment_count=3)
+
+    with mock.patch.object(
+        unblob.finder, "_compile_hyperscan_database"
+    ) as compile_mock, mock.patch.object(hyperscan, "Scratch") as scratch_mock:
+        hyperscan_db, _ = build_hyperscan_database(handlers, None)
+        scratches = get_scratches(hyperscan_db, 3)
+
+    compile_mock.assert_not_called()
+    scratch_mock.assert_not_called()
+    assert len(set(map(id, scratches))) == 3
@@ -0,0 +1,139 @@
+import signal
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from unblob.extractors.command import Command
+from unblob.limits import ResourceLimits, WatchdogTimeout, limit_resources, watchdog
+from unblob.models import ExtractError
+from unblob.report import ExtractCommandFailedReport, ExtractCommandLimitExceededReport
+
+
+def test_watchdog_interrupts():
+    with pytest.raises(WatchdogTimeout) as exc_info, watchdog(0.1):
+        time.sleep(10)
+
+    assert exc_info.value.timeout == 0.1
+
+
+def test_watchdog_restores_alarm_handler():
+    previous_handler = signal.getsignal(signal.SIGALRM)
+
+    with watchdog(10):
+        pass
+
+    assert signal.getsignal(signal.SIGALRM) == previous_handler
+    assert signal.getitimer(signal.ITIMER_REAL) == (0.0, 0.0)
+
+
+def test_watchdog_without_timeout():
+    with watchdog(0):
+        time.sleep(0.1)
+
+    assert signal.getitimer(signal.ITIMER_REAL) == (0.0, 0.0)
+
+
+def test_watchdog_outside_main_thread():
+    errors = []
+
+    def run():
+        try:
+            with watchdog(0.1):
+                time.sleep(0.2)
+        except BaseException as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+
+    assert errors == []
+
+
+def test_watchdog_kills_command(tmp_path: Path):
+    extractor = Command(sys.executable, "-c", "import time; time.sleep(60)")
+
+    start = time.monotonic()
+    with pytest.raises(WatchdogTimeout), watchdog(0.2):
+        extractor.extract(tmp_path / "input", tmp_path)
+
+    assert time.monotonic() - start < 10
+
+
+def test_command_cpu_limit(tmp_path: Path):
+    extractor = Command(sys.executable, "-c", "while True: pass")
+
+    with pytest.raises(ExtractError) as exc_info, limit_resources(
+        ResourceLimits(cpu=1)
+    ):
+        extractor.extract(tmp_path / "input", tmp_path)
+
+    (report,) = exc_info.value.reports
+    assert isinstance(report, ExtractCommandLimitExceededReport)
+    assert (report.limit, report.value) == ("cpu", 1)
+
+
+def test_command_memory_limit(tmp_path: Path):
+    extractor = Command(sys.executable, "-c", "b'x' * 1024 * 1024 * 1024")
+
+    with pytest.raises(ExtractError) as exc_info, limit_resources(
+        ResourceLimits(memory=256 * 1024 * 1024)
+    ):
+        extractor.extract(tmp_path / "input", tmp_path)
+
+    (report,) = exc_info.value.reports
+    assert isinstance(report, ExtractCommandLimitExceededReport)
+    assert (report.limit, report.value) == ("memory", 256 * 1024 * 1024)
+    assert b"MemoryError" in report.stderr
+
+
+def test_command_failure_without_hitting_limit(tmp_path: Path):
+    extractor = Command(sys.executable, "-c", "raise SystemExit('out of memory')")
+
+    with pytest.raises(ExtractError) as exc_info, limit_resources(
+        ResourceLimits(cpu=10)
+    ):
+        extractor.extract(tmp_path / "input", tmp_path)
+
+    (report,) = exc_info.value.reports
+    assert type(report) is ExtractCommandFailedReport
+
+
+@pytest.mark.parametrize(
+    "limits, returncode, stderr, expected",
+    [
+        pytest.param(ResourceLimits(cpu=1), -signal.SIGXCPU, b"", ("cpu", 1), id="cpu"),
+        pytest.param(ResourceLimits(cpu=1), 1, b"", None, id="cpu-not-hit"),
+        pytest.param(
+            ResourceLimits(memory=1024),
+            1,
+            b"xz: Cannot allocate memory\n",
+            ("memory", 1024),
+            id="memory",
+        ),
+        pytest.param(
+            ResourceLimits(memory=1024),
+            -signal.SIGABRT,
+            b"terminate called after throwing an instance of 'std::bad_alloc'",
+            ("memory", 1024),
+            id="memory-abort",
+        ),
+        pytest.param(
+            ResourceLimits(memory=1024), 1, b"corrupt data", None, id="memory-not-hit"
+        ),
+        pytest.param(
+            ResourceLimits(memory=1024),
+            0,
+            b"out of memory, retrying",
+            None,
+            id="succeeded",
+        ),
+    ],
+)
+def test_get_hit_limit(
+    limits: ResourceLimits, returncode: int, stderr: bytes, expected
+):
+    assert limits.get_hit_limit(returncode, stderr) == expected
@@ -1,7 +1,7 @@
 import pytest
 
 from unblob.file_utils import InvalidInputFormat
-from unblob.models import Chunk, UnknownChunk
+from unblob.models import Chunk, ChunkIndex, UnknownChunk
 
 
 class TestChunk:
@@ -47,3 +47,55 @@ class TestChunk:
     def test_validation(self, start_offset, end_offset):
         with pytest.raises(InvalidInputFormat):
             Chunk(start_offset, end_offset)
+
+
+class TestChunkIndex:
+    def test_ordered_by_start_offset(self):
+        chunks = [Chunk(10, 20), Chunk(0, 5), Chunk(10, 30)]
+        index = ChunkIndex(chunks[:2])
+        index.add(chunks[2])
+        assert list(index) == [chunks[1], chunks[2], chunks[0]]
+
+    @pytest.mark.parametrize(
+        "offset, expected",
+        [
+            pytest.param(0x0, False, id="before_chunks"),
+            pytest.param(0x2, True, id="start_of_chunk"),
+            pytest.param(0x4, True, id="inside_chunk"),
+            pytest.param(0x6, True, id="inside_touching_chunk"),
+            pytest.param(0x9, False, id="end_of_chunks"),
+            pytest.param(0x11, True, id="inside_overlapping_chunks"),
+            pytest.param(0x20, False, id="after_chunks"),
+        ],
+    )
+    def test_contains_offset(self, offset, expected):
+        index = ChunkIndex([Chunk(0x2, 0x5), Chunk(0x5, 0x9), Chunk(0x10, 0x15)])
+        index.add(Chunk(0xA, 0x12))
+        assert expected is index.contains_offset(offset)
+
+    @pytest.mark.parametrize(
+        "offset, expected",
+        [
+            pytest.param(0x0, 0x0, id="uncovered"),
+            pytest.param(0x3, 0x9, id="touching_chunks"),
+            pytest.param(0xB, 0x15, id="overlapping_chunks"),
+        ],
+    )
+    def test_next_uncovered_offset(self, offset, expected):
+        index = ChunkIndex([Chunk(0x2, 0x5), Chunk(0x5, 0x9), Chunk(0x10, 0x15)])
+        index.add(Chunk(0xA, 0x12))
+        assert index.next_uncovered_offset(offset) == expected
+
+    def test_uncovered_ranges(self):
+        index = ChunkIndex([Chunk(0x2, 0x5), Chunk(0x4, 0x9), Chunk(0x10, 0x15)])
+        assert list(index.uncovered_ranges(0x20)) == [
+            (0x0, 0x2),
+            (0x9, 0x10),
+            (0x15, 0x20),
+        ]
+
+    def test_outer_chunks(self):
+        outer = [Chunk(0x0, 0x10), Chunk(0x0, 0x8), Chunk(0x12, 0x20)]
+        inner = [Chunk(0x1, 0x10), Chunk(0x4, 0x6), Chunk(0x13, 0x14)]
+        index = ChunkIndex(inner + outer)
+        assert list(index.outer_chunks()) == outer
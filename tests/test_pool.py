@@ -1,8 +1,10 @@
+import collections
 import multiprocessing
+import os
 
 import pytest
 
-from unblob.pool import MultiPool, SinglePool
+from unblob.pool import MultiPool, SchedulingPolicy, SinglePool, get_rss
 
 
 def test_singlepool():
@@ -26,6 +28,25 @@ def test_singlepool():
     assert results == [5, 4, 3, 2, 1, 0]
 
 
+def test_singlepool_initializer():
+    calls = []
+
+    def _initializer():
+        calls.append("init")
+
+    def _handler(i):
+        calls.append(i)
+        return i
+
+    with SinglePool(
+        handler=_handler, result_callback=lambda *_: None, initializer=_initializer
+    ) as pool:
+        pool.submit(1)
+        pool.process_until_done()
+
+    assert calls == ["init", 1]
+
+
 @pytest.mark.parametrize("process_num", [-1, 0])
 def test_multipool_dummy_process_num(process_num: int):
     def _dummy(*args):
@@ -59,11 +80,126 @@ def test_multipool(process_num: int):
     assert list(results) == [5, 4, 3, 2, 1, 0]
 
 
+@pytest.mark.parametrize("process_num", [1, 2])
+def test_multipool_initializer(process_num: int):
+    initialized_pids = multiprocessing.Manager().list()
+    results = []
+
+    def _initializer():
+        initialized_pids.append(os.getpid())
+
+    def _handler(_):
+        return os.getpid() in initialized_pids
+
+    def _callback(pool, result):
+        results.append(result)
+        if len(results) < 4:
+            pool.submit(None)
+
+    with MultiPool(
+        process_num=process_num,
+        handler=_handler,
+        result_callback=_callback,
+        initializer=_initializer,
+    ) as pool:
+        pool.submit(None)
+        pool.process_until_done()
+
+    assert len(initialized_pids) == process_num
+    assert results == [True] * 4
+
+
+# memory kept by the handler of a worker
+_ALLOCATION_SIZE = 32 * 1024 * 1024
+
+
+@pytest.mark.parametrize(
+    "limits, max_task_count",
+    [
+        pytest.param(dict(max_tasks_per_worker=2), 2, id="max-tasks"),
+        # workers start with the memory of this process
+        pytest.param(
+            dict(max_worker_rss=get_rss() + 2 * _ALLOCATION_SIZE), 3, id="max-rss"
+        ),
+    ],
+)
+def test_multipool_replaces_retired_workers(limits, max_task_count: int):
+    initialized_pids = multiprocessing.Manager().list()
+    results = []
+    allocations = []
+
+    def _initializer():
+        initialized_pids.append(os.getpid())
+
+    def _handler(i):
+        allocations.append(bytearray(b"x") * _ALLOCATION_SIZE)
+        return i, os.getpid()
+
+    def _callback(pool, result):
+        results.append(result)
+        i, _pid = result
+        if i > 0:
+            pool.submit(i - 1)
+
+    with MultiPool(
+        process_num=2,
+        handler=_handler,
+        result_callback=_callback,
+        initializer=_initializer,
+        **limits,
+    ) as pool:
+        pool.submit(9)
+        pool.submit(9)
+        pool.process_until_done()
+
+    assert sorted(i for i, _pid in results) == sorted(list(range(10)) * 2)
+    task_counts = collections.Counter(pid for _i, pid in results)
+    assert max(task_counts.values()) <= max_task_count
+    # replacements are initialized too
+    assert set(task_counts) <= set(initialized_pids)
+
+
+@pytest.mark.parametrize(
+    "max_worker_rss",
+    [
+        pytest.param(1, id="exceeded-after-initialization"),
+        pytest.param(get_rss() + 2 * _ALLOCATION_SIZE, id="freed-memory"),
+    ],
+)
+def test_multipool_keeps_workers_within_max_rss(max_worker_rss: int):
+    results = []
+
+    def _handler(i):
+        # freed before the limit is checked
+        allocation = bytearray(b"x") * (3 * _ALLOCATION_SIZE)
+        del allocation
+        return i, os.getpid()
+
+    def _callback(pool, result):
+        results.append(result)
+        i, _pid = result
+        if i > 0:
+            pool.submit(i - 1)
+
+    with MultiPool(
+        process_num=2,
+        handler=_handler,
+        result_callback=_callback,
+        max_worker_rss=max_worker_rss,
+    ) as pool:
+        pool.submit(9)
+        pool.submit(9)
+        pool.process_until_done()
+
+    assert len(results) == 20
+    # the workers are not replaced after every task
+    assert len({pid for _i, pid in results}) <= 2
+
+
 def test_input_cannot_be_submitted_from_worker():
     pool: MultiPool
 
     def submit_task(_):
-        nonlocal pool
         try:
             pool.submit("this should fail")
         except Exception as exc:
@@ -77,3 +213,43 @@ def test_input_cannot_be_submitted_from_worker():
     with pool, pytest.raises(RuntimeError, match="can only be called"):
         pool.submit(1)
         pool.process_until_done()
+
+
+class LargestFirst(SchedulingPolicy):
+    def get_priority(self, args):
+        return -args
+
+
+@pytest.mark.parametrize(
+    "make_pool, expected_results",
+    [
+        pytest.param(
+            lambda **kwargs: SinglePool(**kwargs), [5, 3, 10, 2, 1], id="single"
+        ),
+        # the first task is started on submit, as the worker is free
+        pytest.param(
+            lambda **kwargs: MultiPool(process_num=1, **kwargs),
+            [3, 10, 5, 2, 1],
+            id="multi",
+        ),
+    ],
+)
+def test_pool_scheduling_policy(make_pool, expected_results):
+    results = []
+
+    def _handler(i):
+        return i
+
+    def _callback(pool, result):
+        results.append(result)
+        if result == 3:
+            pool.submit(10)
+
+    with make_pool(
+        handler=_handler, result_callback=_callback, scheduling_policy=LargestFirst()
+    ) as pool:
+        for i in [3, 1, 5, 2]:
+            pool.submit(i)
+        pool.process_until_done()
+
+    assert results == expected_results
@@ -1,18 +1,89 @@
+import gzip
+import time
+import unittest.mock as mock
 from pathlib import Path
 from typing import List
 
 import attr
 import pytest
 
-from unblob.models import UnknownChunk, ValidChunk
+import unblob.processing
+from unblob.extractors import DecompressorExtractor
+from unblob.handlers import BUILTIN_HANDLERS
+from unblob.handlers.archive.tar import TarHandler
+from unblob.handlers.compression.gzip import GZIPHandler
+from unblob.models import (
+    Extractor,
+    Handler,
+    Regex,
+    StreamingExtractor,
+    Task,
+    UnknownChunk,
+    ValidChunk,
+)
+from unblob.pool import FIFOPolicy
 from unblob.processing import (
+    BatchInput,
+    DepthFirstPolicy,
     ExtractionConfig,
+    FairScheduler,
+    LargestFirstPolicy,
+    Processor,
     calculate_buffer_size,
     calculate_entropy,
     calculate_unknown_chunks,
     draw_entropy_plot,
+    process_file,
+    process_files,
     remove_inner_chunks,
 )
+from unblob.report import (
+    CalculateChunkTimeoutReport,
+    ChunkReport,
+    DuplicateFileReport,
+    ExtractionBudgetExceededReport,
+    ExtractTimeoutReport,
+)
+
+
+class CopyExtractor(Extractor):
+    def extract(self, inpath: Path, outdir: Path):
+        outdir.mkdir(exist_ok=True)
+        (outdir / "content").write_bytes(inpath.read_bytes().lower())
+
+
+class StreamingCopyExtractor(StreamingExtractor, CopyExtractor):
+    def extract_from_file(self, file, chunk, filename: str, outdir: Path):
+        file.seek(chunk.start_offset)
+        (outdir / "content").write_bytes(file.read(chunk.size).lower())
+
+
+class CopyHandler(Handler):
+    NAME = "copy"
+    PATTERNS = [Regex("CHUNK")]
+    EXTRACTOR = CopyExtractor()
+
+    def calculate_chunk(self, file, start_offset: int):
+        return ValidChunk(start_offset=start_offset, end_offset=start_offset + 8)
+
+
+@pytest.fixture
+def input_file(tmp_path: Path) -> Path:
+    """Input with 3 chunks of CopyHandler, at 2-10, 12-20 and 22-30."""
+    path = tmp_path / "input"
+    path.write_bytes(b"__CHUNK123__CHUNK456__CHUNK789")
+    return path
+
+
+@pytest.fixture
+def copy_config(tmp_path: Path) -> ExtractionConfig:
+    """Config extracting with CopyHandler only, evolved by the tests as needed."""
+    return ExtractionConfig(
+        extract_root=tmp_path / "extract",
+        entropy_depth=0,
+        process_num=1,
+        handlers=(CopyHandler,),
+    )
 
 
 def assert_same_chunks(expected, actual, explanation=None):
@@ -101,6 +172,11 @@ def test_remove_inner_chunks(
             20,
             [UnknownChunk(0x5, 0x8), UnknownChunk(0xA, 0xF)],
         ),
+        (
+            [ValidChunk(0x0, 0x6), ValidChunk(0x5, 0xA)],
+            12,
+            [UnknownChunk(0xA, 0xC)],
+        ),
     ],
 )
 def test_calculate_unknown_chunks(
@@ -177,3 +253,412 @@ def test_ExtractionConfig_get_extract_dir_for(
 ):
     cfg = ExtractionConfig(extract_root=Path(extract_root), entropy_depth=0)
     assert cfg.get_extract_dir_for(Path(path)) == Path(result)
+
+
+@pytest.mark.parametrize(
+    "magic, expected",
+    [
+        pytest.param("ASCII text", (GZIPHandler,), id="routed"),
+        pytest.param("ASCII text, with CRLF", (GZIPHandler,), id="routed-prefix"),
+        pytest.param("POSIX tar archive", (TarHandler, GZIPHandler), id="first-route"),
+        pytest.param("data", BUILTIN_HANDLERS, id="not-routed"),
+    ],
+)
+def test_ExtractionConfig_get_handlers_for(magic: str, expected):
+    cfg = ExtractionConfig(
+        extract_root=Path("/extract"),
+        entropy_depth=0,
+        handler_routes={
+            "ASCII": [GZIPHandler],
+            "POSIX tar": [TarHandler, GZIPHandler],
+            "POSIX": [TarHandler],
+        },
+    )
+    assert cfg.get_handlers_for(magic) == expected
+
+
+def test_process_file_searches_chunks_with_routed_handlers(
+    input_file: Path, copy_config: ExtractionConfig
+):
+    input_file.write_text("plain text\n")
+    cfg = attr.evolve(copy_config, handler_routes={"ASCII text": [GZIPHandler]})
+
+    with mock.patch.object(
+        unblob.processing, "search_chunks", wraps=unblob.processing.search_chunks
+    ) as search_chunks_mock:
+        process_file(cfg, input_file)
+
+    assert search_chunks_mock.call_args.args[2] == (GZIPHandler,)
+
+
+@pytest.mark.parametrize("process_num", [1, 2])
+def test_process_file_extracts_chunks_in_separate_tasks(
+    input_file: Path, copy_config: ExtractionConfig, process_num: int
+):
+    cfg = attr.evolve(copy_config, process_num=process_num)
+
+    process_result = process_file(cfg, input_file)
+
+    file_result = next(r for r in process_result.results if r.task.path == input_file)
+    chunk_reports = [r for r in file_result.reports if isinstance(r, ChunkReport)]
+    assert [(r.start_offset, r.end_offset) for r in chunk_reports] == [
+        (2, 10),
+        (12, 20),
+        (22, 30),
+    ]
+    extract_dir = cfg.extract_root / "input_extract"
+    assert file_result.subtasks == [
+        Task(path=extract_dir / f"{start}-{end}.copy_extract", depth=1, chunk_id=r.id)
+        for (start, end), r in zip([(2, 10), (12, 20), (22, 30)], chunk_reports)
+    ]
+    assert (extract_dir / "12-20.copy_extract" / "content").read_bytes() == b"chunk456"
+    # chunk extractions are merged into the result of the file
+    assert len(process_result.results) == 1 + 3 + 3
+
+
+@pytest.mark.parametrize(
+    "keep_extracted_chunks, max_chunk_window_size, carved",
+    [
+        pytest.param(False, 1024, False, id="window"),
+        pytest.param(True, 1024, True, id="carved-when-kept"),
+        pytest.param(False, 4, True, id="carved-when-too-big"),
+    ],
+)
+def test_process_file_extracts_chunks_through_windows(
+    input_file: Path,
+    copy_config: ExtractionConfig,
+    keep_extracted_chunks: bool,
+    max_chunk_window_size: int,
+    carved: bool,
+):
+    cfg = attr.evolve(
+        copy_config,
+        keep_extracted_chunks=keep_extracted_chunks,
+        max_chunk_window_size=max_chunk_window_size,
+    )
+
+    with mock.patch.object(
+        unblob.processing,
+        "carve_valid_chunk",
+        wraps=unblob.processing.carve_valid_chunk,
+    ) as carve_mock:
+        process_file(cfg, input_file)
+
+    assert carve_mock.called == carved
+    content_path = cfg.extract_root / "input_extract" / "2-10.copy_extract" / "content"
+    assert content_path.read_bytes() == b"chunk123"
+
+
+def test_process_file_extracts_chunks_from_file_with_streaming_extractor(
+    input_file: Path, copy_config: ExtractionConfig
+):
+    class StreamingCopyHandler(CopyHandler):
+        EXTRACTOR = StreamingCopyExtractor()
+
+    cfg = attr.evolve(copy_config, handlers=(StreamingCopyHandler,))
+
+    with mock.patch.object(
+        unblob.processing, "carve_valid_chunk"
+    ) as carve_mock, mock.patch.object(
+        unblob.processing, "open_valid_chunk_window"
+    ) as window_mock:
+        process_file(cfg, input_file)
+
+    carve_mock.assert_not_called()
+    window_mock.assert_not_called()
+    content_path = cfg.extract_root / "input_extract" / "2-10.copy_extract" / "content"
+    assert content_path.read_bytes() == b"chunk123"
+
+
+def test_process_file_extracts_whole_file_chunk(
+    input_file: Path, copy_config: ExtractionConfig
+):
+    input_file.write_bytes(b"CHUNK123")
+
+    process_result = process_file(copy_config, input_file)
+
+    assert process_result.errors == []
+    content_path = copy_config.extract_root / "input_extract" / "content"
+    assert content_path.read_bytes() == b"chunk123"
+
+
+class HeadCopyExtractor(Extractor):
+    def extract(self, inpath: Path, outdir: Path):
+        (outdir / "content").write_bytes(inpath.read_bytes()[:2])
+
+
+@pytest.mark.parametrize(
+    "external_decompressors, expected_content",
+    [
+        pytest.param(False, b"chunk123", id="in-process"),
+        pytest.param(True, b"\x1f\x8b", id="external"),
+    ],
+)
+def test_process_file_with_external_decompressors(
+    input_file: Path,
+    copy_config: ExtractionConfig,
+    external_decompressors: bool,
+    expected_content: bytes,
+):
+    compressed = gzip.compress(b"chunk123")
+
+    class GzipCopyHandler(CopyHandler):
+        PATTERNS = [Regex(r"\x1f\x8b")]
+        EXTRACTOR = DecompressorExtractor(gzip.open, fallback=HeadCopyExtractor())
+
+        def calculate_chunk(self, file, start_offset: int):
+            end_offset = start_offset + len(compressed)
+            return ValidChunk(start_offset=start_offset, end_offset=end_offset)
+
+    input_file.write_bytes(b"__" + compressed)
+    cfg = attr.evolve(
+        copy_config,
+        handlers=(GzipCopyHandler,),
+        external_decompressors=external_decompressors,
+    )
+
+    process_file(cfg, input_file)
+
+    extract_dir = (
+        cfg.extract_root / "input_extract" / f"2-{2 + len(compressed)}.copy_extract"
+    )
+    assert [p.read_bytes() for p in extract_dir.iterdir()] == [expected_content]
+
+
+@pytest.mark.parametrize("process_num", [1, 2])
+def test_process_file_skips_duplicates(
+    input_file: Path, copy_config: ExtractionConfig, process_num: int
+):
+    input_file.write_bytes(b"__CHUNK123__CHUNK123__CHUNK456")
+    cfg = attr.evolve(copy_config, process_num=process_num, skip_duplicates=True)
+
+    process_result = process_file(cfg, input_file)
+
+    duplicate_reports = {
+        result.task.path: report
+        for result in process_result.results
+        for report in result.reports
+        if isinstance(report, DuplicateFileReport)
+    }
+    extract_dir = cfg.extract_root / "input_extract"
+    first, second = (
+        extract_dir / "2-10.copy_extract" / "content",
+        extract_dir / "12-20.copy_extract" / "content",
+    )
+    # the first occurrence is whichever registered first
+    assert duplicate_reports in (
+        {first: DuplicateFileReport(original_path=second)},
+        {second: DuplicateFileReport(original_path=first)},
+    )
+
+
+@pytest.mark.parametrize("process_num", [1, 2])
+def test_process_files(tmp_path: Path, copy_config: ExtractionConfig, process_num: int):
+    inputs = []
+    for name, content in [("a", b"__CHUNK123"), ("b", b"CHUNK456__CHUNK789")]:
+        input_file = tmp_path / name
+        input_file.write_bytes(content)
+        inputs.append(
+            BatchInput(
+                input_file, tmp_path / "extract" / name, tmp_path / f"{name}.json"
+            )
+        )
+    cfg = attr.evolve(
+        copy_config, extract_root=tmp_path / "unused", process_num=process_num
+    )
+
+    results = process_files(cfg, inputs)
+
+    assert [len(result.results) for result in results] == [1 + 1 + 1, 1 + 2 + 2]
+    for batch_input, result in zip(inputs, results):
+        assert result.results[0].task.path == batch_input.path
+        assert batch_input.report_file.read_text() == result.to_json()
+    a_extract_dir = tmp_path / "extract" / "a" / "a_extract"
+    assert (a_extract_dir / "2-10.copy_extract" / "content").read_bytes() == b"chunk123"
+    b_extract_dir = tmp_path / "extract" / "b" / "b_extract"
+    assert (
+        b_extract_dir / "10-18.copy_extract" / "content"
+    ).read_bytes() == b"chunk789"
+    assert not (tmp_path / "unused").exists()
+
+
+def test_process_files_reports_existing_extract_dir(
+    tmp_path: Path, input_file: Path, copy_config: ExtractionConfig
+):
+    (tmp_path / "extract" / "input_extract").mkdir(parents=True)
+    cfg = attr.evolve(copy_config, extract_root=tmp_path)
+
+    [result] = process_files(cfg, [BatchInput(input_file, tmp_path / "extract")])
+
+    assert [r.task.path for r in result.results] == [input_file]
+    assert result.errors
+
+
+def test_FairScheduler_submits_inputs_in_turns():
+    submitted = []
+    pool = mock.Mock()
+    pool.submit.side_effect = submitted.append
+    scheduler = FairScheduler(3, FIFOPolicy())
+    for key, args in [(0, "a1"), (0, "a2"), (0, "a3"), (1, "b1"), (2, "c1")]:
+        scheduler.add(key, args)
+
+    scheduler.submit_tasks(pool)
+    assert submitted == ["a1", "b1", "c1"]
+
+    scheduler.add(1, "b2")
+    scheduler.task_done()
+    scheduler.submit_tasks(pool)
+    assert submitted == ["a1", "b1", "c1", "a2"]
+
+    scheduler.task_done()
+    scheduler.task_done()
+    scheduler.submit_tasks(pool)
+    assert submitted == ["a1", "b1", "c1", "a2", "b2", "a3"]
+
+
+def test_Processor_sets_size_hint_of_directory_entries(tmp_path: Path):
+    (tmp_path / "small").write_bytes(b"1")
+    (tmp_path / "big").write_bytes(b"1234")
+    cfg = ExtractionConfig(extract_root=tmp_path, entropy_depth=0, process_num=1)
+
+    result = Processor(cfg).process_task(Task(path=tmp_path, depth=0, chunk_id=""))
+
+    sizes = {task.path.name: task.size_hint for task in result.subtasks}
+    assert sizes == {"small": 1, "big": 4}
+
+
+@pytest.mark.parametrize(
+    "policy, expected_order",
+    [
+        pytest.param(LargestFirstPolicy(), ["deep-big", "big", "deep", "small"]),
+        pytest.param(DepthFirstPolicy(), ["deep", "deep-big", "small", "big"]),
+    ],
+)
+def test_scheduling_policies(policy, expected_order: List[str]):
+    tasks = [
+        Task(path=Path("small"), depth=0, chunk_id="", size_hint=1),
+        Task(path=Path("big"), depth=0, chunk_id="", size_hint=10),
+        Task(path=Path("deep"), depth=2, chunk_id="", size_hint=2),
+        Task(path=Path("deep-big"), depth=2, chunk_id="", size_hint=20),
+    ]
+    # tasks of inputs processed together are submitted with their input
+    args = [tasks[0], ("input", None, tasks[1]), tasks[2], tasks[3]]
+
+    ordered = sorted(range(len(tasks)), key=lambda i: (policy.get_priority(args[i]), i))
+
+    assert [tasks[i].path.name for i in ordered] == expected_order
+
+
+@pytest.mark.parametrize("process_num", [1, 2])
+@pytest.mark.parametrize(
+    "limits",
+    [
+        pytest.param(dict(max_extracted_files=2), id="files"),
+        pytest.param(dict(max_extracted_size=20), id="size"),
+    ],
+)
+def test_process_file_stops_extraction_over_budget(
+    input_file: Path, copy_config: ExtractionConfig, process_num: int, limits: dict
+):
+    cfg = attr.evolve(copy_config, process_num=process_num, **limits)
+
+    process_result = process_file(cfg, input_file)
+
+    exceeded_reports = [
+        report
+        for report in process_result.errors
+        if isinstance(report, ExtractionBudgetExceededReport)
+    ]
+    assert len(exceeded_reports) == 1
+    # the output of the chunk over the budget is removed
+    assert not exceeded_reports[0].path.exists()
+    extract_dir = cfg.extract_root / "input_extract"
+    assert len(list(extract_dir.glob("*/content"))) == 2
+
+
+class SleepingCopyExtractor(CopyExtractor):
+    def extract(self, inpath: Path, outdir: Path):
+        time.sleep(60)
+
+
+class SleepingCopyHandler(CopyHandler):
+    NAME = "sleeping-copy"
+    PATTERNS = [Regex("SLEEP")]
+    EXTRACTOR = SleepingCopyExtractor()
+
+
+@pytest.mark.parametrize("process_num", [1, 2])
+@pytest.mark.parametrize(
+    "timeouts",
+    [
+        pytest.param(dict(extract_timeout=0.2), id="extract-timeout"),
+        pytest.param(
+            dict(extract_timeout=60, handler_timeouts={"sleeping-copy": 0.2}),
+            id="handler-timeout",
+        ),
+    ],
+)
+def test_process_file_stops_extraction_over_timeout(
+    input_file: Path, copy_config: ExtractionConfig, process_num: int, timeouts: dict
+):
+    input_file.write_bytes(b"__CHUNK123__SLEEP456")
+    cfg = attr.evolve(
+        copy_config,
+        process_num=process_num,
+        handlers=(CopyHandler, SleepingCopyHandler),
+        **timeouts,
+    )
+
+    process_result = process_file(cfg, input_file)
+
+    timeout_reports = [
+        report
+        for report in process_result.errors
+        if isinstance(report, ExtractTimeoutReport)
+    ]
+    assert timeout_reports == [
+        ExtractTimeoutReport(handler="sleeping-copy", timeout=0.2)
+    ]
+    extract_dir = cfg.extract_root / "input_extract"
+    assert (extract_dir / "2-10.copy_extract" / "content").read_bytes() == b"chunk123"
+    # problematic chunks are kept for further analysis
+    assert (extract_dir / "12-20.sleeping-copy").read_bytes() == b"SLEEP456"
+
+
+def test_process_file_stops_chunk_calculation_over_timeout(
+    input_file: Path, copy_config: ExtractionConfig
+):
+    class SleepingHandler(CopyHandler):
+        def calculate_chunk(self, file, start_offset: int):
+            if start_offset == 12:
+                time.sleep(60)
+            return super().calculate_chunk(file, start_offset)
+
+    cfg = attr.evolve(
+        copy_config, handlers=(SleepingHandler,), calculate_chunk_timeout=0.2
+    )
+
+    process_result = process_file(cfg, input_file)
+
+    assert [
+        report
+        for report in process_result.errors
+        if isinstance(report, CalculateChunkTimeoutReport)
+    ] == [CalculateChunkTimeoutReport(handler="copy", start_offset=12, timeout=0.2)]
+
+
+def test_process_file_with_worker_recycling(
+    input_file: Path, copy_config: ExtractionConfig
+):
+    cfg = attr.evolve(copy_config, process_num=2, max_tasks_per_worker=1)
+
+    process_result = process_file(cfg, input_file)
+
+    assert process_result.errors == []
+    assert len(process_result.results) == 1 + 3 + 3
+    extract_dir = cfg.extract_root / "input_extract"
+    assert sorted(p.read_bytes() for p in extract_dir.glob("*/content")) == [
+        b"chunk123",
+        b"chunk456",
+        b"chunk789",
+    ]
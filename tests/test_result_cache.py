@@ -0,0 +1,75 @@
+import pickle
+from pathlib import Path
+from unittest import mock
+
+from unblob.processing import ExtractionConfig, process_file
+from unblob.result_cache import DATABASE_NAME, ResultCache, get_result_key
+
+
+def test_get_put(tmp_path: Path):
+    cache = ResultCache(tmp_path, max_size=1024)
+
+    assert cache.get("key") is None
+    cache.put("key", [(0, 10, "gzip", False), (10, 20, "zip", True)])
+
+    assert cache.get("key") == [(0, 10, "gzip", False), (10, 20, "zip", True)]
+    assert ResultCache(tmp_path, max_size=1024).get("key") == cache.get("key")
+
+
+def test_least_recently_used_results_are_evicted(tmp_path: Path):
+    # every entry is 2 bytes: "[]"
+    cache = ResultCache(tmp_path, max_size=4)
+    with mock.patch("time.time", side_effect=range(100)):
+        cache.put("first", [])
+        cache.put("second", [])
+        cache.get("first")
+        cache.put("third", [])
+
+    assert cache.get("first") == []
+    assert cache.get("second") is None
+    assert cache.get("third") == []
+
+
+def test_unusable_database_is_ignored(tmp_path: Path):
+    (tmp_path / DATABASE_NAME).write_bytes(b"not a database" * 100)
+    cache = ResultCache(tmp_path, max_size=1024)
+
+    cache.put("key", [])
+
+    assert cache.get("key") is None
+
+
+def test_result_cache_is_picklable(tmp_path: Path):
+    cache = ResultCache(tmp_path, max_size=1024)
+    cache.put("key", [])
+
+    assert pickle.loads(pickle.dumps(cache)).get("key") == []
+
+
+def test_get_result_key():
+    key = get_result_key("digest", "fingerprint")
+
+    assert key == get_result_key("digest", "fingerprint")
+    assert key != get_result_key("digest", "other-fingerprint")
+    assert key != get_result_key("other-digest", "fingerprint")
+
+
+def test_process_file_uses_cached_chunks(tmp_path: Path):
+    input_file = tmp_path / "input"
+    input_file.write_bytes(b"\x00" * 64)
+
+    def process(extract_root: Path):
+        config = ExtractionConfig(
+            extract_root=extract_root,
+            entropy_depth=0,
+            process_num=1,
+            cache_dir=tmp_path / "cache",
+        )
+        with mock.patch(
+            "unblob.processing.search_chunks", return_value=[]
+        ) as search_chunks_mock:
+            process_file(config, input_file)
+        return search_chunks_mock.called
+
+    assert process(tmp_path / "first")
+    assert not process(tmp_path / "second")
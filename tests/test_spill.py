@@ -0,0 +1,184 @@
+import gzip
+import zlib
+from pathlib import Path
+from typing import List
+from unittest import mock
+
+import pytest
+
+from unblob.extractors.decompressor import DecompressorExtractor
+from unblob.file_utils import File
+from unblob.finder import search_chunks
+from unblob.handlers.compression.zlib import ZlibHandler
+from unblob.models import Handler, Regex, ValidChunk
+from unblob.processing import ExtractionConfig, process_file
+from unblob.spill import (
+    SpillCache,
+    SpillWriter,
+    configure_spill_cache,
+    spill_decompressed,
+)
+
+
+class SpillingHandler(Handler):
+    NAME = "spilling"
+    PATTERNS = [Regex("S")]
+    # chunks of this size are found by the handler
+    CHUNK_SIZE = 4
+
+    def calculate_chunk(self, file, start_offset: int):
+        chunk = ValidChunk(start_offset, start_offset + self.CHUNK_SIZE)
+        with spill_decompressed() as spill:
+            spill.write(b"1")
+            spill.keep(chunk)
+        return chunk
+
+
+class OverflowingHandler(SpillingHandler):
+    NAME = "overflowing"
+    CHUNK_SIZE = 100
+
+
+@pytest.fixture
+def spill_cache(tmp_path: Path):
+    directory = tmp_path / "spill"
+    directory.mkdir()
+    cache = SpillCache(directory, max_size=10)
+    configure_spill_cache(cache)
+    yield cache
+    configure_spill_cache(None)
+
+
+def test_spill_writer_keep(spill_cache: SpillCache):
+    chunk = ValidChunk(0, 1)
+
+    with SpillWriter(spill_cache) as spill:
+        spill.write(b"12345")
+        spill.write(b"678")
+        spill.keep(chunk)
+
+    assert chunk.spill_path == spill_cache.get_path(chunk.id)
+    assert chunk.spill_path.read_bytes() == b"12345678"
+    assert list(spill_cache.directory.iterdir()) == [chunk.spill_path]
+
+
+def test_spill_writer_drops_content_not_kept(spill_cache: SpillCache):
+    with SpillWriter(spill_cache) as spill:
+        spill.write(b"12345")
+
+    assert list(spill_cache.directory.iterdir()) == []
+
+
+def test_spill_writer_drops_content_over_cache_size(spill_cache: SpillCache):
+    (spill_cache.directory / "other-chunk").write_bytes(b"12345")
+    chunk = ValidChunk(0, 1)
+
+    with SpillWriter(spill_cache) as spill:
+        spill.write(b"12345")
+        spill.write(b"6")
+        spill.keep(chunk)
+
+    assert chunk.spill_path is None
+    assert [p.name for p in spill_cache.directory.iterdir()] == ["other-chunk"]
+
+
+def test_spill_writer_without_cache():
+    chunk = ValidChunk(0, 1)
+
+    with SpillWriter(None) as spill:
+        spill.write(b"12345")
+        spill.keep(chunk)
+
+    assert chunk.spill_path is None
+
+
+def test_spill_cache_evict(spill_cache: SpillCache):
+    chunk = ValidChunk(0, 1)
+    with spill_decompressed() as spill:
+        spill.write(b"12345")
+        spill.keep(chunk)
+
+    spill_cache.evict(chunk.id)
+    spill_cache.evict(chunk.id)
+
+    assert list(spill_cache.directory.iterdir()) == []
+
+
+def test_handler_spills_decompressed_content(spill_cache: SpillCache):
+    content = zlib.compress(b"content")
+    file = File.from_bytes(content)
+
+    chunk = ZlibHandler().calculate_chunk(file, 0)
+
+    assert chunk is not None
+    assert chunk.spill_path is not None
+    assert chunk.spill_path.read_bytes() == b"content"
+
+
+@pytest.mark.parametrize(
+    "spill_cache_size, decompressed", [(1024, False), (0, True), (4, True)]
+)
+def test_process_file_reuses_spilled_content(
+    tmp_path: Path, spill_cache_size: int, decompressed: bool
+):
+    content = gzip.compress(b"content", mtime=0)
+    input_file = tmp_path / "input"
+    input_file.write_bytes(b"prefix" + content)
+    extract_root = tmp_path / "extract"
+    config = ExtractionConfig(
+        extract_root=extract_root,
+        entropy_depth=0,
+        process_num=1,
+        spill_cache_size=spill_cache_size,
+    )
+
+    with mock.patch.object(
+        DecompressorExtractor,
+        "_decompress",
+        autospec=True,
+        side_effect=DecompressorExtractor._decompress,
+    ) as decompress_mock:
+        process_file(config, input_file)
+
+    assert decompress_mock.called == decompressed
+    chunk_dir = extract_root / "input_extract" / f"6-{6 + len(content)}.gzip_extract"
+    assert [p.read_bytes() for p in chunk_dir.iterdir()] == [b"content"]
+
+
+def _search(
+    tmp_path: Path, content: bytes, handler, task_result, process_num: int
+) -> List[ValidChunk]:
+    path = tmp_path / "input"
+    path.write_bytes(content)
+    with File.from_path(path) as file:
+        return list(
+            search_chunks(
+                file,
+                len(content),
+                (handler,),
+                task_result,
+                calculate_chunk_process_num=process_num,
+            )
+        )
+
+
+@pytest.mark.parametrize("process_num", [1, 2])
+def test_search_chunks_evicts_spill_of_rejected_chunk(
+    spill_cache: SpillCache, tmp_path: Path, task_result, process_num: int
+):
+    chunks = _search(tmp_path, b"0S00", OverflowingHandler, task_result, process_num)
+
+    assert chunks == []
+    assert list(spill_cache.directory.iterdir()) == []
+
+
+@pytest.mark.parametrize("process_num", [1, 2])
+def test_search_chunks_evicts_spills_of_skipped_candidates(
+    spill_cache: SpillCache, tmp_path: Path, task_result, process_num: int
+):
+    chunks = _search(tmp_path, b"SSSSSSSS", SpillingHandler, task_result, process_num)
+
+    assert [chunk.start_offset for chunk in chunks] == [0, 4]
+    assert sorted(p.name for p in spill_cache.directory.iterdir()) == sorted(
+        chunk.id for chunk in chunks
+    )
@@ -0,0 +1,179 @@
+"""Budget of the size and number of extracted files.
+
+Decompression bombs and huge images can fill the disk before their extraction
+ends.  The files extracted under an extract root are charged to its budget, which
+is shared by the worker processes in a directory of counter files.  Extraction of a
+chunk is checked against what is left of the budget while it runs, and it is
+stopped when it exceeds it.
+"""
+import fcntl
+import hashlib
+import os
+import stat
+import struct
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+import attr
+from structlog import get_logger
+
+from .models import ExtractError
+from .report import ExtractionBudgetExceededReport
+
+logger = get_logger()
+
+# how often the output of a running extraction is measured, in seconds
+CHECK_INTERVAL = 0.5
+
+# size, number of files
+Usage = Tuple[int, int]
+
+_COUNTER = struct.Struct("<QQ")
+
+
+class ExtractionBudgetExceeded(ExtractError):
+    pass
+
+
+@attr.define(frozen=True)
+class ExtractionBudget:
+    directory: Path
+    # limits of the extracted files under an extract root, 0 means unlimited
+    max_size: int = 0
+    max_files: int = 0
+
+    def is_exceeded(self, usage: Usage) -> bool:
+        size, file_count = usage
+        return bool(
+            (self.max_size and size > self.max_size)
+            or (self.max_files and file_count > self.max_files)
+        )
+
+    def get_usage(self, extract_root: Path) -> Usage:
+        with self._open_counter(extract_root) as counter:
+            return self._read(counter)
+
+    def charge(self, extract_root: Path, usage: Usage) -> bool:
+        """Add usage to the budget of extract_root, unless it would exceed it."""
+        with self._open_counter(extract_root) as counter:
+            used_size, used_files = self._read(counter)
+            total = (used_size + usage[0], used_files + usage[1])
+            if self.is_exceeded(total):
+                return False
+            counter.seek(0)
+            counter.write(_COUNTER.pack(*total))
+            return True
+
+    def _get_counter_path(self, extract_root: Path) -> Path:
+        return self.directory / hashlib.sha256(os.fsencode(extract_root)).hexdigest()
+
+    @contextmanager
+    def _open_counter(self, extract_root: Path) -> Iterator[BinaryIO]:
+        fd = os.open(self._get_counter_path(extract_root), os.O_RDWR | os.O_CREAT)
+        with os.fdopen(fd, "r+b") as counter:
+            # released on close
+            fcntl.flock(counter, fcntl.LOCK_EX)
+            yield counter
+
+    @staticmethod
+    def _read(counter: BinaryIO) -> Usage:
+        data = counter.read(_COUNTER.size)
+        if not data:
+            return 0, 0
+        return _COUNTER.unpack(data)
+
+
+def measure(path: Path) -> Usage:
+    """Size and number of the files under path, not including itself."""
+    size = file_count = 0
+    for root, dirs, files in os.walk(path):
+        for name in dirs + files:
+            try:
+                st = os.lstat(os.path.join(root, name))
+            except FileNotFoundError:
+                continue
+            file_count += 1
+            if stat.S_ISREG(st.st_mode):
+                size += st.st_size
+    return size, file_count
+
+
+class ExtractionGuard:
+    """Checks the output of a chunk extraction into outdir against the budget."""
+
+    def __init__(self, budget: ExtractionBudget, extract_root: Path, outdir: Path):
+        self._budget = budget
+        self._extract_root = extract_root
+        self._outdir = outdir
+        self._used: Optional[Usage] = None
+        self._last_check = time.monotonic()
+        self._size = 0
+        self._file_count = 0
+
+    def check(self):
+        """Measure the output so far, at most once in CHECK_INTERVAL."""
+        now = time.monotonic()
+        if now - self._last_check < CHECK_INTERVAL:
+            return
+        self._last_check = now
+        self._check(measure(self._outdir))
+
+    def count(self, path: Path):
+        """Count path of the finished output, checking the total so far."""
+        st = path.lstat()
+        self._file_count += 1
+        if stat.S_ISREG(st.st_mode):
+            self._size += st.st_size
+        self._check((self._size, self._file_count))
+
+    def commit(self):
+        """Charge the counted output to the budget."""
+        usage = (self._size, self._file_count)
+        if not self._budget.charge(self._extract_root, usage):
+            self._raise_exceeded(usage)
+
+    def _check(self, usage: Usage):
+        if self._used is None:
+            # files extracted by other workers meanwhile are only seen on commit
+            self._used = self._budget.get_usage(self._extract_root)
+        total = (self._used[0] + usage[0], self._used[1] + usage[1])
+        if self._budget.is_exceeded(total):
+            self._raise_exceeded(usage)
+
+    def _raise_exceeded(self, usage: Usage):
+        report = ExtractionBudgetExceededReport(
+            path=self._outdir,
+            size=usage[0],
+            file_count=usage[1],
+            max_size=self._budget.max_size,
+            max_files=self._budget.max_files,
+        )
+        logger.error("Extraction budget exceeded", **report.asdict())
+        raise ExtractionBudgetExceeded(report)
+
+
+_guard: Optional[ExtractionGuard] = None
+
+
+@contextmanager
+def guard_extraction(guard: Optional[ExtractionGuard]) -> Iterator[None]:
+    """Set the guard of the extraction running in the current process."""
+    global _guard
+    _guard = guard
+    try:
+        yield
+    finally:
+        _guard = None
+
+
+def get_check_interval() -> Optional[float]:
+    """How often extractors should check the running extraction, None if not needed."""
+    return None if _guard is None else CHECK_INTERVAL
+
+
+def check_extraction():
+    """Raise ExtractionBudgetExceeded, if the running extraction exceeds the budget."""
+    if _guard is not None:
+        _guard.check()
@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 import sys
+from collections import Counter
 from pathlib import Path
-from typing import Iterable, Optional
+from typing import Dict, Iterable, List, Optional, TextIO, Tuple
 
 import click
 from structlog import get_logger
@@ -11,15 +12,20 @@ from unblob.plugins import UnblobPluginManager
 from unblob.report import Severity
 
 from .cli_options import verbosity_option
+from .daemon import serve_jobs
 from .dependencies import get_dependencies, pretty_format_dependencies
 from .handlers import BUILTIN_HANDLERS, Handlers
+from .limits import ResourceLimits
 from .logging import configure_logger
 from .processing import (
     DEFAULT_DEPTH,
     DEFAULT_PROCESS_NUM,
     DEFAULT_SKIP_MAGIC,
+    SCHEDULING_POLICIES,
+    BatchInput,
     ExtractionConfig,
     process_file,
+    process_files,
 )
 
 logger = get_logger()
@@ -47,6 +53,22 @@ def show_external_dependencies(
     ctx.exit(code=exit_code)
 
 
+def parse_handler_timeouts(
+    _ctx: click.Context, _param: click.Option, values: Tuple[str, ...]
+) -> Dict[str, float]:
+    timeouts = {}
+    for value in values:
+        name, _, seconds = value.partition("=")
+        try:
+            timeout = float(seconds)
+        except ValueError:
+            timeout = -1
+        if not name or timeout < 0:
+            raise click.BadParameter(f"{value!r} is not in the NAME=SECONDS format")
+        timeouts[name] = timeout
+    return timeouts
+
+
 def get_help_text():
     dependencies = get_dependencies(BUILTIN_HANDLERS)
     lines = [
@@ -66,7 +88,7 @@ class UnblobContext(click.Context):
         *args,
         handlers: Optional[Handlers] = None,
         plugin_manager: Optional[UnblobPluginManager] = None,
-        **kwargs
+        **kwargs,
     ):
         super().__init__(*args, **kwargs)
         handlers = handlers or BUILTIN_HANDLERS
@@ -80,9 +102,16 @@ class UnblobContext(click.Context):
     help=get_help_text(), context_settings=dict(help_option_names=["--help", "-h"])
 )
 @click.argument(
-    "file",
+    "files",
+    metavar="FILE",
+    nargs=-1,
     type=click.Path(path_type=Path, dir_okay=False, exists=True, resolve_path=True),
-    required=True,
+)
+@click.option(
+    "--files-from",
+    "files_from",
+    type=click.File("r"),
+    help="Also process the files listed in this file, one path per line ('-' for stdin).",
 )
 @click.option(
     "-e",
@@ -149,7 +178,10 @@ class UnblobContext(click.Context):
     "--report",
     "report_file",
     type=click.Path(path_type=Path),
-    help="File to store metadata generated during the extraction process (in JSON format).",
+    help=(
+        "File to store metadata generated during the extraction process (in JSON format). "
+        "With more than one input file, the directory to store a report for each of them."
+    ),
 )
 @click.option(
     "-k",
@@ -159,6 +191,123 @@ class UnblobContext(click.Context):
     show_default=True,
     help="Keep extracted chunks",
 )
+@click.option(
+    "--cache-dir",
+    "cache_dir",
+    type=click.Path(path_type=Path, dir_okay=True, file_okay=False, resolve_path=True),
+    default=None,
+    help="Cache compiled pattern databases and the chunks found in files in this directory to speed up later runs.",
+)
+@click.option(
+    "--skip-duplicates",
+    "skip_duplicates",
+    is_flag=True,
+    show_default=True,
+    help="Do not process files with the same content as an already processed file.",
+)
+@click.option(
+    "--external-decompressors",
+    "external_decompressors",
+    is_flag=True,
+    show_default=True,
+    help="Decompress gzip, bzip2, xz, lzma, lzip and zstd streams with external commands instead of in process.",
+)
+@click.option(
+    "--scheduling",
+    "scheduling",
+    type=click.Choice(list(SCHEDULING_POLICIES)),
+    default="fifo",
+    show_default=True,
+    help="Order of processing the files and chunks waiting for a worker process.",
+)
+@click.option(
+    "--cleanup",
+    "cleanup_extracted",
+    is_flag=True,
+    show_default=True,
+    help=(
+        "Delete extracted files as soon as they are processed, except for the ones matching --keep. "
+        "Files are processed depth-first, unless --scheduling is given."
+    ),
+)
+@click.option(
+    "--keep",
+    "keep_patterns",
+    type=click.STRING,
+    multiple=True,
+    help="Keep extracted files with a path matching this glob pattern, relative to the extract directory, with --cleanup.",
+)
+@click.option(
+    "--max-extracted-size",
+    type=click.IntRange(0),
+    default=0,
+    show_default=True,
+    help="Stop extracting chunks, when the extracted files would exceed this total size in bytes (0 means unlimited).",
+)
+@click.option(
+    "--max-extracted-files",
+    type=click.IntRange(0),
+    default=0,
+    show_default=True,
+    help="Stop extracting chunks, when more files would be extracted in total (0 means unlimited).",
+)
+@click.option(
+    "--extract-timeout",
+    type=click.FloatRange(0),
+    default=0,
+    show_default=True,
+    help="Stop extracting a chunk after this many seconds (0 means unlimited).",
+)
+@click.option(
+    "--handler-timeout",
+    "handler_timeouts",
+    metavar="NAME=SECONDS",
+    multiple=True,
+    callback=parse_handler_timeouts,
+    help="Extract timeout of the handler with NAME, overriding --extract-timeout.",
+)
+@click.option(
+    "--calculate-chunk-timeout",
+    type=click.FloatRange(0),
+    default=0,
+    show_default=True,
+    help="Stop calculating a chunk for a pattern match after this many seconds (0 means unlimited).",
+)
+@click.option(
+    "--extractor-memory-limit",
+    type=click.IntRange(0),
+    default=0,
+    show_default=True,
+    help="Limit the address space of extract commands to this many bytes (0 means unlimited).",
+)
+@click.option(
+    "--extractor-cpu-limit",
+    type=click.IntRange(0),
+    default=0,
+    show_default=True,
+    help="Limit the CPU time of extract commands to this many seconds (0 means unlimited).",
+)
+@click.option(
+    "--max-tasks-per-worker",
+    type=click.IntRange(0),
+    default=0,
+    show_default=True,
+    help="Replace worker processes after processing this many tasks (0 means unlimited).",
+)
+@click.option(
+    "--max-worker-rss",
+    type=click.IntRange(0),
+    default=0,
+    show_default=True,
+    help="Replace worker processes with a resident set size over this many bytes after a task (0 means unlimited).",
+)
+@click.option(
+    "--serve",
+    "socket_path",
+    type=click.Path(path_type=Path, dir_okay=False, resolve_path=True),
+    default=None,
+    help="Keep running and process the jobs requested on this Unix socket, instead of FILE.",
+)
 @verbosity_option
 @click.option(
     "--show-external-dependencies",
@@ -167,8 +316,11 @@ class UnblobContext(click.Context):
     callback=show_external_dependencies,
     expose_value=False,
 )
+@click.pass_context
 def cli(
-    file: Path,
+    ctx: click.Context,
+    files: Tuple[Path, ...],
+    files_from: Optional[TextIO],
     extract_root: Path,
     report_file: Optional[Path],
     force: bool,
@@ -177,6 +329,22 @@ def cli(
     entropy_depth: int,
     skip_magic: Iterable[str],
     keep_extracted_chunks: bool,
+    cache_dir: Optional[Path],
+    skip_duplicates: bool,
+    external_decompressors: bool,
+    scheduling: str,
+    cleanup_extracted: bool,
+    keep_patterns: Iterable[str],
+    max_extracted_size: int,
+    max_extracted_files: int,
+    extract_timeout: float,
+    handler_timeouts: Dict[str, float],
+    calculate_chunk_timeout: float,
+    extractor_memory_limit: int,
+    extractor_cpu_limit: int,
+    max_tasks_per_worker: int,
+    max_worker_rss: int,
+    socket_path: Optional[Path],
     handlers: Handlers,
     plugins_path: Optional[Path],
     plugin_manager: UnblobPluginManager,
@@ -184,6 +352,11 @@ def cli(
 ) -> ProcessResult:
     configure_logger(verbose, extract_root)
 
+    scheduling_source = ctx.get_parameter_source("scheduling")
+    if cleanup_extracted and scheduling_source == click.core.ParameterSource.DEFAULT:
+        # extraction directories are deleted sooner, when their subtree is finished first
+        scheduling = "depth-first"
+
     plugin_manager.import_plugins(plugins_path)
     extra_handlers = plugin_manager.load_handlers_from_plugins()
     handlers += tuple(extra_handlers)
@@ -198,17 +371,90 @@ def cli(
         process_num=process_num,
         handlers=handlers,
         keep_extracted_chunks=keep_extracted_chunks,
+        cache_dir=cache_dir,
+        skip_duplicates=skip_duplicates,
+        external_decompressors=external_decompressors,
+        scheduling_policy=SCHEDULING_POLICIES[scheduling](),
+        cleanup_extracted=cleanup_extracted,
+        keep_patterns=keep_patterns,
+        max_extracted_size=max_extracted_size,
+        max_extracted_files=max_extracted_files,
+        extract_timeout=extract_timeout,
+        handler_timeouts=handler_timeouts,
+        calculate_chunk_timeout=calculate_chunk_timeout,
+        extractor_limits=ResourceLimits(
+            memory=extractor_memory_limit, cpu=extractor_cpu_limit
+        ),
+        max_tasks_per_worker=max_tasks_per_worker,
+        max_worker_rss=max_worker_rss,
     )
 
-    logger.info("Start processing file", file=file)
-    results = process_file(config, file, report_file)
+    if socket_path is not None:
+        if files or files_from:
+            raise click.UsageError("FILE can not be given with --serve")
+        serve_jobs(config, socket_path)
+        return ProcessResult()
+
+    paths = list(files)
+    if files_from is not None:
+        paths.extend(read_file_list(files_from))
+    if not paths:
+        raise click.MissingParameter(ctx=ctx, param=get_files_param(ctx))
 
-    return results
+    if len(paths) == 1:
+        logger.info("Start processing file", file=paths[0])
+        return process_file(config, paths[0], report_file)
+
+    inputs = get_batch_inputs(paths, extract_root, report_file)
+    results = process_files(config, inputs)
+    return ProcessResult([r for result in results for r in result.results])
 
 
 cli.context_class = UnblobContext
 
 
+def get_files_param(ctx: click.Context) -> click.Parameter:
+    return next(param for param in ctx.command.params if param.name == "files")
+
+
+def read_file_list(file_list: TextIO) -> List[Path]:
+    paths = []
+    for line in file_list:
+        line = line.strip()
+        if not line:
+            continue
+        path = Path(line).resolve()
+        if not path.is_file():
+            raise click.BadParameter(
+                f"File '{line}' does not exist or is not a file.",
+                param_hint="'--files-from'",
+            )
+        paths.append(path)
+    return paths
+
+
+def get_batch_inputs(
+    paths: List[Path], extract_root: Path, report_dir: Optional[Path]
+) -> List[BatchInput]:
+    """Inputs extracted into their own directory under extract_root.
+
+    The directories are named after the inputs, numbered when inputs have the same name.
+    """
+    name_counts = Counter()
+    inputs = []
+    for path in paths:
+        name_counts[path.name] += 1
+        name = path.name
+        if name_counts[path.name] > 1:
+            name = f"{name}.{name_counts[path.name]}"
+        report_file = report_dir / f"{name}.json" if report_dir else None
+        inputs.append(BatchInput(path, extract_root / name, report_file))
+
+    if report_dir:
+        report_dir.mkdir(parents=True, exist_ok=True)
+    return inputs
+
+
 def get_exit_code_from_reports(reports: ProcessResult) -> int:
     severity_to_exit_code = [
         (Severity.ERROR, 1),
@@ -239,6 +485,10 @@ def main():
     try:
         with ctx:
             reports = cli.invoke(ctx)
+    except click.ClickException as e:
+        # missing input files are only known when the file list is read
+        e.show()
+        sys.exit(e.exit_code)
     except Exception:
         logger.exception("Unhandled exception during unblob")
         sys.exit(1)
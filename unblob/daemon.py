@@ -0,0 +1,309 @@
+"""Resident extraction service, processing jobs with warm workers.
+
+Jobs are requested over a Unix domain socket, with a JSON object per line:
+
+    {"input": "/path/to/file", "extract_root": "/path/to/dir", "report": "/path/to/report.json"}
+
+report is optional.  The reply is {"job": <id>, "status": "accepted"}, followed by
+{"job": <id>, "status": "done" or "cancelled", "result": <report>}, when the job is
+finished.  A job is cancelled with {"cancel": <id>} from any connection.  Cancelled
+jobs do not start new tasks, but the tasks already being processed are finished.
+"""
+import contextlib
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from structlog import get_logger
+
+from .models import Task
+from .pool import make_pool
+from .processing import (
+    BatchInput,
+    ExtractionConfig,
+    FairScheduler,
+    InputRun,
+    MultiInputProcessor,
+    Processor,
+    RunState,
+    shared_run_state,
+)
+from .signals import terminate_gracefully
+
+logger = get_logger()
+
+# how often new jobs and cancellations are checked, while waiting for results
+POLL_INTERVAL = 0.1
+
+Message = Dict[str, Any]
+
+
+class _Job:
+    def __init__(self, batch_input: BatchInput):
+        self.id = uuid.uuid4().hex
+        self.input = batch_input
+        # set by the main thread, when it starts the job
+        self.run: Optional[InputRun] = None
+        # the dedup registry and the budget of the job, closed when it is finished
+        self.run_state: Optional[RunState] = None
+        self.resources = contextlib.ExitStack()
+        self.cancel_requested = threading.Event()
+        self.finished = threading.Event()
+        self.response: Message = {}
+
+
+class _Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: Path, job_daemon: "Daemon"):
+        self.job_daemon = job_daemon
+        super().__init__(str(socket_path), _RequestHandler)
+
+    def server_bind(self):
+        super().server_bind()
+        # jobs can read and write any file of the user, so only the user can connect,
+        # which is checked on connect, and nothing can connect before listening
+        os.chmod(self.server_address, 0o600)
+
+
+def _remove_stale_socket(socket_path: Path):
+    """Remove the socket left behind by a daemon, which is not running anymore.
+
+    The socket of a running daemon is kept, binding to it fails.
+    """
+    if not socket_path.is_socket():
+        return
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(str(socket_path))
+        except ConnectionRefusedError:
+            logger.info("Removing stale socket", socket=socket_path)
+            socket_path.unlink(missing_ok=True)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    server: _Server
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                self._reply({"status": "error", "error": "Invalid JSON"})
+                continue
+            self.server.job_daemon.handle_request(request, self._reply)
+
+    def _reply(self, response: Message):
+        try:
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+        except OSError:
+            logger.debug("Client disconnected", response=response)
+
+
+class Daemon:
+    """Processes jobs with one pool of workers, in turns like process_files.
+
+    Connections are handled in threads, the pool is driven by the thread calling
+    serve.
+    """
+
+    def __init__(self, config: ExtractionConfig, socket_path: Path):
+        self._config = config
+        self._socket_path = socket_path
+        # accepted, not finished jobs, shared with the connection threads
+        self._jobs: Dict[str, _Job] = {}
+        self._jobs_lock = threading.Lock()
+        self._new_jobs: "queue.Queue[_Job]" = queue.Queue()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        # keeping every worker busy, while tasks of new jobs are submitted between
+        # the tasks of the others
+        self._scheduler = FairScheduler(
+            2 * config.process_num, config.scheduling_policy
+        )
+
+    def serve(self):
+        """Process jobs until stop is called."""
+        # jobs have their own dedup registry and budget, so that the same file can
+        # be submitted again
+        with shared_run_state(self._config) as run_state:
+            processor = MultiInputProcessor(
+                Processor(self._config, RunState(spill_cache=run_state.spill_cache))
+            )
+            pool = make_pool(
+                process_num=self._config.process_num,
+                handler=processor.process_task,
+                result_callback=self._process_result,
+                initializer=processor.prepare,
+                scheduling_policy=self._config.scheduling_policy,
+                max_tasks_per_worker=self._config.max_tasks_per_worker,
+                max_worker_rss=self._config.max_worker_rss,
+            )
+            try:
+                # workers are started before the connection threads
+                with pool, self._listen():
+                    self._process_jobs(pool)
+            finally:
+                # after the workers are stopped, as they can use the job states
+                self._abort_jobs()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+    def handle_request(self, request: Message, reply: Callable[[Message], None]):
+        """Handle a request of a connection thread, until the job is finished."""
+        if "cancel" in request:
+            reply(self._request_cancel(request["cancel"]))
+            return
+
+        try:
+            job = self._accept_job(request)
+        except (KeyError, TypeError, ValueError) as e:
+            reply({"status": "error", "error": f"Invalid job: {e!r}"})
+            return
+
+        reply({"job": job.id, "status": "accepted"})
+        job.finished.wait()
+        reply(job.response)
+
+    @contextlib.contextmanager
+    def _listen(self) -> Iterator[None]:
+        _remove_stale_socket(self._socket_path)
+        server = _Server(self._socket_path, self)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        logger.info("Waiting for jobs", socket=self._socket_path)
+        try:
+            yield
+        finally:
+            server.shutdown()
+            server.server_close()
+            self._socket_path.unlink(missing_ok=True)
+
+    def _accept_job(self, request: Message) -> _Job:
+        input_path = Path(request["input"]).resolve()
+        if not input_path.is_file():
+            raise ValueError("input is not a file", str(input_path))
+        report_file = request.get("report")
+        batch_input = BatchInput(
+            input_path,
+            Path(request["extract_root"]).resolve(),
+            Path(report_file).resolve() if report_file else None,
+        )
+
+        job = _Job(batch_input)
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+        self._new_jobs.put(job)
+        self._wakeup.set()
+        logger.info("Job accepted", job=job.id, file=input_path)
+        return job
+
+    def _request_cancel(self, job_id: str) -> Message:
+        with self._jobs_lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return {"job": job_id, "status": "error", "error": "Unknown job"}
+
+        job.cancel_requested.set()
+        self._wakeup.set()
+        return {"job": job_id, "status": "cancelling"}
+
+    def _process_jobs(self, pool):
+        while not self._stopped.is_set():
+            self._wakeup.clear()
+            self._start_jobs()
+            self._cancel_jobs()
+            self._scheduler.submit_tasks(pool)
+            if self._scheduler.is_idle():
+                self._wakeup.wait(POLL_INTERVAL)
+            else:
+                pool.process_results(POLL_INTERVAL)
+
+    def _start_jobs(self):
+        while not self._new_jobs.empty():
+            job = self._new_jobs.get()
+            try:
+                self._start_job(job)
+            except OSError as e:
+                # e.g. the input is removed after the job is accepted
+                logger.error("Job can not be started", job=job.id, error=e)
+                self._finish(
+                    job,
+                    {"job": job.id, "status": "error", "error": f"Job failed: {e!r}"},
+                )
+
+    def _start_job(self, job: _Job):
+        job.run = InputRun(self._config, job.input)
+        job.run_state = job.resources.enter_context(
+            shared_run_state(job.run.config, with_spill_cache=False)
+        )
+        task = job.run.start()
+        if task is not None:
+            self._scheduler.add(job.id, self._make_item(job, task))
+        self._finish_if_done(job)
+
+    def _cancel_jobs(self):
+        with self._jobs_lock:
+            jobs = [
+                job
+                for job in self._jobs.values()
+                if job.cancel_requested.is_set() and job.run and not job.run.cancelled
+            ]
+
+        for job in jobs:
+            assert job.run is not None
+            job.run.cancel(self._scheduler.discard(job.id))
+            self._finish_if_done(job)
+
+    def _process_result(self, pool, item):
+        job_id, result = item
+        self._scheduler.task_done()
+        with self._jobs_lock:
+            job = self._jobs[job_id]
+
+        assert job.run is not None
+        for task in job.run.register(result):
+            self._scheduler.add(job_id, self._make_item(job, task))
+        self._finish_if_done(job)
+
+    @staticmethod
+    def _make_item(job: _Job, task: Task):
+        assert job.run is not None
+        return job.id, job.run.config, job.run_state, task
+
+    def _finish_if_done(self, job: _Job):
+        assert job.run is not None
+        if not job.run.done:
+            return
+
+        status = "cancelled" if job.run.cancelled else "done"
+        result = json.loads(job.run.result.to_json())
+        self._finish(job, {"job": job.id, "status": status, "result": result})
+
+    def _abort_jobs(self):
+        with self._jobs_lock:
+            jobs: List[_Job] = list(self._jobs.values())
+        for job in jobs:
+            self._finish(job, {"job": job.id, "status": "error", "error": "Stopped"})
+
+    def _finish(self, job: _Job, response: Message):
+        with self._jobs_lock:
+            del self._jobs[job.id]
+        job.resources.close()
+        logger.info("Job finished", job=job.id, status=response["status"])
+        job.response = response
+        job.finished.set()
+
+
+@terminate_gracefully
+def serve_jobs(config: ExtractionConfig, socket_path: Path):
+    Daemon(config, socket_path).serve()
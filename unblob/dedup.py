@@ -0,0 +1,36 @@
+"""Run-wide registry of processed file contents.
+
+Files with the same content as an already processed file are not processed again.
+The registry is a directory shared by the worker processes, with an entry for every
+registered content digest, holding the path of its first occurrence.
+"""
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+import attr
+
+
+@attr.define(frozen=True)
+class DedupRegistry:
+    directory: Path
+
+    def register(self, digest: str, path: Path) -> Optional[Path]:
+        """Register path as the first occurrence of content with digest.
+
+        Returns the first occurrence, when the content is already registered.
+        """
+        entry = self.directory / digest
+        fd, new_entry = tempfile.mkstemp(prefix=".", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(os.fsencode(path))
+            # linking is atomic, only one of concurrent registrations can succeed,
+            # and the entry is complete by then
+            os.link(new_entry, entry)
+            return None
+        except FileExistsError:
+            return Path(os.fsdecode(entry.read_bytes()))
+        finally:
+            os.unlink(new_entry)
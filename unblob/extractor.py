@@ -1,12 +1,18 @@
 """
 File extraction related functions.
 """
+import fcntl
 import os
+import shutil
+import tempfile
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Iterator, Optional
 
 from structlog import get_logger
 
-from .file_utils import iterate_file
+from .budget import ExtractionGuard
+from .file_utils import copy_file_range
 from .models import Chunk, File, TaskResult, UnknownChunk, ValidChunk
 from .report import MaliciousSymlinkRemoved
 
@@ -16,11 +22,11 @@ logger = get_logger()
 def carve_chunk_to_file(carve_path: Path, file: File, chunk: Chunk):
     """Extract valid chunk to a file, which we then pass to another tool to extract it."""
     carve_path.parent.mkdir(parents=True, exist_ok=True)
-    logger.debug("Carving chunk", path=carve_path)
 
-    with carve_path.open("wb") as f:
-        for data in iterate_file(file, chunk.start_offset, chunk.size):
-            f.write(data)
+    with carve_path.open("wb", buffering=0) as f:
+        method = copy_file_range(file, chunk.start_offset, chunk.size, f)
+
+    logger.debug("Carved chunk", path=carve_path, method=method)
 
 
 def fix_permission(path: Path):
@@ -85,13 +91,37 @@ def fix_symlink(path: Path, outdir: Path, task_result: TaskResult) -> Path:
     return path
 
 
-def fix_extracted_directory(outdir: Path, task_result: TaskResult):
+def fix_extracted_directory(
+    outdir: Path, task_result: TaskResult, guard: Optional[ExtractionGuard] = None
+):
+    """Fix the extracted files, counting them with guard, if given."""
     fix_permission(outdir)
     for path in outdir.rglob("*"):
         if path.is_symlink():
             fix_symlink(path, outdir, task_result)
         else:
             fix_permission(path)
+        if guard is not None and os.path.lexists(path):
+            guard.count(path)
+
+
+def remove_extracted_directory(outdir: Path):
+    """Remove outdir, even with the permissions of the extracted files not fixed."""
+    logger.debug("Removing extracted directory", path=outdir)
+    try:
+        shutil.rmtree(outdir)
+        return
+    except OSError:
+        pass
+
+    # directories are made accessible before walking into them
+    fix_permission(outdir)
+    for root, dirs, _files in os.walk(outdir):
+        for name in dirs:
+            path = Path(root, name)
+            if not path.is_symlink():
+                fix_permission(path)
+    shutil.rmtree(outdir, ignore_errors=True)
 
 
 def carve_unknown_chunk(extract_dir: Path, file: File, chunk: UnknownChunk) -> Path:
@@ -102,9 +132,52 @@ def carve_unknown_chunk(extract_dir: Path, file: File, chunk: UnknownChunk) -> P
     return carve_path
 
 
+def get_valid_chunk_filename(chunk: ValidChunk) -> str:
+    return f"{chunk.start_offset}-{chunk.end_offset}.{chunk.handler.NAME}"
+
+
 def carve_valid_chunk(extract_dir: Path, file: File, chunk: ValidChunk) -> Path:
-    filename = f"{chunk.start_offset}-{chunk.end_offset}.{chunk.handler.NAME}"
-    carve_path = extract_dir / filename
+    carve_path = extract_dir / get_valid_chunk_filename(chunk)
     logger.info("Extracting valid chunk", path=carve_path, chunk=chunk)
     carve_chunk_to_file(carve_path, file, chunk)
     return carve_path
+
+
+def is_chunk_window_supported() -> bool:
+    return hasattr(os, "memfd_create") and Path(f"/proc/{os.getpid()}/fd").is_dir()
+
+
+@contextmanager
+def open_valid_chunk_window(file: File, chunk: ValidChunk) -> Iterator[Path]:
+    """Path of a read-only, in-memory copy of chunk, to extract it without carving.
+
+    The path is a symlink with the name of the carved chunk file, pointing to a
+    sealed memfd through /proc of this process, so that external commands run by
+    extractors can open it as well. It is only valid inside the context.
+    """
+    filename = get_valid_chunk_filename(chunk)
+    fd = os.memfd_create(filename, os.MFD_CLOEXEC | os.MFD_ALLOW_SEALING)
+    try:
+        with os.fdopen(fd, "wb", buffering=0, closefd=False) as f:
+            method = copy_file_range(file, chunk.start_offset, chunk.size, f)
+        fcntl.fcntl(
+            fd,
+            fcntl.F_ADD_SEALS,
+            fcntl.F_SEAL_SEAL
+            | fcntl.F_SEAL_SHRINK
+            | fcntl.F_SEAL_GROW
+            | fcntl.F_SEAL_WRITE,
+        )
+
+        with tempfile.TemporaryDirectory(prefix="unblob-window-") as window_dir:
+            window_path = Path(window_dir) / filename
+            window_path.symlink_to(f"/proc/{os.getpid()}/fd/{fd}")
+            logger.info(
+                "Extracting valid chunk through window",
+                path=window_path,
+                chunk=chunk,
+                method=method,
+            )
+            yield window_path
+    finally:
+        os.close(fd)
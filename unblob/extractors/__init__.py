@@ -1 +1,2 @@
-from .command import Command
+from .command import Command, StreamingCommand
+from .decompressor import DecompressorExtractor
@@ -5,8 +5,14 @@ from typing import List
 
 from structlog import get_logger
 
-from unblob.models import ExtractError, Extractor
-from unblob.report import ExtractCommandFailedReport, ExtractorDependencyNotFoundReport
+from unblob.budget import check_extraction, get_check_interval
+from unblob.limits import get_resource_limits
+from unblob.models import Chunk, ExtractError, Extractor, File, StreamingExtractor
+from unblob.report import (
+    ExtractCommandFailedReport,
+    ExtractCommandLimitExceededReport,
+    ExtractorDependencyNotFoundReport,
+)
 
 logger = get_logger()
 
@@ -18,14 +24,30 @@ class Command(Extractor):
 
     def extract(self, inpath: Path, outdir: Path):
         cmd = self._make_extract_command(inpath, outdir)
+        self._run(cmd)
+
+    def _run(self, cmd: List[str], **kwargs):
         command = shlex.join(cmd)
         logger.debug("Running extract command", command=command)
         try:
-            res = subprocess.run(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-            )
+            res = _run_checked(cmd, **kwargs)
+            limits = get_resource_limits()
+            hit_limit = limits and limits.get_hit_limit(res.returncode, res.stderr)
+            if hit_limit:
+                limit, value = hit_limit
+                error_report = ExtractCommandLimitExceededReport(
+                    command=command,
+                    stdout=res.stdout,
+                    stderr=res.stderr,
+                    exit_code=res.returncode,
+                    limit=limit,
+                    value=value,
+                )
+
+                logger.error(
+                    "Extract command exceeded its limit", **error_report.asdict()
+                )
+                raise ExtractError(error_report)
             if res.returncode != 0:
                 error_report = ExtractCommandFailedReport(
                     command=command,
@@ -64,5 +86,64 @@ class Command(Extractor):
         return [self._executable]
 
 
+class StreamingCommand(Command, StreamingExtractor):
+    """Command reading the chunk from its standard input.
+
+    The command template can not refer to {inpath}, chunks are written to the
+    standard input of the command straight from the mapped file, without carving.
+    """
+
+    def __init__(self, executable, *args):
+        if any("{inpath}" in arg for arg in args):
+            raise InvalidCommandTemplate(
+                "Streaming command can not have {inpath}", args
+            )
+        super().__init__(executable, *args)
+
+    def extract(self, inpath: Path, outdir: Path):
+        cmd = self._make_extract_command(inpath, outdir)
+        with inpath.open("rb") as stdin:
+            self._run(cmd, stdin=stdin)
+
+    def extract_from_file(self, file: File, chunk: Chunk, filename: str, outdir: Path):
+        cmd = self._make_extract_command(Path(filename), outdir)
+        # communicate writes the input as the command reads it, while also reading
+        # its outputs, so neither side blocks on a full pipe
+        start_offset, end_offset = chunk.start_offset, chunk.end_offset
+        with memoryview(file) as view, view[start_offset:end_offset] as data:
+            self._run(cmd, input=data)
+
+
+def _run_checked(cmd: List[str], input=None, **kwargs) -> subprocess.CompletedProcess:
+    """Like subprocess.run, but checking the running extraction periodically.
+
+    The command runs with the resource limits of the extraction, and it is killed,
+    when the check raises, or the extraction is interrupted by its watchdog.
+    """
+    if input is not None:
+        kwargs["stdin"] = subprocess.PIPE
+    limits = get_resource_limits()
+    if limits is not None:
+        kwargs["preexec_fn"] = limits.apply
+    with subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs
+    ) as process:
+        try:
+            while True:
+                try:
+                    stdout, stderr = process.communicate(
+                        input, timeout=get_check_interval()
+                    )
+                    break
+                except subprocess.TimeoutExpired:
+                    # the input is only passed on the first call
+                    input = None
+                    check_extraction()
+        except BaseException:
+            process.kill()
+            raise
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+
 class InvalidCommandTemplate(ValueError):
     pass
@@ -0,0 +1,165 @@
+import io
+import lzma
+import shutil
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Callable, Optional, Sequence, Tuple, Type
+
+from structlog import get_logger
+
+from unblob.budget import check_extraction
+from unblob.file_utils import DEFAULT_BUFSIZE
+from unblob.models import (
+    Chunk,
+    ExtractError,
+    Extractor,
+    File,
+    StreamingExtractor,
+    ValidChunk,
+)
+from unblob.report import DecompressionFailedReport
+
+logger = get_logger()
+
+# errors of the standard library decoders on corrupt or truncated streams
+DECOMPRESSION_ERRORS: Tuple[Type[Exception], ...] = (
+    EOFError,
+    OSError,
+    ValueError,
+    lzma.LZMAError,
+    zlib.error,
+)
+
+
+class BufferReader(io.RawIOBase):
+    """Reads the concatenation of buffers, without copying them up front."""
+
+    def __init__(self, *buffers):
+        super().__init__()
+        self._buffers = list(buffers)
+        self._offset = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while self._buffers:
+            buffer = self._buffers[0]
+            size = min(len(b), len(buffer) - self._offset)
+            if size:
+                start, end = self._offset, self._offset + size
+                b[:size] = buffer[start:end]
+                self._offset = end
+                return size
+            self._buffers.pop(0)
+            self._offset = 0
+        return 0
+
+    def close(self):
+        # drop the references to the buffers, so memory mapped files can be closed
+        self._buffers.clear()
+        super().close()
+
+
+class DecompressorReader(io.RawIOBase):
+    """Reads the output of a decompressor object, like zlib.decompressobj(), of a stream."""
+
+    def __init__(self, fileobj: BinaryIO, decompressor):
+        super().__init__()
+        self._fileobj = fileobj
+        self._decompressor = decompressor
+        self._decompressed = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._decompressed and not self._decompressor.eof:
+            data = self._fileobj.read(DEFAULT_BUFSIZE)
+            if not data:
+                raise EOFError(
+                    "Compressed file ended before the end-of-stream marker was reached"
+                )
+            self._decompressed = memoryview(self._decompressor.decompress(data))
+
+        size = min(len(b), len(self._decompressed))
+        b[:size] = self._decompressed[:size]
+        self._decompressed = self._decompressed[size:]
+        return size
+
+
+class DecompressorExtractor(StreamingExtractor):
+    """Decompresses a chunk in process into a single output file.
+
+    The output is named as the extract commands name it, after the stem of the
+    carved chunk.  Chunks are decompressed straight from the mapped file.
+
+    fallback is the extract command used instead, when extraction is configured to
+    run external decompressors.  Decompressed content spilled by the handler is
+    reused, when there is one for the chunk.
+    """
+
+    def __init__(
+        self,
+        open_stream: Callable[[BinaryIO], BinaryIO],
+        fallback: Optional[Extractor] = None,
+        errors: Tuple[Type[Exception], ...] = DECOMPRESSION_ERRORS,
+    ):
+        self._open_stream = open_stream
+        self._errors = errors
+        self.fallback = fallback
+
+    def extract(self, inpath: Path, outdir: Path):
+        with File.from_path(inpath) as file, memoryview(file) as data:
+            self._decompress(data, inpath.name, outdir)
+
+    def extract_from_file(self, file: File, chunk: Chunk, filename: str, outdir: Path):
+        start_offset, end_offset = chunk.start_offset, chunk.end_offset
+        with memoryview(file) as view, view[start_offset:end_offset] as data:
+            spill_path = chunk.spill_path if isinstance(chunk, ValidChunk) else None
+            if spill_path and self._reuse_spill(spill_path, data, filename, outdir):
+                return
+            self._decompress(data, filename, outdir)
+
+    def get_outfile_name(self, data: memoryview, filename: str) -> str:
+        return Path(filename).stem
+
+    def get_compressed_buffers(self, data: memoryview) -> Sequence:
+        """Buffers making up the compressed stream, the decoder reads."""
+        return (data,)
+
+    def _reuse_spill(
+        self, spill_path: Path, data: memoryview, filename: str, outdir: Path
+    ) -> bool:
+        outpath = outdir / self.get_outfile_name(data, filename)
+        try:
+            shutil.move(spill_path, outpath)
+        except FileNotFoundError:
+            logger.debug("Spilled chunk content is evicted", path=spill_path)
+            return False
+        logger.debug("Reused spilled chunk content", path=outpath)
+        return True
+
+    def _decompress(self, data: memoryview, filename: str, outdir: Path):
+        outpath = outdir / self.get_outfile_name(data, filename)
+        logger.debug("Decompressing chunk", path=outpath)
+        try:
+            self._copy_decompressed(data, outpath)
+            return
+        except self._errors as e:
+            # the report is raised outside of the handler, as the traceback of the
+            # decoder error would keep references to the buffers of the mapped file
+            error = str(e) or type(e).__name__
+
+        report = DecompressionFailedReport(path=outpath, error=error)
+        logger.error("Decompression failed", **report.asdict())
+        raise ExtractError(report)
+
+    def _copy_decompressed(self, data: memoryview, outpath: Path):
+        buffers = self.get_compressed_buffers(data)
+        with BufferReader(*buffers) as fileobj, self._open_stream(
+            fileobj
+        ) as stream, outpath.open("wb") as outfile:
+            while data := stream.read(DEFAULT_BUFSIZE):
+                outfile.write(data)
+                check_extraction()
@@ -1,4 +1,5 @@
 import enum
+import fcntl
 import io
 import math
 import mmap
@@ -6,20 +7,27 @@ import os
 import shutil
 import struct
 from pathlib import Path
-from typing import Iterator, Tuple
+from typing import Any, Callable, Iterator, List, Optional, Tuple
 
+import hyperscan
 from dissect.cstruct import cstruct
 
 from .logging import format_hex
 
 DEFAULT_BUFSIZE = shutil.COPY_BUFSIZE  # type: ignore
 
+# _IOW(0x94, 13, struct file_clone_range) from linux/fs.h
+FICLONERANGE = 0x4020940D
+
 
 class SeekError(ValueError):
     """Specific ValueError for File.seek"""
 
 
 class File(mmap.mmap):
+    # the mapped file, if any, so its contents can also be copied in the kernel
+    path: Optional[Path] = None
+
     @classmethod
     def from_bytes(cls, content: bytes):
         m = cls(-1, len(content))
@@ -30,7 +38,9 @@ class File(mmap.mmap):
     @classmethod
     def from_path(cls, path: Path):
         with path.open("rb") as base_file:
-            return cls(base_file.fileno(), 0, access=mmap.ACCESS_READ)
+            m = cls(base_file.fileno(), 0, access=mmap.ACCESS_READ)
+        m.path = path
+        return m
 
     def seek(self, pos: int, whence: int = os.SEEK_SET) -> int:
         try:
@@ -238,6 +248,76 @@ def iterate_file(
         yield data
 
 
+def _reflink_range(src_fd: int, dst_fd: int, offset: int, size: int, dst_offset: int):
+    # works only on filesystems sharing extents (btrfs, XFS), with block aligned ranges
+    clone_range = struct.pack("qQQQ", src_fd, offset, size, dst_offset)
+    fcntl.ioctl(dst_fd, FICLONERANGE, clone_range)
+    os.lseek(dst_fd, dst_offset + size, os.SEEK_SET)
+
+
+def _copy_file_range(src_fd: int, dst_fd: int, offset: int, size: int, dst_offset: int):
+    copied = 0
+    while copied < size:
+        count = os.copy_file_range(
+            src_fd, dst_fd, size - copied, offset + copied, dst_offset + copied
+        )
+        if count == 0:
+            break
+        copied += count
+    os.lseek(dst_fd, dst_offset + copied, os.SEEK_SET)
+
+
+def _sendfile(src_fd: int, dst_fd: int, offset: int, size: int, dst_offset: int):
+    os.lseek(dst_fd, dst_offset, os.SEEK_SET)
+    copied = 0
+    while copied < size:
+        count = os.sendfile(dst_fd, src_fd, offset + copied, size - copied)
+        if count == 0:
+            break
+        copied += count
+
+
+_KERNEL_COPY_METHODS: List[Tuple[str, Callable[[int, int, int, int, int], None]]] = [
+    ("reflink", _reflink_range)
+]
+if hasattr(os, "copy_file_range"):
+    _KERNEL_COPY_METHODS.append(("copy_file_range", _copy_file_range))
+if hasattr(os, "sendfile"):
+    _KERNEL_COPY_METHODS.append(("sendfile", _sendfile))
+
+
+def copy_file_range(
+    file: File, start_offset: int, size: int, outfile: io.FileIO
+) -> str:
+    """Copy size bytes of file from start_offset to the current position of outfile.
+
+    If file is mapped from a path, the range is reflinked or copied in the kernel,
+    falling back to buffered copying through the mapping.
+    Returns the name of the copy method used.
+    """
+    size = max(0, min(size, len(file) - start_offset))
+    dst_fd = outfile.fileno()
+    dst_offset = outfile.tell()
+
+    if file.path is not None:
+        src_fd = os.open(file.path, os.O_RDONLY)
+        try:
+            for method, copy in _KERNEL_COPY_METHODS:
+                try:
+                    copy(src_fd, dst_fd, start_offset, size, dst_offset)
+                    return method
+                except OSError:
+                    # unsupported by the filesystem, kernel or platform, start over
+                    os.ftruncate(dst_fd, dst_offset)
+                    os.lseek(dst_fd, dst_offset, os.SEEK_SET)
+        finally:
+            os.close(src_fd)
+
+    for data in iterate_file(file, start_offset, size):
+        outfile.write(data)
+    return "buffered"
+
+
 class StructParser:
     """Wrapper for dissect.cstruct to handle different endianness parsing dynamically."""
 
@@ -292,6 +372,35 @@ def read_until_past(file: File, pattern: bytes):
             return file.tell() - 1
 
 
+def scan_file_range(
+    db: hyperscan.Database,
+    file: File,
+    start_offset: int,
+    match_event_handler: Callable[[int, int, int, int, Any], bool],
+    context: Any,
+) -> None:
+    """Scan file from start_offset with a vectored hyperscan database.
+
+    The data before start_offset is not scanned, but offsets passed to
+    match_event_handler are still absolute file offsets. The scratch space of the
+    database is reused, so it must not be scanned concurrently from threads.
+    Terminating the scan from match_event_handler by returning True is not an error,
+    other hyperscan errors are raised.
+    """
+
+    def on_match(pattern_id: int, offset: int, end: int, flags: int, context: Any):
+        return match_event_handler(
+            pattern_id, start_offset + offset, start_offset + end, flags, context
+        )
+
+    with memoryview(file) as view, view[start_offset:] as window:
+        try:
+            db.scan([window], match_event_handler=on_match, context=context)
+        except hyperscan.error as e:
+            if not e.args or e.args[0] != f"error code {hyperscan.HS_SCAN_TERMINATED}":
+                raise
+
+
 def valid_path(path: Path) -> bool:
     try:
         path.as_posix().encode("utf-8")
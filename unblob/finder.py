@@ -2,9 +2,23 @@
 Searching Chunk related functions.
 The main "entry point" is search_chunks_by_priority.
 """
+import collections
+import contextlib
+import hashlib
+import itertools
+import math
+import multiprocessing as mp
+import multiprocessing.util
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from enum import Flag
 from functools import lru_cache
-from typing import Dict, List, Optional, Tuple
+from operator import itemgetter
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple, Type
 
 import attr
 import hyperscan
@@ -12,20 +26,112 @@ from structlog import get_logger
 
 from .file_utils import InvalidInputFormat, SeekError
 from .handlers import Handlers
-from .models import File, Handler, TaskResult, ValidChunk
+from .limits import WatchdogTimeout, watchdog
+from .logging import noformat
+from .math import shannon_entropy
+from .models import ChunkIndex, File, Handler, Task, TaskResult, ValidChunk
 from .parser import InvalidHexString
-from .report import CalculateChunkExceptionReport
+from .report import (
+    CalculateChunkExceptionReport,
+    CalculateChunkTimeoutReport,
+    CandidateThrottlingReport,
+    Report,
+)
+from .spill import SpillCache, configure_spill_cache, evict_spill, get_spill_cache
+
+try:
+    from re import _parser as sre_parse  # type: ignore
+except ImportError:  # Python < 3.11
+    import sre_parse
 
 logger = get_logger()
 
+_HYPERSCAN_VERSION = getattr(hyperscan, "__version__", "")
+
+
+@attr.define(frozen=True)
+class CandidateThrottling:
+    """Limits on calculating chunks for handlers, which mostly match on false positives.
+
+    A handler is throttled, after at least min_candidates of its matches have been
+    calculated in a file, and more than max_rejection_ratio of those produced no chunk.
+    Matches of a throttled handler in high entropy regions (compressed or encrypted
+    data), are only calculated for every sample_interval-th time.
+    Regardless of throttling, no more than candidate_budget matches are calculated
+    per handler in a file.
+    """
+
+    min_candidates: int = 256
+    max_rejection_ratio: float = 0.98
+    sample_interval: int = 16
+    # the aligned block before a match is checked, entropy is in bits / byte
+    entropy_block_size: int = 4096
+    entropy_threshold: float = 7.5
+    candidate_budget: Optional[int] = None
+
+
+@attr.define
+class _HandlerStats:
+    accepted_count: int = 0
+    rejected_count: int = 0
+    # offsets of the matches where throttling decisions were made
+    throttled_offset: Optional[int] = None
+    budget_exhausted_offset: Optional[int] = None
+    high_entropy_match_count: int = 0
+    skipped_high_entropy_count: int = 0
+    skipped_over_budget_count: int = 0
+
+    @property
+    def calculated_count(self) -> int:
+        return self.accepted_count + self.rejected_count
+
+    def as_report(self, handler: Handler) -> CandidateThrottlingReport:
+        return CandidateThrottlingReport(
+            handler=handler.NAME,
+            accepted_count=self.accepted_count,
+            rejected_count=self.rejected_count,
+            throttled_offset=self.throttled_offset,
+            budget_exhausted_offset=self.budget_exhausted_offset,
+            skipped_high_entropy_count=self.skipped_high_entropy_count,
+            skipped_over_budget_count=self.skipped_over_budget_count,
+        )
+
+
+# Fields of the calculated ValidChunk if there is one, and the reports produced
+_CalculatedChunk = Tuple[Optional[Dict[str, Any]], List[Report]]
+
 
 @attr.define
 class HyperscanMatchContext:
     handler_map: Dict[int, Handler]
     file: File
     file_size: int
-    all_chunks: List
+    all_chunks: ChunkIndex[ValidChunk]
     task_result: TaskResult
+    # lowest and highest PATTERN_MATCH_OFFSET of the handlers, bounded by 0
+    min_match_offset: int = 0
+    max_match_offset: int = 0
+    # length of the longest possible pattern match, None if it is unbounded
+    max_match_width: Optional[int] = None
+    # offset of the scanned part of the file, match offsets are relative to it
+    scan_offset: int = 0
+    # where the scan should continue after it has been terminated, if it should at all
+    resume_offset: Optional[int] = None
+    # results of calculate_chunk done before processing the matches, see
+    # _process_matches_concurrently
+    calculated_chunks: Dict[Tuple[Handler, int], _CalculatedChunk] = attr.field(
+        factory=dict
+    )
+    # (handler, real_offset) of candidates with finished chunk calculation, either
+    # valid or invalid, as multiple patterns of a handler can match the same offset
+    evaluated_candidates: Set[Tuple[Handler, int]] = attr.field(factory=set)
+    throttling: Optional[CandidateThrottling] = None
+    # seconds calculate_chunk can run for a match, 0 means unlimited
+    calculate_chunk_timeout: float = 0
+    handler_stats: Dict[Handler, _HandlerStats] = attr.field(
+        factory=lambda: collections.defaultdict(_HandlerStats)
+    )
+    block_entropies: Dict[int, float] = attr.field(factory=dict)
 
 
 class _HyperscanScan(Flag):
@@ -34,12 +140,23 @@ class _HyperscanScan(Flag):
 
 
 def _calculate_chunk(
-    handler: Handler, file: File, real_offset, task_result: TaskResult
+    handler: Handler,
+    file: File,
+    real_offset,
+    task_result: TaskResult,
+    timeout: float = 0,
 ) -> Optional[ValidChunk]:
 
     file.seek(real_offset)
     try:
-        return handler.calculate_chunk(file, real_offset)
+        with watchdog(timeout):
+            return handler.calculate_chunk(file, real_offset)
+    except WatchdogTimeout:
+        timeout_report = CalculateChunkTimeoutReport(
+            handler=handler.NAME, start_offset=real_offset, timeout=timeout
+        )
+        task_result.add_report(timeout_report)
+        logger.error("Chunk calculation timed out", **timeout_report.asdict())
     except InvalidInputFormat as exc:
         logger.debug(
             "File format is invalid",
@@ -73,9 +190,41 @@ def _calculate_chunk(
         )
 
 
+def _get_chunk(
+    handler: Handler, real_offset: int, context: HyperscanMatchContext
+) -> Optional[ValidChunk]:
+    calculated_chunk = context.calculated_chunks.pop((handler, real_offset), None)
+    if calculated_chunk is None:
+        return _calculate_chunk(
+            handler,
+            context.file,
+            real_offset,
+            context.task_result,
+            context.calculate_chunk_timeout,
+        )
+
+    chunk_fields, reports = calculated_chunk
+    for report in reports:
+        context.task_result.add_report(report)
+    if chunk_fields is None:
+        return None
+    return ValidChunk(**chunk_fields)
+
+
+def _drop_calculated_chunk(
+    candidate: Tuple[Handler, int], context: HyperscanMatchContext
+):
+    """Drop the chunk calculated concurrently for a candidate, which is skipped."""
+    calculated_chunk = context.calculated_chunks.pop(candidate, None)
+    if calculated_chunk is not None and calculated_chunk[0] is not None:
+        evict_spill(ValidChunk(**calculated_chunk[0]))
+
+
 def _hyperscan_match(
     pattern_id: int, offset: int, end: int, flags: int, context: HyperscanMatchContext
 ) -> _HyperscanScan:
+    offset += context.scan_offset
+    end += context.scan_offset
     handler = context.handler_map[pattern_id]
     real_offset = offset + handler.PATTERN_MATCH_OFFSET
 
@@ -84,13 +233,28 @@ def _hyperscan_match(
 
     # Skip chunk calculation if this would start inside another one,
     # similar to remove_inner_chunks, but before we even begin calculating.
-    if any(chunk.contains_offset(real_offset) for chunk in context.all_chunks):
+    if context.all_chunks.contains_offset(real_offset):
         logger.debug(
             "Skip chunk calculation as pattern is inside an other chunk",
             handler=handler.NAME,
             offset=real_offset,
             _verbosity=2,
         )
+        _drop_calculated_chunk((handler, real_offset), context)
+        return _skip_covered_range(end, context)
+
+    candidate = (handler, real_offset)
+    if candidate in context.evaluated_candidates:
+        logger.debug(
+            "Skip chunk calculation as it was already done for this offset",
+            handler=handler.NAME,
+            offset=real_offset,
+            _verbosity=2,
+        )
+        return _HyperscanScan.Continue
+
+    if context.throttling and _is_throttled(handler, real_offset, context):
+        _drop_calculated_chunk(candidate, context)
         return _HyperscanScan.Continue
 
     logger.debug(
@@ -100,19 +264,25 @@ def _hyperscan_match(
         _verbosity=2,
     )
 
-    chunk = _calculate_chunk(handler, context.file, real_offset, context.task_result)
+    chunk = _get_chunk(handler, real_offset, context)
+    context.evaluated_candidates.add(candidate)
+    stats = context.handler_stats[handler]
 
     # We found some random bytes this handler couldn't parse
     if chunk is None:
+        stats.rejected_count += 1
         return _HyperscanScan.Continue
 
     if chunk.end_offset > context.file_size:
         logger.debug("Chunk overflows file", chunk=chunk, _verbosity=2)
+        stats.rejected_count += 1
+        evict_spill(chunk)
         return _HyperscanScan.Continue
 
+    stats.accepted_count += 1
     chunk.handler = handler
     logger.debug("Found valid chunk", chunk=chunk, handler=handler.NAME, _verbosity=2)
-    context.all_chunks.append(chunk)
+    context.all_chunks.add(chunk)
 
     # Terminate scan if we match till the end of the file
     if chunk.end_offset == context.file_size:
@@ -122,65 +292,628 @@ def _hyperscan_match(
     return _HyperscanScan.Continue
 
 
+def _is_throttled(
+    handler: Handler, real_offset: int, context: HyperscanMatchContext
+) -> bool:
+    throttling = context.throttling
+    assert throttling is not None
+    stats = context.handler_stats[handler]
+
+    budget = throttling.candidate_budget
+    if budget is not None and stats.calculated_count >= budget:
+        if stats.budget_exhausted_offset is None:
+            logger.info(
+                "Candidate budget exhausted for handler",
+                handler=handler.NAME,
+                offset=real_offset,
+            )
+            stats.budget_exhausted_offset = real_offset
+        stats.skipped_over_budget_count += 1
+        return True
+
+    if stats.throttled_offset is None:
+        if (
+            stats.calculated_count < throttling.min_candidates
+            or stats.rejected_count
+            <= stats.calculated_count * throttling.max_rejection_ratio
+        ):
+            return False
+        logger.info(
+            "Throttling handler with high rejection rate",
+            handler=handler.NAME,
+            offset=real_offset,
+            accepted_count=noformat(stats.accepted_count),
+            rejected_count=noformat(stats.rejected_count),
+        )
+        stats.throttled_offset = real_offset
+
+    if _get_preceding_entropy(real_offset, context) < throttling.entropy_threshold:
+        return False
+
+    stats.high_entropy_match_count += 1
+    if stats.high_entropy_match_count % throttling.sample_interval == 0:
+        return False
+
+    stats.skipped_high_entropy_count += 1
+    return True
+
+
+def _get_preceding_entropy(offset: int, context: HyperscanMatchContext) -> float:
+    """Entropy of the aligned block before the one containing offset."""
+    assert context.throttling is not None
+    block_size = context.throttling.entropy_block_size
+    block = offset // block_size - 1
+    if block < 0:
+        return 0.0
+
+    if block not in context.block_entropies:
+        block_start = block * block_size
+        block_end = block_start + block_size
+        data = context.file[block_start:block_end]
+        context.block_entropies[block] = shannon_entropy(data)
+    return context.block_entropies[block]
+
+
+def _skip_covered_range(end: int, context: HyperscanMatchContext) -> _HyperscanScan:
+    """Terminate the scan to resume it after the chunks covering the match.
+
+    Matches are reported in the order of their end offset, so matches not reported
+    yet can start up to max_match_width before end.  The scan is only terminated,
+    when all these matches, and the ones starting up to the resume offset could only
+    produce chunks starting inside the already found chunks, so they need not be
+    scanned at all.
+    """
+    if context.max_match_width is None:
+        return _HyperscanScan.Continue
+
+    lowest_real_offset = end - context.max_match_width + context.min_match_offset
+    if not context.all_chunks.contains_offset(lowest_real_offset):
+        return _HyperscanScan.Continue
+
+    resume_offset = (
+        context.all_chunks.next_uncovered_offset(lowest_real_offset)
+        - context.max_match_offset
+    )
+    # Matches ending before the resume offset are already reported, so restarting
+    # there won't report them again
+    if resume_offset <= end:
+        return _HyperscanScan.Continue
+
+    context.resume_offset = resume_offset
+    return _HyperscanScan.Terminate
+
+
 def search_chunks(  # noqa: C901
     file: File,
     file_size: int,
     handlers: Handlers,
     task_result: TaskResult,
-) -> List[ValidChunk]:
+    *,
+    cache_dir: Optional[Path] = None,
+    segment_count: int = 1,
+    calculate_chunk_process_num: int = 1,
+    throttling: Optional[CandidateThrottling] = None,
+    calculate_chunk_timeout: float = 0,
+) -> ChunkIndex[ValidChunk]:
     """Search all ValidChunks within the file.
     Search for patterns and run Handler.calculate_chunk() on the found matches.
     We don't deal with offset within already found ValidChunks and invalid chunks are thrown away.
     If chunk covers the whole file we stop any further search and processing.
+    The compiled pattern database is cached in cache_dir when it is given.
+    With segment_count > 1 the file is split into that many segments scanned in parallel.
+    With calculate_chunk_process_num > 1 all matches are collected first, and chunks
+    are calculated for them in that many processes before processing them in order.
+    Chunk calculation for handlers with mostly false positive matches can be limited
+    by throttling, every throttled handler is reported in task_result.
+    Chunk calculations running longer than calculate_chunk_timeout are stopped and
+    reported, when it is given.
     """
-    all_chunks = []
+    all_chunks = ChunkIndex()
 
-    hyperscan_db, handler_map = build_hyperscan_database(handlers)
+    hyperscan_db, handler_map = build_hyperscan_database(handlers, cache_dir)
 
+    match_offsets = [handler.PATTERN_MATCH_OFFSET for handler in handler_map.values()]
+    max_match_width = get_max_match_width(handlers)
     hyperscan_context = HyperscanMatchContext(
         handler_map=handler_map,
         file=file,
         file_size=file_size,
         all_chunks=all_chunks,
         task_result=task_result,
+        min_match_offset=min(0, *match_offsets),
+        max_match_offset=max(0, *match_offsets),
+        max_match_width=max_match_width,
+        throttling=throttling,
+        calculate_chunk_timeout=calculate_chunk_timeout,
     )
 
-    try:
-        hyperscan_db.scan(
-            [file],
-            match_event_handler=_hyperscan_match,
-            context=hyperscan_context,
-        )
-    except hyperscan.error as e:
-        if e.args and e.args[0] == f"error code {hyperscan.HS_SCAN_TERMINATED}":
+    if max_match_width is None or file_size // segment_count <= max_match_width:
+        segment_count = 1
+
+    with memoryview(file) as view:
+        if segment_count == 1 and calculate_chunk_process_num == 1:
+            _scan(hyperscan_db, view, hyperscan_context)
+        else:
+            overlap = (
+                max_match_width - 1 if max_match_width and segment_count > 1 else 0
+            )
+            matches = _scan_segments(
+                hyperscan_db, view, file_size, segment_count, overlap
+            )
+            if calculate_chunk_process_num > 1:
+                _process_matches_concurrently(
+                    matches, hyperscan_context, calculate_chunk_process_num
+                )
+            else:
+                _process_matches(matches, hyperscan_context)
+
+    for handler, stats in hyperscan_context.handler_stats.items():
+        if (
+            stats.throttled_offset is not None
+            or stats.budget_exhausted_offset is not None
+        ):
+            task_result.add_report(stats.as_report(handler))
+
+    logger.debug(
+        "Ended searching for chunks",
+        all_chunks=all_chunks,
+    )
+
+    return all_chunks
+
+
+def _scan(
+    hyperscan_db: hyperscan.Database,
+    view: memoryview,
+    context: HyperscanMatchContext,
+):
+    while context.scan_offset < context.file_size:
+        scan_offset = context.scan_offset
+        context.resume_offset = None
+        try:
+            hyperscan_db.scan(
+                [view[scan_offset:]],
+                match_event_handler=_hyperscan_match,
+                context=context,
+            )
+            return
+        except hyperscan.error as e:
+            if not _is_scan_terminated(e):
+                logger.error(
+                    "Error scanning for patterns",
+                    error=e,
+                )
+                return
+
+            if context.resume_offset is None:
+                logger.debug(
+                    "Scanning terminated as chunk matches till end of file",
+                )
+                return
+
             logger.debug(
-                "Scanning terminated as chunk matches till end of file",
+                "Resuming scan after found chunks",
+                offset=context.resume_offset,
+                _verbosity=3,
             )
-            return all_chunks
-        else:
+            context.scan_offset = context.resume_offset
+
+
+def _scan_segments(
+    hyperscan_db: hyperscan.Database,
+    view: memoryview,
+    file_size: int,
+    segment_count: int,
+    overlap: int,
+) -> List[Tuple[int, int, int]]:
+    """Collect all (pattern_id, offset, end) matches by scanning segments in parallel.
+
+    Segments overlap, so every match fits into the segment its end offset belongs to,
+    when overlap is at least the length of the longest match - 1.
+    Matches are returned in end offset order, the same order Hyperscan reports them.
+    """
+    segment_size = math.ceil(file_size / segment_count)
+    scratches = get_scratches(hyperscan_db, segment_count)
+
+    def scan_segment(
+        segment_offset: int, scratch: hyperscan.Scratch
+    ) -> List[Tuple[int, int, int]]:
+        # The previous segment reports matches ending in the overlap
+        min_end = segment_offset + overlap if segment_offset else 0
+        segment_end = segment_offset + segment_size + overlap
+        segment = view[segment_offset:segment_end]
+        matches = []
+
+        def collect_match(pattern_id: int, offset: int, end: int, _flags, _context):
+            if segment_offset + end > min_end:
+                matches.append(
+                    (pattern_id, segment_offset + offset, segment_offset + end)
+                )
+
+        try:
+            hyperscan_db.scan(
+                [segment],
+                match_event_handler=collect_match,
+                scratch=scratch,
+            )
+        except hyperscan.error as e:
             logger.error(
                 "Error scanning for patterns",
                 error=e,
+                offset=segment_offset,
             )
+        finally:
+            segment.release()
+        return matches
 
     logger.debug(
-        "Ended searching for chunks",
-        all_chunks=all_chunks,
+        "Scanning file segments in parallel",
+        segment_count=noformat(segment_count),
+        segment_size=segment_size,
     )
+    with ThreadPoolExecutor(max_workers=segment_count) as executor:
+        segment_matches = executor.map(
+            scan_segment, range(0, file_size, segment_size), scratches
+        )
+        matches = list(itertools.chain.from_iterable(segment_matches))
+
+    matches.sort(key=itemgetter(2, 0))
+    return matches
+
+
+def _process_matches(
+    matches: List[Tuple[int, int, int]],
+    context: HyperscanMatchContext,
+    before_match: Optional[Callable[[int], None]] = None,
+):
+    """Process the matches in order, calling before_match with the index of each."""
+    resume_offset = 0
+    for index, (pattern_id, offset, end) in enumerate(matches):
+        # the same matches are skipped as with resuming the scan in _scan
+        if offset < resume_offset:
+            continue
+
+        if before_match is not None:
+            before_match(index)
+
+        context.resume_offset = None
+        scan = _hyperscan_match(pattern_id, offset, end, 0, context)
+        if scan is _HyperscanScan.Terminate:
+            if context.resume_offset is None:
+                logger.debug(
+                    "Scanning terminated as chunk matches till end of file",
+                )
+                return
+            resume_offset = context.resume_offset
 
-    return all_chunks
+
+# candidates calculated concurrently at once, per process
+WAVE_SIZE_PER_PROCESS = 4
+
+
+def _process_matches_concurrently(
+    matches: List[Tuple[int, int, int]],
+    context: HyperscanMatchContext,
+    process_num: int,
+):
+    """Process the matches, calculating chunks for them in process_num processes.
+
+    Chunks are calculated in waves, for the candidates of the next matches, which
+    would be calculated with the chunks found so far.  The results are stored in
+    context.calculated_chunks, reports are only added to the task result when a
+    match is processed, so the result is the same as when chunks are calculated
+    while scanning.
+    """
+    with _open_chunk_executor(context.file, process_num) as executor:
+
+        def calculate_wave(index: int):
+            nonlocal executor
+            if executor is None:
+                return
+            try:
+                _calculate_wave(
+                    matches,
+                    index,
+                    context,
+                    executor,
+                    process_num * WAVE_SIZE_PER_PROCESS,
+                )
+            except BrokenProcessPool as e:
+                # the remaining chunks are calculated while processing the matches
+                logger.error("Concurrent chunk calculation failed", error=e)
+                _discard_chunk_executor(executor)
+                executor = None
+
+        try:
+            _process_matches(matches, context, calculate_wave)
+        finally:
+            # chunks of the matches not processed after the scan is terminated
+            for candidate in list(context.calculated_chunks):
+                _drop_calculated_chunk(candidate, context)
+
+
+def _calculate_wave(
+    matches: List[Tuple[int, int, int]],
+    index: int,
+    context: HyperscanMatchContext,
+    executor: ProcessPoolExecutor,
+    wave_size: int,
+):
+    """Calculate chunks for the candidates of the matches from index on.
+
+    Nothing is calculated, unless the match at index needs calculation.
+    """
+    wave: Dict[Tuple[Handler, int], None] = {}
+    # calculated chunks of the previous waves are not counted in the stats yet
+    handler_counts = collections.Counter(
+        handler for handler, _offset in context.calculated_chunks
+    )
+    for position in range(index, len(matches)):
+        if len(wave) >= wave_size:
+            break
+        pattern_id, offset, _end = matches[position]
+        handler = context.handler_map[pattern_id]
+        candidate = (handler, offset + handler.PATTERN_MATCH_OFFSET)
+        if candidate in wave or not _needs_calculation(
+            candidate, handler_counts[handler], context
+        ):
+            if position == index:
+                return
+            continue
+        wave[candidate] = None
+        handler_counts[handler] += 1
+
+    logger.debug(
+        "Calculating chunks concurrently",
+        candidate_count=noformat(len(wave)),
+        offset=noformat(index),
+        _verbosity=3,
+    )
+    file_key = _get_file_key(context.file)
+    task = context.task_result.task
+    timeout = context.calculate_chunk_timeout
+    # workers are reused, so they do not inherit the spill cache of the search
+    spill_cache = get_spill_cache()
+    results = executor.map(
+        _calculate_chunk_in_worker,
+        [
+            (file_key, type(handler), offset, task, timeout, spill_cache)
+            for handler, offset in wave
+        ],
+    )
+    context.calculated_chunks.update(zip(wave, results))
+
+
+def _needs_calculation(
+    candidate: Tuple[Handler, int], pending_count: int, context: HyperscanMatchContext
+) -> bool:
+    """Whether the chunk would be calculated for candidate with the chunks found so far.
+
+    pending_count candidates of the handler are already waiting for calculation.
+    """
+    handler, real_offset = candidate
+    return (
+        real_offset >= 0
+        and candidate not in context.calculated_chunks
+        and candidate not in context.evaluated_candidates
+        and not context.all_chunks.contains_offset(real_offset)
+        and not _may_be_throttled(handler, real_offset, pending_count, context)
+    )
+
+
+def _may_be_throttled(
+    handler: Handler,
+    real_offset: int,
+    pending_count: int,
+    context: HyperscanMatchContext,
+) -> bool:
+    """Whether throttling could skip the candidate, without changing its state."""
+    throttling = context.throttling
+    if throttling is None:
+        return False
+    stats = context.handler_stats[handler]
+    budget = throttling.candidate_budget
+    if budget is not None and stats.calculated_count + pending_count >= budget:
+        return True
+    if stats.throttled_offset is None:
+        return False
+    return _get_preceding_entropy(real_offset, context) >= throttling.entropy_threshold
+
+
+_chunk_executor: Optional[Tuple[int, int, ProcessPoolExecutor]] = None
+
+
+@contextlib.contextmanager
+def _open_chunk_executor(file: File, process_num: int) -> Iterator[ProcessPoolExecutor]:
+    """Processes calculating chunks for file.
+
+    They are forked once, and reused by every search in the process, as they open
+    the file by its path.  Files without a path are inherited by processes forked
+    for the search.
+    """
+    global _chunk_executor
+    if file.path is None:
+        with ProcessPoolExecutor(
+            max_workers=process_num,
+            mp_context=mp.get_context("fork"),
+            initializer=_init_calculate_chunk_worker,
+            initargs=(file,),
+        ) as executor:
+            yield executor
+        return
+
+    # executors are not inherited by forked processes
+    if _chunk_executor is None or _chunk_executor[:2] != (os.getpid(), process_num):
+        executor = ProcessPoolExecutor(
+            max_workers=process_num, mp_context=mp.get_context("fork")
+        )
+        # pool workers do not run atexit handlers
+        multiprocessing.util.Finalize(executor, executor.shutdown, exitpriority=10)
+        _chunk_executor = (os.getpid(), process_num, executor)
+    yield _chunk_executor[2]
+
+
+def _discard_chunk_executor(executor: ProcessPoolExecutor):
+    global _chunk_executor
+    if _chunk_executor is not None and _chunk_executor[2] is executor:
+        _chunk_executor = None
+
+
+# path, size and modification time of a file, None for files without a path
+_FileKey = Optional[Tuple[Path, int, int]]
+
+
+def _get_file_key(file: File) -> _FileKey:
+    if file.path is None:
+        return None
+    stat = file.path.stat()
+    return file.path, stat.st_size, stat.st_mtime_ns
+
+
+# the file chunks are calculated for in a worker, and its key
+_calculate_chunk_worker_file: Optional[Tuple[_FileKey, File]] = None
+
+
+def _init_calculate_chunk_worker(file: File):
+    global _calculate_chunk_worker_file
+    _calculate_chunk_worker_file = (None, file)
+
+
+def _get_calculate_chunk_worker_file(file_key: _FileKey) -> File:
+    global _calculate_chunk_worker_file
+    if (
+        _calculate_chunk_worker_file is None
+        or _calculate_chunk_worker_file[0] != file_key
+    ):
+        assert file_key is not None
+        if _calculate_chunk_worker_file is not None:
+            _calculate_chunk_worker_file[1].close()
+        _calculate_chunk_worker_file = (file_key, File.from_path(file_key[0]))
+    return _calculate_chunk_worker_file[1]
+
+
+def _calculate_chunk_in_worker(
+    args: Tuple[_FileKey, Type[Handler], int, Task, float, Optional[SpillCache]]
+) -> _CalculatedChunk:
+    file_key, handler_class, real_offset, task, timeout, spill_cache = args
+    file = _get_calculate_chunk_worker_file(file_key)
+    configure_spill_cache(spill_cache)
+
+    result = TaskResult(task)
+    chunk = _calculate_chunk(handler_class(), file, real_offset, result, timeout)
+    if chunk is None:
+        return None, result.reports
+
+    # the handler is not picklable, it is set again on the chunk when it is processed
+    chunk_fields = {
+        attribute.name: getattr(chunk, attribute.name)
+        for attribute in attr.fields(ValidChunk)
+        if attribute.init
+    }
+    return chunk_fields, result.reports
+
+
+def prepare_search(
+    handlers: Handlers, cache_dir: Optional[Path] = None, segment_count: int = 1
+):
+    """Build and cache everything search_chunks needs for handlers.
+
+    Processes call it before processing any file, so that it is not paid for during
+    the first search, or by every process forked before the first search.
+    """
+    hyperscan_db, _handler_map = build_hyperscan_database(handlers, cache_dir)
+    get_max_match_width(handlers)
+    get_scratches(hyperscan_db, segment_count)
 
 
 @lru_cache
-def build_hyperscan_database(handlers: Handlers) -> Tuple[hyperscan.Database, Dict]:
-    db = hyperscan.Database(mode=hyperscan.HS_MODE_VECTORED)
+def get_scratches(
+    hyperscan_db: hyperscan.Database, count: int
+) -> Tuple[hyperscan.Scratch, ...]:
+    """Scratch spaces for scanning with hyperscan_db from count threads at once.
+
+    They are reused by every segmented scan in the process.
+    """
+    return tuple(hyperscan_db.scratch.clone() for _ in range(count))
+
+
+@lru_cache
+def get_max_match_width(handlers: Handlers) -> Optional[int]:
+    """The length of the longest possible pattern match, None if it is unbounded."""
+    max_width = 0
+    for handler_class in handlers:
+        for pattern in handler_class.PATTERNS:
+            try:
+                _min_width, width = sre_parse.parse(pattern.as_regex()).getwidth()
+            except re.error:
+                logger.debug(
+                    "Can not calculate pattern width",
+                    handler=handler_class.NAME,
+                    pattern=pattern,
+                )
+                return None
+            if width >= sre_parse.MAXREPEAT:
+                return None
+            max_width = max(max_width, width)
+    return max_width
+
+
+def _is_scan_terminated(error: hyperscan.error) -> bool:
+    return bool(error.args) and error.args[0] == (
+        f"error code {hyperscan.HS_SCAN_TERMINATED}"
+    )
+
+
+@lru_cache
+def build_hyperscan_database(
+    handlers: Handlers, cache_dir: Optional[Path] = None
+) -> Tuple[hyperscan.Database, Dict]:
+    """Build the pattern database and the pattern id -> Handler map for handlers.
+
+    When cache_dir is given, the compiled database is stored there keyed on the
+    fingerprint of the handlers, so later runs can load it without compiling.
+    """
+    handler_map = _build_handler_map(handlers)
+
+    if cache_dir is not None:
+        db = _load_hyperscan_database(handlers, cache_dir)
+        if db is not None:
+            return db, handler_map
+
+    db = _compile_hyperscan_database(handler_map)
+
+    if cache_dir is not None:
+        _store_hyperscan_database(db, handlers, cache_dir)
+
+    return db, handler_map
+
+
+def _build_handler_map(handlers: Handlers) -> Dict[int, Handler]:
+    """Assign pattern ids to handlers.
+
+    Pattern ids are assigned in handler and pattern order, so the map is fully
+    determined by the handlers and does not need to be stored next to a cached database.
+    """
     handler_map = dict()
 
     pattern_id = 0
-    patterns = []
     for handler_class in handlers:
         handler = handler_class()
-        for pattern in handler.PATTERNS:
+        for _pattern in handler.PATTERNS:
+            handler_map[pattern_id] = handler
+            pattern_id += 1
+
+    return handler_map
+
+
+def _compile_hyperscan_database(handler_map: Dict[int, Handler]) -> hyperscan.Database:
+    db = hyperscan.Database(mode=hyperscan.HS_MODE_VECTORED)
+
+    patterns = []
+    # pattern ids of the same handler are consecutive, see _build_handler_map
+    for handler, items in itertools.groupby(handler_map.items(), key=itemgetter(1)):
+        pattern_ids = (pattern_id for pattern_id, _handler in items)
+        for pattern_id, pattern in zip(pattern_ids, handler.PATTERNS):
             try:
                 patterns.append(
                     (
@@ -197,10 +930,77 @@ def build_hyperscan_database(handlers: Handlers) -> Tuple[hyperscan.Database, Di
                     error=str(e),
                 )
                 raise
-            handler_map[pattern_id] = handler
-            pattern_id += 1
 
     expressions, ids, flags = zip(*patterns)
     db.compile(expressions=expressions, ids=ids, elements=len(patterns), flags=flags)
 
-    return db, handler_map
+    return db
+
+
+@lru_cache
+def get_handlers_fingerprint(handlers: Handlers) -> str:
+    """Calculate a digest identifying the handler set and the patterns of its handlers.
+
+    Handler order is part of the fingerprint, as it determines pattern ids.
+    """
+    digest = hashlib.sha256()
+    digest.update(_HYPERSCAN_VERSION.encode())
+    for handler_class in handlers:
+        digest.update(
+            f"{handler_class.__module__}.{handler_class.__qualname__}".encode()
+        )
+        digest.update(str(handler_class.PATTERN_MATCH_OFFSET).encode())
+        for pattern in handler_class.PATTERNS:
+            digest.update(type(pattern).__name__.encode())
+            digest.update(pattern.encode())
+    return digest.hexdigest()
+
+
+def _get_hyperscan_database_path(handlers: Handlers, cache_dir: Path) -> Path:
+    return cache_dir / f"hyperscan-{get_handlers_fingerprint(handlers)}.db"
+
+
+def _load_hyperscan_database(
+    handlers: Handlers, cache_dir: Path
+) -> Optional[hyperscan.Database]:
+    path = _get_hyperscan_database_path(handlers, cache_dir)
+    try:
+        serialized_db = path.read_bytes()
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        logger.warning("Can not read cached pattern database", path=path, msg=str(e))
+        return None
+
+    try:
+        db = hyperscan.loadb(serialized_db, hyperscan.HS_MODE_VECTORED)
+        # only compiling allocates scratch space for the database
+        db.scratch = hyperscan.Scratch(db)
+    except hyperscan.error as e:
+        logger.warning("Invalid cached pattern database", path=path, error=e)
+        return None
+
+    logger.debug("Loaded cached pattern database", path=path)
+    return db
+
+
+def _store_hyperscan_database(
+    db: hyperscan.Database, handlers: Handlers, cache_dir: Path
+):
+    path = _get_hyperscan_database_path(handlers, cache_dir)
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        # concurrent runs may store the same database, renaming makes it atomic
+        fd, tmp_name = tempfile.mkstemp(dir=cache_dir, prefix=f".{path.name}")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(hyperscan.dumpb(db))
+            os.replace(tmp_name, path)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+    except OSError as e:
+        logger.warning("Can not store pattern database", path=path, msg=str(e))
+        return
+
+    logger.debug("Stored pattern database", path=path)
@@ -1,6 +1,8 @@
 import gzip
+from typing import Optional
 
 from ...file_utils import DEFAULT_BUFSIZE
+from ...spill import SpillWriter
 
 # pyright: reportGeneralTypeIssues=false
 
@@ -32,9 +34,11 @@ class SingleMemberGzipReader(gzip._GzipReader):
 
         return uncompress
 
-    def read_until_eof(self):
+    def read_until_eof(self, output: Optional[SpillWriter] = None):
         while not self._decompressor.eof:
-            self.read()
+            data = self.read()
+            if output is not None:
+                output.write(data)
 
     @property
     def unused_data(self):
@@ -1,12 +1,13 @@
+import bz2
 from typing import Optional
 
 import attr
 import hyperscan
 from structlog import get_logger
 
-from unblob.extractors import Command
+from unblob.extractors import Command, DecompressorExtractor
 
-from ...file_utils import InvalidInputFormat, SeekError, StructParser
+from ...file_utils import InvalidInputFormat, SeekError, StructParser, scan_file_range
 from ...models import File, Handler, HexString, Regex, ValidChunk
 
 logger = get_logger()
@@ -136,7 +137,9 @@ class BZip2Handler(Handler):
     # magic + version + block_size + block header magic
     PATTERNS = [Regex(r"\x42\x5a\x68[\x31-\x39]\x31\x41\x59\x26\x53\x59")]
 
-    EXTRACTOR = Command("7z", "x", "-y", "{inpath}", "-o{outdir}")
+    EXTRACTOR = DecompressorExtractor(
+        bz2.BZ2File, fallback=Command("7z", "x", "-y", "{inpath}", "-o{outdir}")
+    )
 
     def calculate_chunk(self, file: File, start_offset: int) -> Optional[ValidChunk]:
         if not _validate_stream_header(file):
@@ -149,15 +152,15 @@ class BZip2Handler(Handler):
             start_offset=start_offset, file=file, end_block_offset=-1
         )
         try:
-            hyperscan_stream_end_magic_db.scan(
-                [file], match_event_handler=_hyperscan_match, context=context
+            scan_file_range(
+                hyperscan_stream_end_magic_db,
+                file,
+                start_offset,
+                _hyperscan_match,
+                context,
             )
         except hyperscan.error as e:
-            if e.args and e.args[0] != f"error code {hyperscan.HS_SCAN_TERMINATED}":
-                logger.debug(
-                    "Error scanning for bzip2 patterns",
-                    error=e,
-                )
+            logger.debug("Error scanning for bzip2 patterns", error=e)
 
         if context.end_block_offset > 0:
             return ValidChunk(
@@ -14,14 +14,16 @@ library tries to read the next stream header.
 import gzip
 import io
 import zlib
+from pathlib import Path
 from typing import Optional
 
 from structlog import get_logger
 
-from unblob.extractors import Command
+from unblob.extractors import Command, DecompressorExtractor
 
 from ...file_utils import InvalidInputFormat
 from ...models import File, Handler, HexString, ValidChunk
+from ...spill import spill_decompressed
 from ._gzip_reader import SingleMemberGzipReader
 
 logger = get_logger()
@@ -30,6 +32,41 @@ GZIP2_CRC_LEN = 4
 GZIP2_SIZE_LEN = 4
 GZIP2_FOOTER_LEN = GZIP2_CRC_LEN + GZIP2_SIZE_LEN
 
+GZIP2_HEADER_LEN = 10
+GZIP2_FLAGS_OFFSET = 3
+GZIP2_XLEN_LEN = 2
+FEXTRA = 0x04
+FNAME = 0x08
+# longest stored file name used for naming the output
+MAX_NAME_LEN = 4096
+
+
+def get_member_name(data: memoryview) -> Optional[str]:
+    """The original file name stored in the header of a gzip member, if any."""
+    flags = data[GZIP2_FLAGS_OFFSET]
+    if not flags & FNAME:
+        return None
+
+    offset = GZIP2_HEADER_LEN
+    if flags & FEXTRA:
+        xlen_end = offset + GZIP2_XLEN_LEN
+        offset = xlen_end + int.from_bytes(data[offset:xlen_end], "little")
+
+    name_end = offset + MAX_NAME_LEN
+    name, _, _ = bytes(data[offset:name_end]).partition(b"\x00")
+    # ISO 8859-1 per RFC1952, only the last component as it can be a path
+    return Path(name.decode("latin-1")).name or None
+
+
+class GZIPExtractor(DecompressorExtractor):
+    """Decompresses a gzip member into its stored file name, like 7z does."""
+
+    def get_outfile_name(self, data: memoryview, filename: str) -> str:
+        name = get_member_name(data)
+        if name in (None, ".."):
+            return super().get_outfile_name(data, filename)
+        return name
+
 
 class GZIPHandler(Handler):
     NAME = "gzip"
@@ -60,7 +97,9 @@ class GZIPHandler(Handler):
         )
     ]
 
-    EXTRACTOR = Command("7z", "x", "-y", "{inpath}", "-o{outdir}")
+    EXTRACTOR = GZIPExtractor(
+        gzip.open, fallback=Command("7z", "x", "-y", "{inpath}", "-o{outdir}")
+    )
 
     def calculate_chunk(self, file: File, start_offset: int) -> Optional[ValidChunk]:
 
@@ -68,14 +107,17 @@ class GZIPHandler(Handler):
         if not fp.read_header():
             return
 
-        try:
-            fp.read_until_eof()
-        except (gzip.BadGzipFile, zlib.error) as e:
-            raise InvalidInputFormat from e
+        with spill_decompressed() as spill:
+            try:
+                fp.read_until_eof(spill)
+            except (gzip.BadGzipFile, zlib.error) as e:
+                raise InvalidInputFormat from e
 
-        file.seek(GZIP2_FOOTER_LEN - len(fp.unused_data), io.SEEK_CUR)
+            file.seek(GZIP2_FOOTER_LEN - len(fp.unused_data), io.SEEK_CUR)
 
-        return ValidChunk(
-            start_offset=start_offset,
-            end_offset=file.tell(),
-        )
+            chunk = ValidChunk(
+                start_offset=start_offset,
+                end_offset=file.tell(),
+            )
+            spill.keep(chunk)
+            return chunk
@@ -7,7 +7,7 @@ from typing import Optional
 from lz4.block import LZ4BlockError, decompress
 from structlog import get_logger
 
-from unblob.extractors import Command
+from unblob.extractors import StreamingCommand
 
 from ...file_utils import Endian, InvalidInputFormat, convert_int8, convert_int32
 from ...models import File, Handler, HexString, ValidChunk
@@ -67,7 +67,7 @@ class _LZ4HandlerBase(Handler):
     def _skip_magic_bytes(self, file: File):
         file.seek(MAGIC_LEN, io.SEEK_CUR)
 
-    EXTRACTOR = Command("lz4", "--decompress", "{inpath}", "{outdir}/{infile}")
+    EXTRACTOR = StreamingCommand("lz4", "--decompress", "-", "{outdir}/{infile}")
 
 
 class LegacyFrameHandler(_LZ4HandlerBase):
@@ -1,9 +1,11 @@
 import io
-from typing import Optional
+import lzma
+from functools import partial
+from typing import Optional, Sequence
 
 from structlog import get_logger
 
-from unblob.extractors import Command
+from unblob.extractors import Command, DecompressorExtractor
 
 from ...file_utils import Endian, convert_int64
 from ...models import File, Handler, HexString, ValidChunk
@@ -14,6 +16,33 @@ logger = get_logger()
 HEADER_LEN = 4 + 1 + 1
 # LZMA stream is 2 bytes aligned
 LZMA_ALIGNMENT = 2
+# CRC32 (4 bytes) + Data Size (8 bytes) + Member Size (8 bytes)
+TRAILER_LEN = 4 + 8 + 8
+DICTIONARY_SIZE_OFFSET = 5
+
+# lzip uses fixed LZMA properties: lc=3, lp=0, pb=2
+LZMA_ALONE_PROPERTIES = 0x5D
+# unknown uncompressed size, the stream is terminated by an end marker
+LZMA_ALONE_UNKNOWN_SIZE = b"\xFF" * 8
+
+
+def decode_dictionary_size(coded_size: int) -> int:
+    """Dictionary size coded as a base size minus fraction, see lzip manual."""
+    base_size = 1 << (coded_size & 0x1F)
+    return base_size - (base_size // 16) * (coded_size >> 5)
+
+
+class LZipExtractor(DecompressorExtractor):
+    """Decompresses an lzip member as an .lzma stream of the same LZMA data."""
+
+    def get_compressed_buffers(self, data: memoryview) -> Sequence:
+        dictionary_size = decode_dictionary_size(data[DICTIONARY_SIZE_OFFSET])
+        header = (
+            bytes([LZMA_ALONE_PROPERTIES])
+            + dictionary_size.to_bytes(4, "little")
+            + LZMA_ALONE_UNKNOWN_SIZE
+        )
+        return (header, data[HEADER_LEN:-TRAILER_LEN])
 
 
 class LZipHandler(Handler):
@@ -40,6 +69,9 @@ class LZipHandler(Handler):
 
         return ValidChunk(start_offset=start_offset, end_offset=end_offset)
 
-    EXTRACTOR = Command(
-        "lziprecover", "-k", "-D0", "-i", "{inpath}", "-o", "{outdir}/{infile}"
+    EXTRACTOR = LZipExtractor(
+        partial(lzma.LZMAFile, format=lzma.FORMAT_ALONE),
+        fallback=Command(
+            "lziprecover", "-k", "-D0", "-i", "{inpath}", "-o", "{outdir}/{infile}"
+        ),
     )
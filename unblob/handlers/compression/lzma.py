@@ -1,10 +1,11 @@
 import io
 import lzma
+from functools import partial
 from typing import Optional
 
 from structlog import get_logger
 
-from unblob.extractors import Command
+from unblob.extractors import Command, DecompressorExtractor
 
 from ...file_utils import (
     DEFAULT_BUFSIZE,
@@ -14,6 +15,7 @@ from ...file_utils import (
     convert_int64,
 )
 from ...models import File, Handler, HexString, ValidChunk
+from ...spill import SpillWriter, spill_decompressed
 
 logger = get_logger()
 
@@ -41,11 +43,13 @@ class LZMAHandler(Handler):
         )
     ]
 
-    EXTRACTOR = Command("7z", "x", "-y", "{inpath}", "-o{outdir}")
+    EXTRACTOR = DecompressorExtractor(
+        partial(lzma.LZMAFile, format=lzma.FORMAT_ALONE),
+        fallback=Command("7z", "x", "-y", "{inpath}", "-o{outdir}"),
+    )
 
     def calculate_chunk(self, file: File, start_offset: int) -> Optional[ValidChunk]:
 
-        read_size = 0
         file.seek(start_offset + 1)
         dictionary_size = convert_int32(file.read(4), Endian.LITTLE)
 
@@ -67,25 +71,41 @@ class LZMAHandler(Handler):
         file.seek(start_offset, io.SEEK_SET)
         decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_ALONE)
 
-        try:
-            while read_size < uncompressed_size and not decompressor.eof:
-                data = file.read(DEFAULT_BUFSIZE)
-                if not data:
-                    if read_size < (uncompressed_size * MIN_READ_RATIO):
-                        raise InvalidInputFormat("Very early truncated LZMA stream")
-                    else:
-                        logger.debug(
-                            "LZMA stream is truncated.",
-                            read_size=read_size,
-                            uncompressed_size=uncompressed_size,
-                        )
-                        break
-                read_size += len(decompressor.decompress(data))
-
-        except lzma.LZMAError as exc:
-            raise InvalidInputFormat from exc
-
-        return ValidChunk(
-            start_offset=start_offset,
-            end_offset=file.tell() - len(decompressor.unused_data),
-        )
+        with spill_decompressed() as spill:
+            try:
+                self._decompress(file, decompressor, uncompressed_size, spill)
+            except lzma.LZMAError as exc:
+                raise InvalidInputFormat from exc
+
+            chunk = ValidChunk(
+                start_offset=start_offset,
+                end_offset=file.tell() - len(decompressor.unused_data),
+            )
+            # truncated streams fail to extract, their content is not reused
+            if decompressor.eof:
+                spill.keep(chunk)
+            return chunk
+
+    def _decompress(
+        self,
+        file: File,
+        decompressor: lzma.LZMADecompressor,
+        uncompressed_size: int,
+        spill: SpillWriter,
+    ):
+        read_size = 0
+        while read_size < uncompressed_size and not decompressor.eof:
+            data = file.read(DEFAULT_BUFSIZE)
+            if not data:
+                if read_size < (uncompressed_size * MIN_READ_RATIO):
+                    raise InvalidInputFormat("Very early truncated LZMA stream")
+                else:
+                    logger.debug(
+                        "LZMA stream is truncated.",
+                        read_size=read_size,
+                        uncompressed_size=uncompressed_size,
+                    )
+                    break
+            decompressed = decompressor.decompress(data)
+            spill.write(decompressed)
+            read_size += len(decompressed)
@@ -1,13 +1,15 @@
 import io
-from typing import Optional, Tuple
+import lzma
+from typing import BinaryIO, Optional, Tuple
 
 import attr
 import hyperscan
 from structlog import get_logger
 
-from unblob.extractors import Command
+from unblob.extractors import Command, DecompressorExtractor
 
 from ...file_utils import (
+    DEFAULT_BUFSIZE,
     Endian,
     convert_int8,
     convert_int16,
@@ -15,6 +17,7 @@ from ...file_utils import (
     decode_multibyte_integer,
     read_until_past,
     round_up,
+    scan_file_range,
 )
 from ...models import File, Handler, HexString, InvalidInputFormat, ValidChunk
 
@@ -171,12 +174,68 @@ def _hyperscan_match(
     return True
 
 
+class XZStreamsReader(io.RawIOBase):
+    """Decompresses concatenated xz streams, skipping the stream padding between them.
+
+    lzma.LZMAFile stops at stream padding, as it is not the start of a valid stream.
+    """
+
+    def __init__(self, fileobj: BinaryIO):
+        super().__init__()
+        self._fileobj = fileobj
+        self._decompressor: Optional[lzma.LZMADecompressor] = None
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        data = self._read(len(b))
+        size = len(data)
+        b[:size] = data
+        return size
+
+    def _read(self, size: int) -> bytes:
+        while True:
+            decompressor = self._decompressor
+            if decompressor is None or decompressor.eof:
+                data = self._read_stream_start()
+                if not data:
+                    return b""
+                decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_XZ)
+                self._decompressor = decompressor
+            elif decompressor.needs_input:
+                data = self._fileobj.read(DEFAULT_BUFSIZE)
+                if not data:
+                    raise EOFError(
+                        "Compressed file ended before the end-of-stream marker was reached"
+                    )
+            else:
+                data = b""
+
+            decompressed = decompressor.decompress(data, size)
+            if decompressed:
+                return decompressed
+
+    def _read_stream_start(self) -> bytes:
+        data = self._decompressor.unused_data if self._decompressor else b""
+        while True:
+            data = data.lstrip(b"\x00")
+            if data:
+                return data
+            data = self._fileobj.read(DEFAULT_BUFSIZE)
+            if not data:
+                return b""
+
+
 class XZHandler(Handler):
     NAME = "xz"
 
     PATTERNS = [HexString("FD 37 7A 58 5A 00")]
 
-    EXTRACTOR = Command("7z", "x", "-y", "{inpath}", "-o{outdir}")
+    EXTRACTOR = DecompressorExtractor(
+        XZStreamsReader,
+        fallback=Command("7z", "x", "-y", "{inpath}", "-o{outdir}"),
+    )
 
     def calculate_chunk(self, file: File, start_offset: int) -> Optional[ValidChunk]:
 
@@ -193,15 +252,15 @@ class XZHandler(Handler):
         )
 
         try:
-            hyperscan_stream_end_magic_db.scan(
-                [file], match_event_handler=_hyperscan_match, context=context
+            scan_file_range(
+                hyperscan_stream_end_magic_db,
+                file,
+                start_offset,
+                _hyperscan_match,
+                context,
             )
         except hyperscan.error as e:
-            if e.args and e.args[0] != f"error code {hyperscan.HS_SCAN_TERMINATED}":
-                logger.debug(
-                    "Error scanning for xz patterns",
-                    error=e,
-                )
+            logger.debug("Error scanning for xz patterns", error=e)
         if context.end_streams_offset > 0:
             return ValidChunk(
                 start_offset=start_offset, end_offset=context.end_streams_offset
@@ -1,29 +1,20 @@
 import re
 import zlib
-from pathlib import Path
 from typing import Optional
 
 from structlog import get_logger
 
+from unblob.extractors import DecompressorExtractor
+from unblob.extractors.decompressor import DecompressorReader
 from unblob.handlers.archive.dmg import DMGHandler
 
 from ...file_utils import DEFAULT_BUFSIZE, InvalidInputFormat
-from ...models import Extractor, File, Handler, HexString, ValidChunk
+from ...models import File, Handler, HexString, ValidChunk
+from ...spill import spill_decompressed
 
 logger = get_logger()
 
 
-class ZlibExtractor(Extractor):
-    def extract(self, inpath: Path, outdir: Path):
-        decompressor = zlib.decompressobj()
-        outpath = outdir.joinpath(inpath.stem)
-        with File.from_path(inpath) as f:
-            content = f.read(DEFAULT_BUFSIZE)
-            while content and not decompressor.eof:
-                outpath.write_bytes(decompressor.decompress(content))
-                content = f.read(DEFAULT_BUFSIZE)
-
-
 class ZlibHandler(Handler):
     NAME = "zlib"
 
@@ -34,7 +25,9 @@ class ZlibHandler(Handler):
         HexString("78 5e"),  # compressed
     ]
 
-    EXTRACTOR = ZlibExtractor()
+    EXTRACTOR = DecompressorExtractor(
+        lambda fileobj: DecompressorReader(fileobj, zlib.decompressobj())
+    )
 
     def calculate_chunk(self, file: File, start_offset: int) -> Optional[ValidChunk]:
 
@@ -46,18 +39,22 @@ class ZlibHandler(Handler):
 
         decompressor = zlib.decompressobj()
 
-        try:
-            content = file.read(DEFAULT_BUFSIZE)
-            while content and not decompressor.eof:
-                decompressor.decompress(content)
+        with spill_decompressed() as spill:
+            try:
                 content = file.read(DEFAULT_BUFSIZE)
-
-        except zlib.error:
-            raise InvalidInputFormat("invalid zlib stream")
-
-        end_offset = file.tell() - len(decompressor.unused_data)
-
-        return ValidChunk(
-            start_offset=start_offset,
-            end_offset=end_offset,
-        )
+                while content and not decompressor.eof:
+                    spill.write(decompressor.decompress(content))
+                    content = file.read(DEFAULT_BUFSIZE)
+
+            except zlib.error:
+                raise InvalidInputFormat("invalid zlib stream")
+
+            end_offset = file.tell() - len(decompressor.unused_data)
+
+            chunk = ValidChunk(
+                start_offset=start_offset,
+                end_offset=end_offset,
+            )
+            if decompressor.eof:
+                spill.keep(chunk)
+            return chunk
@@ -3,11 +3,17 @@ from typing import Optional
 
 from structlog import get_logger
 
-from unblob.extractors import Command
+from unblob.extractors import DecompressorExtractor, StreamingCommand
+from unblob.extractors.decompressor import DECOMPRESSION_ERRORS
 
 from ...file_utils import Endian, InvalidInputFormat, convert_int8
 from ...models import File, Handler, HexString, ValidChunk
 
+try:
+    import zstandard
+except ImportError:  # optional, zstd chunks are extracted with the zstd command
+    zstandard = None
+
 logger = get_logger()
 
 MAGIC_LEN = 4
@@ -18,13 +24,26 @@ COMPRESSED_BLOCK = 2
 DICT_ID_FIELDSIZE_MAP = [0, 1, 2, 4]
 FRAME_CONTENT_FIELDSIZE_MAP = [0, 2, 4, 8]
 
+ZSTD_COMMAND = StreamingCommand("zstd", "-d", "-o", "{outdir}/{infile}")
+
+
+def get_extractor():
+    if zstandard is None:
+        return ZSTD_COMMAND
+
+    return DecompressorExtractor(
+        lambda fileobj: zstandard.ZstdDecompressor().stream_reader(fileobj),
+        fallback=ZSTD_COMMAND,
+        errors=(*DECOMPRESSION_ERRORS, zstandard.ZstdError),
+    )
+
 
 class ZSTDHandler(Handler):
     NAME = "zstd"
 
     PATTERNS = [HexString("28 B5 2F FD")]
 
-    EXTRACTOR = Command("zstd", "-d", "{inpath}", "-o", "{outdir}/{infile}")
+    EXTRACTOR = get_extractor()
 
     def get_frame_header_size(self, frame_header_descriptor: int) -> int:
         single_segment = (frame_header_descriptor >> 5 & 1) & 0b1
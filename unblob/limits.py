@@ -0,0 +1,113 @@
+"""Time and resource limits of handlers and extractors.
+
+A hung or runaway handler would stall its worker for good, so chunk calculation and
+extraction run under a watchdog, interrupting them after a timeout.  Extract
+commands also run with limits of their address space and CPU time, set in the child
+process before it executes the command.
+
+A command hitting its CPU limit is killed by a signal.  A command hitting its
+address space limit only sees allocations failing, so hitting it is recognized from
+the allocation failure messages of the command.
+"""
+import re
+import resource
+import signal
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+
+import attr
+
+# allocation failures reported by commonly used runtimes and libraries
+_ALLOCATION_FAILURE_PATTERN = re.compile(
+    rb"MemoryError|Cannot allocate memory|out of memory|memory exhausted"
+    rb"|std::bad_alloc|failed to allocate",
+    re.IGNORECASE,
+)
+
+
+class WatchdogTimeout(BaseException):
+    """Raised in the code running under a watchdog, when its time is up.
+
+    It is not an Exception, so that handlers catching every Exception do not
+    swallow it.
+    """
+
+    def __init__(self, timeout: float):
+        super().__init__(timeout)
+        self.timeout = timeout
+
+
+@contextmanager
+def watchdog(timeout: float) -> Iterator[None]:
+    """Raise WatchdogTimeout in the code running in the context after timeout seconds.
+
+    The watchdog uses SIGALRM, so it only works in the main thread, elsewhere the
+    code runs without a time limit, as it does with a timeout of 0.  Native code is
+    only interrupted when it returns to the interpreter.
+    """
+    if not timeout or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def _handle_alarm(signum: int, frame):
+        raise WatchdogTimeout(timeout)
+
+    previous_handler = signal.signal(signal.SIGALRM, _handle_alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+@attr.define(frozen=True)
+class ResourceLimits:
+    # address space in bytes and CPU time in seconds, 0 means unlimited
+    memory: int = 0
+    cpu: int = 0
+
+    def apply(self):
+        """Limit the resources of the current process, called in the child process."""
+        if self.memory:
+            resource.setrlimit(resource.RLIMIT_AS, (self.memory, self.memory))
+        if self.cpu:
+            # SIGXCPU is sent on the soft limit, SIGKILL on the hard one, if ignored
+            resource.setrlimit(resource.RLIMIT_CPU, (self.cpu, self.cpu + 1))
+
+    def get_hit_limit(
+        self, returncode: int, stderr: bytes
+    ) -> Optional[Tuple[str, int]]:
+        """Name and value of the limit a failed command hit, if any."""
+        if self.cpu and returncode in (-signal.SIGXCPU, -signal.SIGKILL):
+            return "cpu", self.cpu
+        if (
+            self.memory
+            and returncode != 0
+            and _ALLOCATION_FAILURE_PATTERN.search(stderr)
+        ):
+            return "memory", self.memory
+        return None
+
+
+_resource_limits: Optional[ResourceLimits] = None
+
+
+@contextmanager
+def limit_resources(limits: Optional[ResourceLimits]) -> Iterator[None]:
+    """Set the limits of the extract commands run in the current process."""
+    global _resource_limits
+    _resource_limits = limits
+    try:
+        yield
+    finally:
+        _resource_limits = None
+
+
+def get_resource_limits() -> Optional[ResourceLimits]:
+    if _resource_limits is None or not (
+        _resource_limits.memory or _resource_limits.cpu
+    ):
+        return None
+    return _resource_limits
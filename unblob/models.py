@@ -1,9 +1,10 @@
 import abc
+import bisect
 import itertools
 import json
 from enum import Enum
 from pathlib import Path
-from typing import List, Optional, Tuple, Type
+from typing import Generic, Iterable, Iterator, List, Optional, Tuple, Type, TypeVar
 
 import attr
 from structlog import get_logger
@@ -26,6 +27,29 @@ class Task:
     path: Path
     depth: int
     chunk_id: str
+    # estimated size of the content to process, known when the task is created,
+    # only used for scheduling
+    size_hint: int = attr.field(
+        default=0, kw_only=True, eq=False, metadata={"report": False}
+    )
+
+
+@attr.define(frozen=True)
+class ExtractChunkTask(Task):
+    """Extraction of a valid chunk of the file processed by file_task.
+
+    Chunks are extracted in separate tasks, so chunks of the same file can be
+    extracted in parallel. path and depth are the same as of file_task, chunk_id is
+    the id of the extracted chunk.
+    """
+
+    file_task: Task
+    start_offset: int
+    end_offset: int
+    handler_name: str
+    is_encrypted: bool
+    # decompressed content of the chunk spilled while calculating it
+    spill_path: Optional[Path] = None
 
 
 @attr.define
@@ -82,6 +106,8 @@ class ValidChunk(Chunk):
 
     handler: "Handler" = attr.ib(init=False, eq=False)
     is_encrypted: bool = attr.ib(default=False)
+    # decompressed content kept by the handler, see unblob.spill
+    spill_path: Optional[Path] = attr.ib(default=None, eq=False)
 
     def extract(self, inpath: Path, outdir: Path):
         if self.is_encrypted:
@@ -94,6 +120,21 @@ class ValidChunk(Chunk):
 
         self.handler.extract(inpath, outdir)
 
+    def can_extract_from_file(self) -> bool:
+        return isinstance(self.handler.EXTRACTOR, StreamingExtractor)
+
+    def extract_from_file(self, file: File, filename: str, outdir: Path):
+        """Extract the chunk straight from file, as if it was carved to filename."""
+        if self.is_encrypted:
+            logger.warning(
+                "Encrypted file is not extracted",
+                path=filename,
+                chunk=self,
+            )
+            raise ExtractError()
+
+        self.handler.extract_from_file(file, self, filename, outdir)
+
     def as_report(self, extraction_reports: List[Report]) -> ChunkReport:
         return ChunkReport(
             id=self.id,
@@ -126,6 +167,105 @@ class UnknownChunk(Chunk):
         )
 
 
+ChunkT = TypeVar("ChunkT", bound=Chunk)
+
+
+class ChunkIndex(Generic[ChunkT]):
+    """Chunks ordered by start offset, with an index of the file ranges they cover.
+
+    Chunks may overlap, covered ranges are kept merged, so coverage queries
+    can be answered with a binary search.
+    """
+
+    def __init__(self, chunks: Iterable[ChunkT] = ()):
+        self._chunks: List[ChunkT] = []
+        self._keys: List[Tuple[int, int]] = []
+        # disjoint, non-touching covered ranges in increasing order
+        self._starts: List[int] = []
+        self._ends: List[int] = []
+        for chunk in sorted(chunks, key=self._sort_key):
+            self._append(chunk)
+
+    @staticmethod
+    def _sort_key(chunk: Chunk) -> Tuple[int, int]:
+        # outer chunks come before the chunks starting at the same offset
+        return (chunk.start_offset, -chunk.end_offset)
+
+    def _append(self, chunk: ChunkT):
+        self._chunks.append(chunk)
+        self._keys.append(self._sort_key(chunk))
+        self._cover(chunk.start_offset, chunk.end_offset)
+
+    def add(self, chunk: ChunkT):
+        key = self._sort_key(chunk)
+        position = bisect.bisect_right(self._keys, key)
+        self._keys.insert(position, key)
+        self._chunks.insert(position, chunk)
+        self._cover(chunk.start_offset, chunk.end_offset)
+
+    def _cover(self, start_offset: int, end_offset: int):
+        # covered ranges overlapping or touching [start_offset, end_offset)
+        first = bisect.bisect_left(self._ends, start_offset)
+        last = bisect.bisect_right(self._starts, end_offset)
+        if first < last:
+            start_offset = min(start_offset, self._starts[first])
+            end_offset = max(end_offset, self._ends[last - 1])
+        self._starts[first:last] = [start_offset]
+        self._ends[first:last] = [end_offset]
+
+    def contains_offset(self, offset: int) -> bool:
+        """Whether offset is inside any of the chunks."""
+        position = bisect.bisect_right(self._starts, offset) - 1
+        return position >= 0 and offset < self._ends[position]
+
+    def next_uncovered_offset(self, offset: int) -> int:
+        """The first offset from offset, which is not inside any of the chunks."""
+        position = bisect.bisect_right(self._starts, offset) - 1
+        if position >= 0 and offset < self._ends[position]:
+            return self._ends[position]
+        return offset
+
+    def uncovered_ranges(self, end_offset: int) -> Iterator[Tuple[int, int]]:
+        """Ranges between 0 and end_offset, which are not inside any of the chunks."""
+        offset = 0
+        for start, end in zip(self._starts, self._ends):
+            if start >= end_offset:
+                break
+            if offset < start:
+                yield offset, start
+            offset = end
+        if offset < end_offset:
+            yield offset, end_offset
+
+    def outer_chunks(self) -> "ChunkIndex[ChunkT]":
+        """Chunks which are not within another, bigger chunk."""
+        outer_chunks = ChunkIndex()
+        # highest end offset of the chunks starting before the current one
+        max_end_offset = -1
+        seen_end_offset = -1
+        start_offset = -1
+        for chunk in self._chunks:
+            if chunk.start_offset != start_offset:
+                start_offset = chunk.start_offset
+                max_end_offset = seen_end_offset
+            if chunk.end_offset > max_end_offset:
+                outer_chunks._append(chunk)
+            seen_end_offset = max(seen_end_offset, chunk.end_offset)
+        return outer_chunks
+
+    def __iter__(self) -> Iterator[ChunkT]:
+        return iter(self._chunks)
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    def __getitem__(self, index: int) -> ChunkT:
+        return self._chunks[index]
+
+    def __repr__(self) -> str:
+        return repr(self._chunks)
+
+
 @attr.define
 class TaskResult:
     task: Task
@@ -170,7 +310,11 @@ class _JSONEncoder(json.JSONEncoder):
     def default(self, obj):
         if attr.has(type(obj)):
             extend_attr_output = True
-            attr_output = attr.asdict(obj, recurse=not extend_attr_output)
+            attr_output = attr.asdict(
+                obj,
+                recurse=not extend_attr_output,
+                filter=lambda field, _value: field.metadata.get("report", True),
+            )
             attr_output["__typename__"] = obj.__class__.__name__
             return attr_output
 
@@ -214,6 +358,17 @@ class Extractor(abc.ABC):
         """
 
 
+class StreamingExtractor(Extractor):
+    """Extractor, which can also read a chunk straight from the file containing it."""
+
+    @abc.abstractmethod
+    def extract_from_file(self, file: File, chunk: Chunk, filename: str, outdir: Path):
+        """Extract chunk of file, as if it was carved to a file named filename.
+
+        Raises ExtractError on failure.
+        """
+
+
 class Pattern(str):
     def as_regex(self) -> bytes:
         raise NotImplementedError
@@ -292,6 +447,13 @@ class Handler(abc.ABC):
 
         self.EXTRACTOR.extract(inpath, outdir)
 
+    def extract_from_file(self, file: File, chunk: Chunk, filename: str, outdir: Path):
+        assert isinstance(self.EXTRACTOR, StreamingExtractor)
+
+        outdir.mkdir(parents=True, exist_ok=False)
+
+        self.EXTRACTOR.extract_from_file(file, chunk, filename, outdir)
+
 
 class StructHandler(Handler):
     C_DEFINITIONS: str
@@ -1,14 +1,59 @@
 import abc
+import heapq
+import itertools
 import multiprocessing as mp
 import os
 import queue
+import resource
 import sys
 import threading
+import time
 from multiprocessing.queues import JoinableQueue
-from typing import Any, Callable, Union
+from typing import Any, Callable, List, Optional, Tuple, Union
+
+import attr
+from structlog import get_logger
 
 from .logging import multiprocessing_breakpoint
 
+logger = get_logger()
+
+
+class SchedulingPolicy(abc.ABC):
+    """Orders the tasks submitted to a pool."""
+
+    @abc.abstractmethod
+    def get_priority(self, args) -> Any:
+        """Priority of a task, tasks with lower priority are processed first.
+
+        Tasks with the same priority are processed in the order of submission.
+        """
+
+
+@attr.define(frozen=True)
+class FIFOPolicy(SchedulingPolicy):
+    def get_priority(self, args) -> Any:
+        return 0
+
+
+class PendingTasks:
+    """Tasks waiting to be processed, in the order of a scheduling policy."""
+
+    def __init__(self, policy: SchedulingPolicy):
+        self._policy = policy
+        self._heap: List[Tuple[Any, int, Any]] = []
+        self._counter = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def push(self, args):
+        priority = self._policy.get_priority(args)
+        heapq.heappush(self._heap, (priority, next(self._counter), args))
+
+    def pop(self):
+        return heapq.heappop(self._heap)[-1]
+
 
 class PoolBase(abc.ABC):
     @abc.abstractmethod
@@ -19,6 +64,10 @@ class PoolBase(abc.ABC):
     def process_until_done(self):
         pass
 
+    @abc.abstractmethod
+    def process_results(self, timeout: float):
+        pass
+
     def start(self):
         pass
 
@@ -48,14 +97,89 @@ class _Sentinel:
 _SENTINEL = _Sentinel
 
 
-def _worker_process(handler, input, output):
+@attr.define(frozen=True)
+class _Retired:
+    """Sent by a worker quitting after its last result, to be replaced."""
+
+    pid: int
+
+
+@attr.define(frozen=True)
+class _WorkerLimits:
+    """Workers exceeding a limit are retired after finishing their task."""
+
+    # 0 means unlimited
+    max_tasks: int = 0
+    # resident set size in bytes, including the memory shared with the parent
+    max_rss: int = 0
+
+    def is_exceeded(self, task_count: int) -> bool:
+        if self.max_tasks and task_count >= self.max_tasks:
+            return True
+        return bool(self.max_rss) and get_rss() > self.max_rss
+
+    def for_initialized_worker(self) -> "_WorkerLimits":
+        """Limits of a worker after initialization, without an RSS limit it exceeds.
+
+        Such a worker would be replaced after every task.
+        """
+        if not self.max_rss:
+            return self
+
+        rss = get_rss()
+        if rss <= self.max_rss:
+            return self
+
+        logger.warning(
+            "Worker exceeds the RSS limit after initialization, the limit is ignored",
+            rss=rss,
+            max_rss=self.max_rss,
+        )
+        return attr.evolve(self, max_rss=0)
+
+
+def get_rss() -> int:
+    """Current resident set size of the current process in bytes."""
+    try:
+        with open("/proc/self/statm") as statm:
+            resident_pages = int(statm.read().split()[1])
+    except OSError:
+        # without procfs, e.g. on macOS, only the peak is available
+        return _get_peak_rss()
+    return resident_pages * resource.getpagesize()
+
+
+def _get_peak_rss() -> int:
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+def _initialize_worker(initializer: Optional[Callable[[], Any]]):
+    if initializer is None:
+        return
+
+    start = time.perf_counter()
+    initializer()
+    logger.debug("Worker initialized", init_time=f"{time.perf_counter() - start:.3f}s")
+
+
+def _worker_process(handler, input, output, initializer, limits: _WorkerLimits):
     # Creates a new process group, making sure no signals are propagated from the main process to the worker processes.
     os.setpgrp()
 
     sys.breakpointhook = multiprocessing_breakpoint
+    _initialize_worker(initializer)
+    limits = limits.for_initialized_worker()
+    task_count = 0
     while (args := input.get()) is not _SENTINEL:
         result = handler(args)
         output.put(result)
+        task_count += 1
+        if limits.is_exceeded(task_count):
+            logger.debug("Retiring worker", task_count=task_count, rss=get_rss())
+            output.put(_Retired(os.getpid()))
+            return
     output.put(_SENTINEL)
 
 
@@ -66,22 +190,34 @@ class MultiPool(PoolBase):
         handler: Callable[[Any], Any],
         *,
         result_callback: Callable[["MultiPool", Any], Any],
+        initializer: Optional[Callable[[], Any]] = None,
+        scheduling_policy: Optional[SchedulingPolicy] = None,
+        max_tasks_per_worker: int = 0,
+        max_worker_rss: int = 0,
     ):
         if process_num <= 0:
             raise ValueError("At process_num must be greater than 0")
 
         self._result_callback = result_callback
+        # tasks are held here, and passed to the workers only as they can start them,
+        # so tasks submitted later can still be processed earlier
+        self._pending = PendingTasks(scheduling_policy or FIFOPolicy())
+        self._started_count = 0
         self._input = Queue(ctx=mp.get_context())
         self._output = mp.SimpleQueue()
-        self._procs = [
-            mp.Process(
-                target=_worker_process,
-                args=(handler, self._input, self._output),
-            )
-            for _ in range(process_num)
-        ]
+        self._worker_args = (
+            handler,
+            self._input,
+            self._output,
+            initializer,
+            _WorkerLimits(max_tasks_per_worker, max_worker_rss),
+        )
+        self._procs = [self._make_worker() for _ in range(process_num)]
         self._tid = threading.get_native_id()
 
+    def _make_worker(self) -> mp.Process:
+        return mp.Process(target=_worker_process, args=self._worker_args)
+
     def start(self):
         for p in self._procs:
             p.start()
@@ -109,7 +245,8 @@ class MultiPool(PoolBase):
         process_num = len(self._procs)
         while process_quit_count < process_num:
             result = self._output.get()
-            if result is _SENTINEL:
+            # retired workers quit without waiting for their sentinel
+            if result is _SENTINEL or isinstance(result, _Retired):
                 process_quit_count += 1
 
     def _wait_for_workers_to_quit(self):
@@ -122,34 +259,117 @@ class MultiPool(PoolBase):
                 "Submit can only be called from the same "
                 "thread/process where the pool is created"
             )
-        self._input.put(args)
+        self._pending.push(args)
+        self._feed_workers()
+
+    def _feed_workers(self):
+        # a task for every worker
+        while self._pending and self._started_count < len(self._procs):
+            self._started_count += 1
+            self._input.put(self._pending.pop())
 
     def process_until_done(self):
         while not self._input.is_empty():
-            result = self._output.get()
-            self._result_callback(self, result)
-            self._input.task_done()
+            self._process_result()
+
+    def process_results(self, timeout: float):
+        """Process the results arriving in timeout seconds.
+
+        Unlike process_until_done, it returns with tasks still being processed, so
+        tasks can be submitted between calls, not only from the result callback.
+        """
+        while not self._input.is_empty() and self._output._poll(timeout):  # type: ignore
+            self._process_result()
+            # only waiting for the first result
+            timeout = 0
+
+    def _process_result(self):
+        result = self._output.get()
+        if isinstance(result, _Retired):
+            # the result of its last task has already arrived
+            self._replace_worker(result.pid)
+            return
+        self._started_count -= 1
+        self._result_callback(self, result)
+        self._input.task_done()
+        self._feed_workers()
+
+    def _replace_worker(self, pid: int):
+        index = next(i for i, p in enumerate(self._procs) if p.pid == pid)
+        self._procs[index].join()
+        self._procs[index] = self._make_worker()
+        self._procs[index].start()
+        logger.debug("Worker replaced", retired_pid=pid, pid=self._procs[index].pid)
 
 
 class SinglePool(PoolBase):
-    def __init__(self, handler, *, result_callback):
+    def __init__(
+        self,
+        handler,
+        *,
+        result_callback,
+        initializer=None,
+        scheduling_policy=None,
+        max_tasks_per_worker=0,
+        max_worker_rss=0,
+    ):
+        # tasks are processed in this process, which can not be retired, so the
+        # worker limits are ignored
         self._handler = handler
         self._result_callback = result_callback
+        self._initializer = initializer
+        self._pending = PendingTasks(scheduling_policy or FIFOPolicy())
+
+    def start(self):
+        _initialize_worker(self._initializer)
 
     def submit(self, args):
-        result = self._handler(args)
-        self._result_callback(self, result)
+        self._pending.push(args)
 
     def process_until_done(self):
-        pass
+        while self._pending:
+            self._process_task()
+
+    def process_results(self, timeout: float):
+        # tasks are processed here, one at a time
+        if self._pending:
+            self._process_task()
+
+    def _process_task(self):
+        result = self._handler(self._pending.pop())
+        self._result_callback(self, result)
 
 
-def make_pool(process_num, handler, result_callback) -> Union[SinglePool, MultiPool]:
+def make_pool(
+    process_num,
+    handler,
+    result_callback,
+    initializer=None,
+    scheduling_policy: Optional[SchedulingPolicy] = None,
+    max_tasks_per_worker: int = 0,
+    max_worker_rss: int = 0,
+) -> Union[SinglePool, MultiPool]:
+    """Create a pool, initializer is called in every worker before any task.
+
+    Worker processes are replaced after max_tasks_per_worker tasks, or when their
+    resident set size exceeds max_worker_rss bytes after a task, 0 means unlimited.
+    """
     if process_num == 1:
-        return SinglePool(handler=handler, result_callback=result_callback)
+        return SinglePool(
+            handler=handler,
+            result_callback=result_callback,
+            initializer=initializer,
+            scheduling_policy=scheduling_policy,
+            max_tasks_per_worker=max_tasks_per_worker,
+            max_worker_rss=max_worker_rss,
+        )
 
     return MultiPool(
         process_num=process_num,
         handler=handler,
         result_callback=result_callback,
+        initializer=initializer,
+        scheduling_policy=scheduling_policy,
+        max_tasks_per_worker=max_tasks_per_worker,
+        max_worker_rss=max_worker_rss,
     )
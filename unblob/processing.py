@@ -1,9 +1,25 @@
+import contextlib
+import copy
 import multiprocessing
+import os
 import shutil
 import statistics
-from operator import attrgetter
+import tempfile
+from fnmatch import fnmatch
+from functools import partial
 from pathlib import Path
-from typing import Iterable, List, Optional
+from typing import (
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
 
 import attr
 import magic
@@ -12,36 +28,68 @@ from structlog import get_logger
 
 from unblob.handlers import BUILTIN_HANDLERS, Handlers
 
-from .extractor import carve_unknown_chunk, carve_valid_chunk, fix_extracted_directory
+from .budget import (
+    ExtractionBudget,
+    ExtractionBudgetExceeded,
+    ExtractionGuard,
+    guard_extraction,
+)
+from .dedup import DedupRegistry
+from .extractor import (
+    carve_unknown_chunk,
+    carve_valid_chunk,
+    fix_extracted_directory,
+    get_valid_chunk_filename,
+    is_chunk_window_supported,
+    open_valid_chunk_window,
+    remove_extracted_directory,
+)
+from .extractors import DecompressorExtractor
 from .file_utils import iterate_file, valid_path
-from .finder import search_chunks
-from .iter_utils import pairwise
+from .finder import (
+    CandidateThrottling,
+    get_handlers_fingerprint,
+    prepare_search,
+    search_chunks,
+)
+from .limits import ResourceLimits, WatchdogTimeout, limit_resources, watchdog
 from .logging import noformat
 from .math import shannon_entropy
 from .models import (
+    ChunkIndex,
+    ExtractChunkTask,
     ExtractError,
     File,
+    Handler,
     ProcessResult,
     Task,
     TaskResult,
     UnknownChunk,
     ValidChunk,
 )
-from .pool import make_pool
+from .pool import FIFOPolicy, PendingTasks, SchedulingPolicy, make_pool
 from .report import (
+    DuplicateFileReport,
     ExtractDirectoryExistsReport,
+    ExtractTimeoutReport,
     FileMagicReport,
     HashReport,
     Report,
     StatReport,
     UnknownError,
 )
+from .result_cache import CachedChunk, ResultCache, get_result_key
 from .signals import terminate_gracefully
+from .spill import SpillCache, configure_spill_cache, evict_spill, get_spill_cache
 
 logger = get_logger()
 
 DEFAULT_DEPTH = 10
 DEFAULT_PROCESS_NUM = multiprocessing.cpu_count()
+DEFAULT_SEGMENTED_SCAN_THRESHOLD = 512 * 1024 * 1024
+DEFAULT_MAX_CHUNK_WINDOW_SIZE = 128 * 1024 * 1024
+DEFAULT_SPILL_CACHE_SIZE = 256 * 1024 * 1024
+DEFAULT_RESULT_CACHE_SIZE = 64 * 1024 * 1024
 DEFAULT_SKIP_MAGIC = (
     "BFLT",
     "JPEG",
@@ -64,6 +112,34 @@ DEFAULT_SKIP_MAGIC = (
 )
 
 
+def _get_task(args) -> Task:
+    # tasks of inputs processed together are submitted with their input and config
+    return args[-1] if isinstance(args, tuple) else args
+
+
+@attr.define(frozen=True)
+class LargestFirstPolicy(SchedulingPolicy):
+    """Bigger files and chunks first, so they are not processed alone at the end."""
+
+    def get_priority(self, args) -> int:
+        return -_get_task(args).size_hint
+
+
+@attr.define(frozen=True)
+class DepthFirstPolicy(SchedulingPolicy):
+    """Deeper files first, finishing the extraction of a file before the next one."""
+
+    def get_priority(self, args) -> int:
+        return -_get_task(args).depth
+
+
+SCHEDULING_POLICIES: Dict[str, Type[SchedulingPolicy]] = {
+    "fifo": FIFOPolicy,
+    "largest-first": LargestFirstPolicy,
+    "depth-first": DepthFirstPolicy,
+}
+
+
 @attr.define(kw_only=True)
 class ExtractionConfig:
     extract_root: Path = attr.field(converter=lambda value: value.resolve())
@@ -76,6 +152,56 @@ class ExtractionConfig:
     keep_extracted_chunks: bool = False
     extract_suffix: str = "_extract"
     handlers: Handlers = BUILTIN_HANDLERS
+    cache_dir: Optional[Path] = None
+    # chunks found in files are cached in cache_dir across runs up to this total size
+    # of their serialized chunk lists, 0 disables it
+    result_cache_size: int = DEFAULT_RESULT_CACHE_SIZE
+    # files bigger than this are scanned for chunks in process_num parallel segments
+    segmented_scan_threshold: int = DEFAULT_SEGMENTED_SCAN_THRESHOLD
+    # with more than 1, chunks are calculated for pattern matches in parallel processes
+    calculate_chunk_process_num: int = 1
+    # limits chunk calculation for handlers mostly matching false positives
+    candidate_throttling: Optional[CandidateThrottling] = None
+    # chunks up to this size are extracted from memory instead of carving them to
+    # disk, when their carved files are not kept, 0 disables it
+    max_chunk_window_size: int = DEFAULT_MAX_CHUNK_WINDOW_SIZE
+    # files with the same content as an already processed file are not processed
+    skip_duplicates: bool = False
+    # decompressed contents of chunks are kept up to this total size while their
+    # chunks are calculated, for their extraction to reuse, 0 disables it
+    spill_cache_size: int = DEFAULT_SPILL_CACHE_SIZE
+    # extract compressed streams with external commands, instead of in process
+    external_decompressors: bool = False
+    # the order of processing the tasks waiting for a worker
+    scheduling_policy: SchedulingPolicy = attr.field(factory=FIFOPolicy)
+    # extracted files are deleted as soon as all the tasks processing them are done,
+    # except for the ones matching a keep pattern (relative to extract_root)
+    cleanup_extracted: bool = False
+    keep_patterns: Iterable[str] = ()
+    # limits of the total size and number of the files extracted under extract_root,
+    # extraction of chunks exceeding them is stopped, 0 means unlimited
+    max_extracted_size: int = 0
+    max_extracted_files: int = 0
+    # seconds a chunk extraction can run, overridden for handlers by their NAME in
+    # handler_timeouts, 0 means unlimited
+    extract_timeout: float = 0
+    handler_timeouts: Dict[str, float] = attr.field(factory=dict)
+    # seconds calculate_chunk can run for a pattern match, 0 means unlimited
+    calculate_chunk_timeout: float = 0
+    # limits of the address space and CPU time of extract commands
+    extractor_limits: ResourceLimits = attr.field(factory=ResourceLimits)
+    # worker processes are replaced after this many tasks, or when their resident
+    # set size exceeds this many bytes after a task, 0 means unlimited
+    max_tasks_per_worker: int = 0
+    max_worker_rss: int = 0
+    # magic prefix -> handlers searching for chunks in files with matching magic,
+    # instead of all handlers, the first matching prefix is used
+    handler_routes: Dict[str, Handlers] = attr.field(
+        factory=dict,
+        converter=lambda routes: {
+            prefix: tuple(handlers) for prefix, handlers in routes.items()
+        },
+    )
 
     def get_extract_dir_for(self, path: Path) -> Path:
         """Extraction dir under root with the name of path."""
@@ -88,6 +214,16 @@ class ExtractionConfig:
         extract_dir = self.extract_root / relative_path.with_name(extract_name)
         return extract_dir.expanduser().resolve()
 
+    def get_extract_timeout(self, handler_name: str) -> float:
+        return self.handler_timeouts.get(handler_name, self.extract_timeout)
+
+    def get_handlers_for(self, magic: str) -> Handlers:
+        """Handlers to search for chunks in a file with magic."""
+        for prefix, handlers in self.handler_routes.items():
+            if magic.startswith(prefix):
+                return handlers
+        return self.handlers
+
 
 @terminate_gracefully
 def process_file(
@@ -120,19 +256,287 @@ def process_file(
     return process_result
 
 
+@attr.define(frozen=True)
+class BatchInput:
+    path: Path
+    # root of the extraction of this input, instead of config.extract_root
+    extract_root: Path
+    report_file: Optional[Path] = None
+
+
+@terminate_gracefully
+def process_files(
+    config: ExtractionConfig, inputs: Sequence[BatchInput]
+) -> List[ProcessResult]:
+    """Process inputs with one pool of workers, like process_file processes each.
+
+    Workers are started and prepared once for all inputs, and the tasks of the
+    inputs are processed in turns, so an input is not waiting for all the tasks of
+    the inputs before it.  Reports are written as inputs are done.
+    """
+    for batch_input in inputs:
+        if not batch_input.path.is_file():
+            raise ValueError("input path is not a file", batch_input.path)
+
+    runs = [InputRun(config, batch_input) for batch_input in inputs]
+    with shared_run_state(config) as run_state:
+        processor = Processor(config, run_state)
+        _run_batch(config, runs, MultiInputProcessor(processor))
+
+    return [run.result for run in runs]
+
+
+def _run_batch(
+    config: ExtractionConfig, runs: List["InputRun"], processor: "MultiInputProcessor"
+):
+    # keeping every worker busy, while tasks of later inputs can be submitted between
+    # the tasks of earlier ones
+    scheduler = FairScheduler(2 * config.process_num, config.scheduling_policy)
+    for index, run in enumerate(runs):
+        task = run.start()
+        if task is not None:
+            scheduler.add(index, (index, run.config, None, task))
+
+    def process_result(pool, item):
+        index, result = item
+        scheduler.task_done()
+        run = runs[index]
+        for new_task in run.register(result):
+            scheduler.add(index, (index, run.config, None, new_task))
+        scheduler.submit_tasks(pool)
+
+    pool = make_pool(
+        process_num=config.process_num,
+        handler=processor.process_task,
+        result_callback=process_result,
+        initializer=processor.prepare,
+        scheduling_policy=config.scheduling_policy,
+        max_tasks_per_worker=config.max_tasks_per_worker,
+        max_worker_rss=config.max_worker_rss,
+    )
+
+    with pool:
+        scheduler.submit_tasks(pool)
+        pool.process_until_done()
+
+
+class InputRun:
+    """Progress of processing an input in a pool shared with other inputs."""
+
+    def __init__(self, config: ExtractionConfig, batch_input: BatchInput):
+        self.config = attr.evolve(config, extract_root=batch_input.extract_root)
+        self.input = batch_input
+        self.result = ProcessResult()
+        self._chunk_extractions = _ChunkExtractions()
+        self._cleanup: Optional[_ExtractionCleanup] = None
+        self._task_count = 0
+        self.cancelled = False
+        self.done = False
+
+    def start(self) -> Optional[Task]:
+        """Prepare processing, returns the root task, or None if it is not processed."""
+        task = Task(
+            chunk_id="",
+            path=self.input.path,
+            depth=0,
+            size_hint=self.input.path.stat().st_size,
+        )
+        errors = prepare_extract_dir(self.config, self.input.path)
+        if not prepare_report_file(self.config, self.input.report_file):
+            logger.error(
+                "File not processed, as report could not be written",
+                file=self.input.path,
+            )
+            self.done = True
+            return None
+
+        if errors:
+            self.result.register(TaskResult(task, errors))
+            self._finish()
+            return None
+
+        logger.info("Start processing file", file=self.input.path)
+        self._task_count = 1
+        if self.config.cleanup_extracted:
+            self._cleanup = _ExtractionCleanup(self.config, task)
+        return task
+
+    def register(self, result: TaskResult) -> List[Task]:
+        """Register the result of a task, returns the new tasks to process."""
+        # tasks of cancelled runs are not processed
+        subtasks = [] if self.cancelled else list(result.subtasks)
+        if self._cleanup is not None:
+            self._cleanup.register(result, subtasks)
+        if isinstance(result.task, ExtractChunkTask):
+            self._chunk_extractions.register(result)
+        else:
+            self._chunk_extractions.expect(result)
+            self.result.register(result)
+
+        self._task_count += len(subtasks) - 1
+        if not self._task_count:
+            self._finish()
+        return subtasks
+
+    def cancel(self, discarded_task_count: int):
+        """Stop processing, after the tasks already submitted are done.
+
+        discarded_task_count is the number of tasks returned by register, but not
+        submitted.
+        """
+        logger.info("Cancelling processing file", file=self.input.path)
+        self.cancelled = True
+        self._task_count -= discarded_task_count
+        if not self._task_count:
+            self._finish()
+
+    def _finish(self):
+        self.done = True
+        logger.info("Finished processing file", file=self.input.path)
+        if self.input.report_file:
+            write_json_report(self.input.report_file, self.result)
+
+
+class FairScheduler:
+    """Submits the tasks of several inputs to a pool in turns.
+
+    At most limit tasks are submitted at once, the rest are waiting in a queue per
+    input, ordered by policy, and the next task is taken from the input after the
+    last one served.
+    """
+
+    def __init__(self, limit: int, policy: SchedulingPolicy):
+        self._limit = limit
+        self._policy = policy
+        # in the order of the inputs to be served
+        self._pending: Dict[Hashable, PendingTasks] = {}
+        self._submitted_count = 0
+
+    def add(self, key: Hashable, args):
+        if key not in self._pending:
+            self._pending[key] = PendingTasks(self._policy)
+        self._pending[key].push(args)
+
+    def discard(self, key: Hashable) -> int:
+        """Drop the tasks of key not submitted yet, returns their number."""
+        return len(self._pending.pop(key, ()))
+
+    def task_done(self):
+        self._submitted_count -= 1
+
+    def is_idle(self) -> bool:
+        return not self._submitted_count and not self._pending
+
+    def submit_tasks(self, pool):
+        while self._submitted_count < self._limit and self._pending:
+            key = next(iter(self._pending))
+            # the input moves to the end of the line
+            pending = self._pending.pop(key)
+            args = pending.pop()
+            if pending:
+                self._pending[key] = pending
+            self._submitted_count += 1
+            pool.submit(args)
+
+
+class MultiInputProcessor:
+    """Processes tasks of several inputs, each with the config of its input.
+
+    Inputs can have their own RunState, otherwise they share the one of processor.
+    """
+
+    def __init__(self, processor: "Processor"):
+        self._processor = processor
+
+    def prepare(self):
+        self._processor.prepare()
+
+    def process_task(
+        self, args: Tuple[Hashable, ExtractionConfig, Optional["RunState"], Task]
+    ) -> Tuple[Hashable, TaskResult]:
+        index, config, run_state, task = args
+        processor = self._processor.with_config(config, run_state)
+        return index, processor.process_task(task)
+
+
 def _process_task(config: ExtractionConfig, task: Task) -> ProcessResult:
-    processor = Processor(config)
+    with shared_run_state(config) as run_state:
+        processor = Processor(config, run_state)
+        return _run_processor(config, task, processor)
+
+
+@attr.define(frozen=True)
+class RunState:
+    """State shared by the workers during the run."""
+
+    spill_cache: Optional[SpillCache] = None
+    dedup_registry: Optional[DedupRegistry] = None
+    budget: Optional[ExtractionBudget] = None
+
+
+@contextlib.contextmanager
+def shared_run_state(
+    config: ExtractionConfig, *, with_spill_cache: bool = True
+) -> Iterator[RunState]:
+    with tempfile.TemporaryDirectory(prefix="unblob-run-") as run_dir:
+
+        def make_dir(name: str) -> Path:
+            path = Path(run_dir, name)
+            path.mkdir()
+            return path
+
+        spill_cache = None
+        if with_spill_cache and config.spill_cache_size:
+            spill_cache = SpillCache(make_dir("spill"), config.spill_cache_size)
+
+        dedup_registry = None
+        if config.skip_duplicates:
+            dedup_registry = DedupRegistry(make_dir("dedup"))
+
+        budget = None
+        if config.max_extracted_size or config.max_extracted_files:
+            budget = ExtractionBudget(
+                make_dir("budget"),
+                config.max_extracted_size,
+                config.max_extracted_files,
+            )
+
+        try:
+            yield RunState(spill_cache, dedup_registry, budget)
+        finally:
+            # the cache is configured in this process too, when using a SinglePool
+            if spill_cache is not None:
+                configure_spill_cache(None)
+
+
+def _run_processor(
+    config: ExtractionConfig, task: Task, processor: "Processor"
+) -> ProcessResult:
     aggregated_result = ProcessResult()
+    chunk_extractions = _ChunkExtractions()
+    cleanup = _ExtractionCleanup(config, task) if config.cleanup_extracted else None
 
     def process_result(pool, result):
-        for new_task in result.subtasks:
+        subtasks = list(result.subtasks)
+        if cleanup is not None:
+            cleanup.register(result)
+        if isinstance(result.task, ExtractChunkTask):
+            chunk_extractions.register(result)
+        else:
+            chunk_extractions.expect(result)
+            aggregated_result.register(result)
+
+        for new_task in subtasks:
             pool.submit(new_task)
-        aggregated_result.register(result)
 
     pool = make_pool(
         process_num=config.process_num,
         handler=processor.process_task,
         result_callback=process_result,
+        initializer=processor.prepare,
+        scheduling_policy=config.scheduling_policy,
+        max_tasks_per_worker=config.max_tasks_per_worker,
+        max_worker_rss=config.max_worker_rss,
     )
 
     with pool:
@@ -142,6 +546,120 @@ def _process_task(config: ExtractionConfig, task: Task) -> ProcessResult:
     return aggregated_result
 
 
+class _ExtractionCleanup:
+    """Deletes extracted files, as soon as the tasks processing them are done.
+
+    Tasks are tracked in a tree, with the subtasks of the results.  When all the
+    tasks under an extraction directory are done, the files in it not matching the
+    keep patterns are deleted, with the directories left empty.
+    """
+
+    def __init__(self, config: ExtractionConfig, root_task: Task):
+        self._config = config
+        self._keep_patterns = list(config.keep_patterns)
+        self._parents: Dict[Task, Optional[Task]] = {root_task: None}
+        # number of tasks not done in the subtree of a task, including itself
+        self._remaining: Dict[Task, int] = {root_task: 1}
+        self._directories: Dict[Task, Path] = {}
+
+    def register(self, result: TaskResult, subtasks: Optional[List[Task]] = None):
+        """Register result, with the subtasks to be processed, all by default."""
+        task = result.task
+        if subtasks is None:
+            subtasks = list(result.subtasks)
+
+        if isinstance(task, ExtractChunkTask):
+            # the extraction directory of the chunk
+            for subtask in subtasks:
+                self._directories[subtask] = subtask.path
+        elif any(isinstance(t, ExtractChunkTask) for t in subtasks):
+            # the directory of the carved chunks of the file
+            self._directories[task] = self._config.get_extract_dir_for(task.path)
+
+        for subtask in subtasks:
+            self._parents[subtask] = task
+            self._remaining[subtask] = 1
+        self._remaining[task] += len(subtasks)
+        self._task_done(task)
+
+    def _task_done(self, task: Optional[Task]):
+        while task is not None:
+            self._remaining[task] -= 1
+            if self._remaining[task]:
+                return
+            del self._remaining[task]
+            directory = self._directories.pop(task, None)
+            if directory is not None:
+                # the extraction directory of the input is kept
+                self._remove_files(directory, remove_directory=task.depth > 0)
+            task = self._parents.pop(task)
+
+    def _remove_files(self, directory: Path, remove_directory: bool):
+        logger.debug("Removing extracted files", path=directory)
+        for root, dirs, files in os.walk(directory, topdown=False):
+            for name in files + [d for d in dirs if Path(root, d).is_symlink()]:
+                path = Path(root, name)
+                if not self._is_kept(path):
+                    _remove(path, os.unlink)
+            if (remove_directory or root != str(directory)) and not os.listdir(root):
+                _remove(Path(root), os.rmdir)
+
+    def _is_kept(self, path: Path) -> bool:
+        try:
+            relative_path = str(path.relative_to(self._config.extract_root))
+        except ValueError:
+            return False
+        return any(fnmatch(relative_path, pattern) for pattern in self._keep_patterns)
+
+
+def _remove(path: Path, remove: Callable):
+    try:
+        remove(path)
+    except OSError as e:
+        logger.warning("Can not remove extracted file", path=path, msg=str(e))
+
+
+@attr.define
+class _PendingChunkExtractions:
+    file_result: TaskResult
+    tasks: List[ExtractChunkTask]
+    results: Dict[ExtractChunkTask, TaskResult] = attr.field(factory=dict)
+
+
+class _ChunkExtractions:
+    """Merges the results of chunk extractions into the result of their file.
+
+    The file result is completed when all of its chunks are extracted, as if they
+    were extracted in the file task in chunk order.
+    """
+
+    def __init__(self):
+        self._pending: Dict[Task, _PendingChunkExtractions] = {}
+
+    def expect(self, file_result: TaskResult):
+        tasks = [t for t in file_result.subtasks if isinstance(t, ExtractChunkTask)]
+        if tasks:
+            self._pending[file_result.task] = _PendingChunkExtractions(
+                file_result, tasks
+            )
+
+    def register(self, result: TaskResult):
+        assert isinstance(result.task, ExtractChunkTask)
+        pending = self._pending[result.task.file_task]
+        pending.results[result.task] = result
+        if len(pending.results) < len(pending.tasks):
+            return
+
+        del self._pending[result.task.file_task]
+        file_result = pending.file_result
+        file_result.subtasks = [
+            t for t in file_result.subtasks if not isinstance(t, ExtractChunkTask)
+        ]
+        for task in pending.tasks:
+            file_result.reports.extend(pending.results[task].reports)
+            file_result.subtasks.extend(pending.results[task].subtasks)
+
+
 def prepare_extract_dir(config: ExtractionConfig, input_file: Path) -> List[Report]:
     errors = []
 
@@ -209,8 +727,19 @@ def write_json_report(report_file: Path, process_result: ProcessResult):
 
 
 class Processor:
-    def __init__(self, config: ExtractionConfig):
+    def __init__(
+        self,
+        config: ExtractionConfig,
+        run_state: Optional[RunState] = None,
+    ):
         self._config = config
+        run_state = run_state or RunState()
+        self._spill_cache = run_state.spill_cache
+        self._dedup_registry = run_state.dedup_registry
+        self._budget = run_state.budget
+        self._result_cache = None
+        if config.cache_dir is not None and config.result_cache_size:
+            self._result_cache = ResultCache(config.cache_dir, config.result_cache_size)
         # libmagic helpers
         # file magic uses a rule-set to guess the file type, however as rules are added they could
         # shadow each other. File magic uses rule priorities to determine which is the best matching
@@ -221,11 +750,50 @@ class Processor:
         # accuracy by no shadowing rules.
         self._get_magic = magic.Magic(keep_going=True).from_file
         self._get_mime_type = magic.Magic(mime=True).from_file
+        self._handlers_by_name = {
+            handler.NAME: handler
+            for handlers in [config.handlers, *config.handler_routes.values()]
+            for handler in handlers
+        }
+
+    def with_config(
+        self, config: ExtractionConfig, run_state: Optional[RunState] = None
+    ) -> "Processor":
+        """Processor sharing the state of this one, processing tasks with config.
+
+        config can differ in where files are extracted, but not in the handlers.
+        The dedup registry and the budget of run_state are used instead of the
+        ones of this processor, if given, the spill cache is set up by prepare.
+        """
+        processor = copy.copy(self)
+        processor._config = config
+        if run_state is not None:
+            processor._dedup_registry = run_state.dedup_registry
+            processor._budget = run_state.budget
+        return processor
+
+    def prepare(self):
+        """Build pattern databases and scratch space before processing any task."""
+        configure_spill_cache(self._spill_cache)
+        # big files are scanned in process_num segments
+        all_handlers = [self._config.handlers, *self._config.handler_routes.values()]
+        for handlers in dict.fromkeys(all_handlers):
+            prepare_search(
+                handlers,
+                cache_dir=self._config.cache_dir,
+                segment_count=self._config.process_num,
+            )
 
     def process_task(self, task: Task) -> TaskResult:
         result = TaskResult(task)
         try:
-            self._process_task(result, task)
+            if isinstance(task, ExtractChunkTask):
+                handler = self._handlers_by_name[task.handler_name]
+                _ExtractChunkTask(
+                    self._config, task, handler, result, budget=self._budget
+                ).process()
+            else:
+                self._process_task(result, task)
         except Exception as exc:
             self._process_error(result, exc)
         return result
@@ -252,14 +820,16 @@ class Processor:
 
         if stat_report.is_dir:
             log.debug("Found directory")
-            for path in task.path.iterdir():
-                result.add_subtask(
-                    Task(
-                        chunk_id=task.chunk_id,
-                        path=path,
-                        depth=task.depth,
+            with os.scandir(task.path) as entries:
+                for entry in entries:
+                    result.add_subtask(
+                        Task(
+                            chunk_id=task.chunk_id,
+                            path=task.path / entry.name,
+                            depth=task.depth,
+                            size_hint=get_entry_size(entry),
+                        )
                     )
-                )
             return
 
         if not stat_report.is_file:
@@ -278,19 +848,63 @@ class Processor:
         hash_report = HashReport.from_path(task.path)
         result.add_report(hash_report)
 
-        if stat_report.size == 0:
-            log.debug("Ignoring empty file")
+        if self._should_skip_file(task, stat_report.size, magic):
             return
 
+        if self._is_duplicate(result, task, hash_report.sha256):
+            return
+
+        handlers = self._get_handlers(task, magic)
+        _FileTask(
+            self._config,
+            task,
+            stat_report.size,
+            handlers,
+            result,
+            digest=hash_report.sha256,
+            result_cache=self._result_cache,
+        ).process()
+
+    def _should_skip_file(self, task: Task, size: int, magic: str) -> bool:
+        log = logger.bind(path=task.path)
+
+        if size == 0:
+            log.debug("Ignoring empty file")
+            return True
+
         should_skip_file = any(
             magic.startswith(pattern) for pattern in self._config.skip_magic
         )
 
         if should_skip_file:
             log.debug("Ignoring file based on magic", magic=magic)
-            return
+            return True
+
+        return False
+
+    def _is_duplicate(self, result: TaskResult, task: Task, digest: str) -> bool:
+        if self._dedup_registry is None:
+            return False
 
-        _FileTask(self._config, task, stat_report.size, result).process()
+        original_path = self._dedup_registry.register(digest, task.path)
+        if original_path is None:
+            return False
+
+        logger.debug("Skipping duplicate file", path=task.path, original=original_path)
+        result.add_report(DuplicateFileReport(original_path=original_path))
+        return True
+
+    def _get_handlers(self, task: Task, magic: str) -> Handlers:
+        handlers = self._config.get_handlers_for(magic)
+        if handlers is not self._config.handlers:
+            logger.debug(
+                "Searching chunks with handlers routed by magic",
+                path=task.path,
+                magic=magic,
+                handlers=[handler.NAME for handler in handlers],
+                _verbosity=2,
+            )
+        return handlers
 
 
 class _FileTask:
@@ -299,12 +913,18 @@ class _FileTask:
         config: ExtractionConfig,
         task: Task,
         size: int,
+        handlers: Handlers,
         result: TaskResult,
+        digest: str = "",
+        result_cache: Optional[ResultCache] = None,
     ):
         self.config = config
         self.task = task
         self.size = size
+        self.handlers = handlers
         self.result = result
+        self.digest = digest
+        self.result_cache = result_cache
 
         self.carve_dir = config.get_extract_dir_for(self.task.path)
 
@@ -312,10 +932,7 @@ class _FileTask:
         logger.debug("Processing file", path=self.task.path, size=self.size)
 
         with File.from_path(self.task.path) as file:
-            all_chunks = search_chunks(
-                file, self.size, self.config.handlers, self.result
-            )
-            outer_chunks = remove_inner_chunks(all_chunks)
+            outer_chunks = self._get_outer_chunks(file)
             unknown_chunks = calculate_unknown_chunks(outer_chunks, self.size)
 
             if outer_chunks or unknown_chunks:
@@ -325,12 +942,82 @@ class _FileTask:
                 # calculate entropy for whole files which produced no valid chunks
                 self._calculate_entropy(self.task.path)
 
-        self._ensure_root_extract_dir()
+        # whole file chunks are extracted into the root extraction directory by their
+        # chunk task, which can not extract into an existing directory
+        is_whole_file_chunk = not unknown_chunks and len(outer_chunks) == 1
+        if not is_whole_file_chunk:
+            ensure_root_extract_dir(self.task, self.carve_dir)
+
+    def _get_outer_chunks(self, file: File) -> ChunkIndex[ValidChunk]:
+        result_key = self._get_result_key()
+        if result_key is not None:
+            chunks = self._load_cached_chunks(result_key)
+            if chunks is not None:
+                logger.debug("Using cached chunks", path=self.task.path)
+                return chunks
+
+        report_count = len(self.result.reports)
+        all_chunks = search_chunks(
+            file,
+            self.size,
+            self.handlers,
+            self.result,
+            cache_dir=self.config.cache_dir,
+            segment_count=self._get_scan_segment_count(),
+            calculate_chunk_process_num=self.config.calculate_chunk_process_num,
+            throttling=self.config.candidate_throttling,
+            calculate_chunk_timeout=self.config.calculate_chunk_timeout,
+        )
+        outer_chunks = remove_inner_chunks(all_chunks)
+        evict_dropped_spills(all_chunks, outer_chunks)
+
+        # searches with reports are done again, so their reports are not lost
+        if result_key is not None and len(self.result.reports) == report_count:
+            assert self.result_cache is not None
+            cached_chunks: List[CachedChunk] = [
+                (c.start_offset, c.end_offset, c.handler.NAME, c.is_encrypted)
+                for c in outer_chunks
+            ]
+            self.result_cache.put(result_key, cached_chunks)
+
+        return outer_chunks
+
+    def _get_result_key(self) -> Optional[str]:
+        if self.result_cache is None or not self.digest:
+            return None
+        search_fingerprint = "/".join(
+            [
+                get_handlers_fingerprint(self.handlers),
+                repr(self.config.candidate_throttling),
+            ]
+        )
+        return get_result_key(self.digest, search_fingerprint)
+
+    def _load_cached_chunks(self, result_key: str) -> Optional[ChunkIndex[ValidChunk]]:
+        assert self.result_cache is not None
+        cached_chunks = self.result_cache.get(result_key)
+        if cached_chunks is None:
+            return None
+
+        handlers_by_name = {handler.NAME: handler for handler in self.handlers}
+        chunks = []
+        for start_offset, end_offset, handler_name, is_encrypted in cached_chunks:
+            if handler_name not in handlers_by_name:
+                return None
+            chunk = ValidChunk(start_offset, end_offset, is_encrypted=is_encrypted)
+            chunk.handler = handlers_by_name[handler_name]()
+            chunks.append(chunk)
+        return ChunkIndex(chunks)
+
+    def _get_scan_segment_count(self) -> int:
+        if self.size > self.config.segmented_scan_threshold:
+            return self.config.process_num
+        return 1
 
     def _process_chunks(
         self,
         file: File,
-        outer_chunks: List[ValidChunk],
+        outer_chunks: Iterable[ValidChunk],
         unknown_chunks: List[UnknownChunk],
     ):
         if unknown_chunks:
@@ -342,38 +1029,144 @@ class _FileTask:
             self.result.add_report(chunk.as_report())
 
         for chunk in outer_chunks:
-            self._extract_chunk(file, chunk)
-
-    def _ensure_root_extract_dir(self):
-        # ensure that the root extraction directory is created even for empty extractions
-        if self.task.depth == 0:
-            self.carve_dir.mkdir(parents=True, exist_ok=True)
+            self.result.add_subtask(
+                ExtractChunkTask(
+                    path=self.task.path,
+                    depth=self.task.depth,
+                    chunk_id=chunk.id,
+                    file_task=self.task,
+                    start_offset=chunk.start_offset,
+                    end_offset=chunk.end_offset,
+                    handler_name=chunk.handler.NAME,
+                    is_encrypted=chunk.is_encrypted,
+                    spill_path=chunk.spill_path,
+                    size_hint=chunk.size,
+                )
+            )
 
     def _calculate_entropy(self, path: Path):
         if self.task.depth < self.config.entropy_depth:
             calculate_entropy(path, draw_plot=self.config.entropy_plot)
 
-    def _extract_chunk(self, file, chunk: ValidChunk):
-        is_whole_file_chunk = chunk.start_offset == 0 and chunk.end_offset == self.size
 
-        skip_carving = is_whole_file_chunk
-        if skip_carving:
-            inpath = self.task.path
-            extract_dir = self.carve_dir
-            carved_path = None
+class _ExtractChunkTask:
+    def __init__(
+        self,
+        config: ExtractionConfig,
+        task: ExtractChunkTask,
+        handler: Type[Handler],
+        result: TaskResult,
+        budget: Optional[ExtractionBudget] = None,
+    ):
+        self.config = config
+        self.task = task
+        self.result = result
+        self.budget = budget
+
+        self.chunk = ValidChunk(
+            start_offset=task.start_offset,
+            end_offset=task.end_offset,
+            id=task.chunk_id,
+            is_encrypted=task.is_encrypted,
+            spill_path=task.spill_path,
+        )
+        self.chunk.handler = handler()
+        self.carve_dir = config.get_extract_dir_for(self.task.path)
+
+        extractor = self.chunk.handler.EXTRACTOR
+        if (
+            config.external_decompressors
+            and isinstance(extractor, DecompressorExtractor)
+            and extractor.fallback is not None
+        ):
+            # set on the instance, handler classes are shared by every task
+            self.chunk.handler.EXTRACTOR = extractor.fallback
+
+    def process(self):
+        chunk = self.chunk
+        size = self.task.path.stat().st_size
+        try:
+            if chunk.start_offset == 0 and chunk.end_offset == size:
+                self._extract_whole_file()
+            else:
+                self._extract_chunk()
+        finally:
+            spill_cache = get_spill_cache()
+            if spill_cache is not None:
+                spill_cache.evict(chunk.id)
+
+    def _extract_whole_file(self):
+        chunk = self.chunk
+        if chunk.can_extract_from_file():
+            # extracted from the file, so spilled decompressed content can be reused
+            with File.from_path(self.task.path) as file:
+                filename = self.task.path.name
+                extract = partial(
+                    chunk.extract_from_file, file, filename, self.carve_dir
+                )
+                self._extract(extract, self.carve_dir)
         else:
-            inpath = carve_valid_chunk(self.carve_dir, file, chunk)
-            extract_dir = self.carve_dir / (inpath.name + self.config.extract_suffix)
-            carved_path = inpath
+            extract = partial(chunk.extract, self.task.path, self.carve_dir)
+            self._extract(extract, self.carve_dir)
+        ensure_root_extract_dir(self.task, self.carve_dir)
+
+    def _extract_chunk(self):
+        chunk = self.chunk
+        filename = get_valid_chunk_filename(chunk)
+        extract_dir = self.carve_dir / (filename + self.config.extract_suffix)
+        with File.from_path(self.task.path) as file:
+            if not self._can_extract_without_carving():
+                carved_path = carve_valid_chunk(self.carve_dir, file, chunk)
+                extract = partial(chunk.extract, carved_path, extract_dir)
+                self._extract(extract, extract_dir, carved_path)
+                return
+
+            if chunk.can_extract_from_file():
+                extract = partial(chunk.extract_from_file, file, filename, extract_dir)
+                extracted = self._extract(extract, extract_dir)
+            else:
+                with open_valid_chunk_window(file, chunk) as inpath:
+                    extract = partial(chunk.extract, inpath, extract_dir)
+                    extracted = self._extract(extract, extract_dir)
+
+            if not extracted:
+                # problematic chunks are kept for further analysis
+                carve_valid_chunk(self.carve_dir, file, chunk)
+
+    def _can_extract_without_carving(self) -> bool:
+        if self.config.keep_extracted_chunks:
+            return False
+        if self.chunk.can_extract_from_file():
+            return True
+        return (
+            self.chunk.size <= self.config.max_chunk_window_size
+            and is_chunk_window_supported()
+        )
 
+    def _extract(
+        self,
+        extract: Callable[[], None],
+        extract_dir: Path,
+        carved_path: Optional[Path] = None,
+    ) -> bool:
+        """Run extract into extract_dir, returns whether the extraction succeeded."""
+        chunk = self.chunk
         extraction_reports = []
+        extracted = False
+        guard = self._make_guard(extract_dir)
         try:
-            chunk.extract(inpath, extract_dir)
+            with self._limit_extraction(guard):
+                extract()
+            extracted = True
 
             if carved_path and not self.config.keep_extracted_chunks:
                 logger.debug("Removing extracted chunk", path=carved_path)
                 carved_path.unlink()
 
+        except ExtractionBudgetExceeded as e:
+            extraction_reports.extend(e.reports)
+            remove_extracted_directory(extract_dir)
+
         except ExtractError as e:
             extraction_reports.extend(e.reports)
 
@@ -381,10 +1174,12 @@ class _FileTask:
             logger.exception("Unknown error happened while extracting chunk")
             extraction_reports.append(UnknownError(exception=exc))
 
-        self.result.add_report(chunk.as_report(extraction_reports))
+        if extract_dir.exists() and not self._fix_extracted_directory(
+            extract_dir, guard, extraction_reports
+        ):
+            extracted = False
 
-        # we want to get consistent partial output even in case of unforeseen problems
-        fix_extracted_directory(extract_dir, self.result)
+        self.result.add_report(chunk.as_report(extraction_reports))
 
         if extract_dir.exists():
             self.result.add_subtask(
@@ -392,23 +1187,81 @@ class _FileTask:
                     chunk_id=chunk.id,
                     path=extract_dir,
                     depth=self.task.depth + 1,
+                    size_hint=chunk.size,
                 )
             )
 
+        return extracted
+
+    @contextlib.contextmanager
+    def _limit_extraction(self, guard: Optional[ExtractionGuard]) -> Iterator[None]:
+        """Run the extraction within the budget, the time and resource limits."""
+        handler_name = self.chunk.handler.NAME
+        timeout = self.config.get_extract_timeout(handler_name)
+        try:
+            with guard_extraction(guard), limit_resources(
+                self.config.extractor_limits
+            ), watchdog(timeout):
+                yield
+        except WatchdogTimeout:
+            report = ExtractTimeoutReport(handler=handler_name, timeout=timeout)
+            logger.error("Extraction timed out", **report.asdict())
+            raise ExtractError(report) from None
+
+    def _make_guard(self, extract_dir: Path) -> Optional[ExtractionGuard]:
+        if self.budget is None:
+            return None
+        return ExtractionGuard(self.budget, self.config.extract_root, extract_dir)
+
+    def _fix_extracted_directory(
+        self,
+        extract_dir: Path,
+        guard: Optional[ExtractionGuard],
+        extraction_reports: List[Report],
+    ) -> bool:
+        """Fix the extracted files, returns False if they exceeded the budget."""
+        try:
+            # we want to get consistent partial output even in case of unforeseen problems
+            fix_extracted_directory(extract_dir, self.result, guard)
+            if guard is not None:
+                guard.commit()
+        except ExtractionBudgetExceeded as e:
+            extraction_reports.extend(e.reports)
+            remove_extracted_directory(extract_dir)
+            return False
+        return True
+
+
+def get_entry_size(entry: os.DirEntry) -> int:
+    try:
+        return entry.stat(follow_symlinks=False).st_size
+    except OSError:
+        return 0
 
-def remove_inner_chunks(chunks: List[ValidChunk]) -> List[ValidChunk]:
-    """Remove all chunks from the list which are within another bigger chunks."""
-    if not chunks:
-        return []
 
-    chunks_by_size = sorted(chunks, key=attrgetter("size"), reverse=True)
-    outer_chunks = [chunks_by_size[0]]
-    for chunk in chunks_by_size[1:]:
-        if not any(outer.contains(chunk) for outer in outer_chunks):
-            outer_chunks.append(chunk)
+def ensure_root_extract_dir(task: Task, extract_dir: Path):
+    # ensure that the root extraction directory is created even for empty extractions
+    if task.depth == 0:
+        extract_dir.mkdir(parents=True, exist_ok=True)
+
+
+def evict_dropped_spills(
+    all_chunks: Iterable[ValidChunk], outer_chunks: Iterable[ValidChunk]
+):
+    """Evict the spilled contents of chunks, which are not extracted."""
+    extracted_chunk_ids = {chunk.id for chunk in outer_chunks}
+    for chunk in all_chunks:
+        if chunk.id not in extracted_chunk_ids:
+            evict_spill(chunk)
+
+
+def remove_inner_chunks(chunks: Iterable[ValidChunk]) -> ChunkIndex[ValidChunk]:
+    """Remove all chunks from the list which are within another bigger chunks."""
+    chunk_index = _as_chunk_index(chunks)
+    outer_chunks = chunk_index.outer_chunks()
 
     outer_count = len(outer_chunks)
-    removed_count = len(chunks) - outer_count
+    removed_count = len(chunk_index) - outer_count
     logger.debug(
         "Removed inner chunks",
         outer_chunk_count=noformat(outer_count),
@@ -419,39 +1272,23 @@ def remove_inner_chunks(chunks: List[ValidChunk]) -> List[ValidChunk]:
 
 
 def calculate_unknown_chunks(
-    chunks: List[ValidChunk], file_size: int
+    chunks: Iterable[ValidChunk], file_size: int
 ) -> List[UnknownChunk]:
     """Calculate the empty gaps between chunks."""
-    if not chunks or file_size == 0:
+    chunk_index = _as_chunk_index(chunks)
+    if not chunk_index or file_size == 0:
         return []
 
-    sorted_by_offset = sorted(chunks, key=attrgetter("start_offset"))
+    return [
+        UnknownChunk(start_offset=start_offset, end_offset=end_offset)
+        for start_offset, end_offset in chunk_index.uncovered_ranges(file_size)
+    ]
 
-    unknown_chunks = []
-
-    first = sorted_by_offset[0]
-    if first.start_offset != 0:
-        unknown_chunk = UnknownChunk(0, first.start_offset)
-        unknown_chunks.append(unknown_chunk)
-
-    for chunk, next_chunk in pairwise(sorted_by_offset):
-        diff = next_chunk.start_offset - chunk.end_offset
-        if diff != 0:
-            unknown_chunk = UnknownChunk(
-                start_offset=chunk.end_offset,
-                end_offset=next_chunk.start_offset,
-            )
-            unknown_chunks.append(unknown_chunk)
-
-    last = sorted_by_offset[-1]
-    if last.end_offset < file_size:
-        unknown_chunk = UnknownChunk(
-            start_offset=last.end_offset,
-            end_offset=file_size,
-        )
-        unknown_chunks.append(unknown_chunk)
 
-    return unknown_chunks
+def _as_chunk_index(chunks: Iterable[ValidChunk]) -> ChunkIndex[ValidChunk]:
+    if isinstance(chunks, ChunkIndex):
+        return chunks
+    return ChunkIndex(chunks)
 
 
 def calculate_entropy(path: Path, *, draw_plot: bool):
@@ -78,6 +78,20 @@ class CalculateChunkExceptionReport(UnknownError):
     handler: str
 
 
+@attr.define(kw_only=True)
+class CandidateThrottlingReport(Report):
+    """Describes a handler for which chunk calculation was limited during chunk search"""
+
+    handler: str
+    accepted_count: int
+    rejected_count: int
+    # offsets of the pattern matches where the handler got throttled
+    throttled_offset: Optional[int]
+    budget_exhausted_offset: Optional[int]
+    skipped_high_entropy_count: int
+    skipped_over_budget_count: int
+
+
 @attr.define(kw_only=True)
 class ExtractCommandFailedReport(ErrorReport):
     """Describes an error when failed to run the extraction command"""
@@ -89,6 +103,59 @@ class ExtractCommandFailedReport(ErrorReport):
     exit_code: int
 
 
+@attr.define(kw_only=True)
+class ExtractCommandLimitExceededReport(ExtractCommandFailedReport):
+    """Describes an extraction command killed, as it exceeded its resource limit"""
+
+    severity: Severity = Severity.ERROR
+    # name of the limit, "cpu" or "memory"
+    limit: str
+    value: int
+
+
+@attr.define(kw_only=True)
+class ExtractTimeoutReport(ErrorReport):
+    """Describes a chunk extraction stopped, as it did not finish in time"""
+
+    severity: Severity = Severity.ERROR
+    handler: str
+    timeout: float
+
+
+@attr.define(kw_only=True)
+class CalculateChunkTimeoutReport(ErrorReport):
+    """Describes a chunk calculation stopped, as it did not finish in time"""
+
+    severity: Severity = Severity.ERROR
+    handler: str
+    start_offset: int
+    timeout: float
+
+
+@attr.define(kw_only=True)
+class DecompressionFailedReport(ErrorReport):
+    """Describes an error when failed to decompress a chunk in process"""
+
+    severity: Severity = Severity.WARNING
+    # the output file, which can be left with partially decompressed content
+    path: Path
+    error: str
+
+
+@attr.define(kw_only=True)
+class ExtractionBudgetExceededReport(ErrorReport):
+    """Describes a chunk extraction stopped, as its output exceeded the extraction budget"""
+
+    severity: Severity = Severity.ERROR
+    # the removed output of the extraction
+    path: Path
+    size: int
+    file_count: int
+    # 0 means unlimited
+    max_size: int
+    max_files: int
+
+
 @attr.define(kw_only=True)
 class ExtractDirectoryExistsReport(ErrorReport):
     severity: Severity = Severity.ERROR
@@ -166,6 +233,13 @@ class HashReport(Report):
         )
 
 
+@attr.define(kw_only=True)
+class DuplicateFileReport(Report):
+    """Describes a file not processed, as a file with the same content is processed"""
+
+    original_path: Path
+
+
 @attr.define(kw_only=True)
 class FileMagicReport(Report):
     magic: str
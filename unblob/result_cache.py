@@ -0,0 +1,121 @@
+"""Cache of chunk search results, persisted across runs.
+
+Files with the same content are searched for the same chunks by the same handlers,
+so the chunks found in a file are stored under its content digest, the fingerprint
+of the handlers and the unblob version, in an SQLite database.  The least recently
+used results are evicted, when the cache grows beyond its size.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from importlib import metadata
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from structlog import get_logger
+
+logger = get_logger()
+
+DATABASE_NAME = "results.sqlite"
+# waiting for the database locked by other worker processes
+LOCK_TIMEOUT = 30
+
+# start offset, end offset, handler name, is encrypted
+CachedChunk = Tuple[int, int, str, bool]
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS results (
+        key TEXT PRIMARY KEY,
+        chunks TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        last_used REAL NOT NULL
+    )
+"""
+
+
+def get_unblob_version() -> str:
+    try:
+        return metadata.version("unblob")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def get_result_key(digest: str, search_fingerprint: str) -> str:
+    """Key of the results of a file with content digest.
+
+    search_fingerprint identifies everything else determining the chunks found, like
+    the handlers.
+    """
+    key = hashlib.sha256()
+    for part in (get_unblob_version(), search_fingerprint, digest):
+        key.update(part.encode())
+        key.update(b"\x00")
+    return key.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, cache_dir: Path, max_size: int):
+        self.path = cache_dir / DATABASE_NAME
+        # total size of the stored chunk lists in bytes
+        self.max_size = max_size
+        self._connection: Optional[sqlite3.Connection] = None
+        self._connection_pid: Optional[int] = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # connections are not shared with other processes
+        return {**self.__dict__, "_connection": None, "_connection_pid": None}
+
+    def get(self, key: str) -> Optional[List[CachedChunk]]:
+        try:
+            with self._connect() as connection:
+                row = connection.execute(
+                    "SELECT chunks FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                connection.execute(
+                    "UPDATE results SET last_used = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+        except sqlite3.Error as e:
+            logger.warning("Can not read result cache", path=self.path, error=e)
+            return None
+
+        return [tuple(chunk) for chunk in json.loads(row[0])]
+
+    def put(self, key: str, chunks: List[CachedChunk]):
+        serialized_chunks = json.dumps(chunks)
+        try:
+            with self._connect() as connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                    (key, serialized_chunks, len(serialized_chunks), time.time()),
+                )
+                self._evict(connection)
+        except sqlite3.Error as e:
+            logger.warning("Can not write result cache", path=self.path, error=e)
+
+    def _evict(self, connection: sqlite3.Connection):
+        """Evict the least recently used results beyond max_size."""
+        connection.execute(
+            """
+            DELETE FROM results WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(size) OVER (
+                        ORDER BY last_used DESC, key
+                    ) AS total_size FROM results
+                ) WHERE total_size > ?
+            )
+            """,
+            (self.max_size,),
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None or self._connection_pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT)
+            self._connection.execute(_SCHEMA)
+            self._connection_pid = os.getpid()
+        return self._connection
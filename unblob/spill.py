@@ -0,0 +1,142 @@
+"""Cache of decompressed chunk contents.
+
+Handlers decompressing whole streams to find where their chunks end can spill the
+decompressed content to the cache, so extraction can reuse it instead of
+decompressing the chunk again.  The cache is a directory shared by the worker
+processes, entries are named after chunk ids and evicted by chunk id once their
+chunks are extracted or dropped.
+"""
+import os
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+import attr
+from structlog import get_logger
+
+from .models import ValidChunk
+
+logger = get_logger()
+
+SPILL_PREFIX = ".spill-"
+
+
+@attr.define(frozen=True)
+class SpillCache:
+    directory: Path
+    # entries are not kept beyond this total size in bytes
+    max_size: int
+
+    def get_path(self, chunk_id: str) -> Path:
+        return self.directory / chunk_id
+
+    def get_size(self) -> int:
+        """Total size of the entries, including the ones being written."""
+        size = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    size += entry.stat().st_size
+                except FileNotFoundError:
+                    # evicted meanwhile
+                    pass
+        return size
+
+    def evict(self, chunk_id: str):
+        self.get_path(chunk_id).unlink(missing_ok=True)
+
+
+_spill_cache: Optional[SpillCache] = None
+
+
+def configure_spill_cache(cache: Optional[SpillCache]):
+    """Set the cache of the current process, None disables spilling."""
+    global _spill_cache
+    _spill_cache = cache
+
+
+def get_spill_cache() -> Optional[SpillCache]:
+    return _spill_cache
+
+
+def evict_spill(chunk: ValidChunk):
+    """Evict the spilled content of a chunk, which is not extracted."""
+    if chunk.spill_path is not None and _spill_cache is not None:
+        _spill_cache.evict(chunk.id)
+
+
+class SpillWriter:
+    """Writes the decompressed content of a chunk being calculated to the cache.
+
+    Nothing is written without a configured cache.  The content is dropped when it
+    does not fit the cache, or when it is not kept for a chunk.
+    """
+
+    def __init__(self, cache: Optional[SpillCache]):
+        self._cache = cache
+        self._file: Optional[BinaryIO] = None
+        self._path: Optional[Path] = None
+        self._available = 0
+        self._dropped = cache is None
+
+    def __enter__(self) -> "SpillWriter":
+        return self
+
+    def __exit__(self, *_exc_info):
+        self._drop()
+
+    def write(self, data: bytes):
+        if self._dropped or (self._file is None and not self._open()):
+            return
+
+        assert self._file is not None
+        if len(data) > self._available:
+            logger.debug("Decompressed content does not fit the spill cache")
+            self._drop()
+            return
+
+        self._file.write(data)
+        self._available -= len(data)
+
+    def keep(self, chunk: ValidChunk):
+        """Keep the written content as the decompressed content of chunk."""
+        if self._dropped or (self._file is None and not self._open()):
+            return
+
+        assert self._cache is not None and self._file is not None
+        self._file.close()
+        spill_path = self._cache.get_path(chunk.id)
+        os.replace(self._path, spill_path)
+        self._file = None
+        self._dropped = True
+        chunk.spill_path = spill_path
+
+    def _open(self) -> bool:
+        assert self._cache is not None
+        try:
+            # concurrent writers can each use the space available when they start
+            self._available = self._cache.max_size - self._cache.get_size()
+            fd, path = tempfile.mkstemp(prefix=SPILL_PREFIX, dir=self._cache.directory)
+        except OSError as e:
+            logger.warning("Can not spill to cache", error=e)
+            self._dropped = True
+            return False
+
+        self._file = os.fdopen(fd, "wb")
+        self._path = Path(path)
+        return True
+
+    def _drop(self):
+        self._dropped = True
+        if self._file is None:
+            return
+
+        assert self._path is not None
+        self._file.close()
+        self._path.unlink(missing_ok=True)
+        self._file = None
+
+
+def spill_decompressed() -> SpillWriter:
+    """Writer spilling decompressed content to the cache of the current process."""
+    return SpillWriter(_spill_cache)
@@ -5,7 +5,7 @@ from pathlib import Path
 import pytest
 from pytest_cov.embed import cleanup_on_sigterm
 
-from unblob.finder import build_hyperscan_database
+from unblob.finder import prepare_search
 from unblob.logging import configure_logger
 from unblob.models import ProcessResult
 from unblob.processing import ExtractionConfig
@@ -49,7 +49,7 @@ def extraction_config(tmp_path: Path):
 
     # Warmup lru_cache before ``process_file`` forks, so child
     # processes can reuse the prebuilt databases without overhead
-    build_hyperscan_database(config.handlers)
+    prepare_search(config.handlers, config.cache_dir, config.process_num)
 
     return config
 
@@ -2,8 +2,11 @@ import sys
 
 import unblob.plugins
 from unblob import cli
+from unblob.daemon import Daemon, _RequestHandler, _Server
+from unblob.extractors.decompressor import BufferReader, DecompressorReader
 from unblob.file_utils import File, iterbits, round_down
-from unblob.models import _JSONEncoder
+from unblob.handlers.compression.xz import XZStreamsReader
+from unblob.models import Chunk, _JSONEncoder
 from unblob.parser import _HexStringToRegex
 from unblob.report import ChunkReport, FileMagicReport, StatReport
 
@@ -25,6 +28,21 @@ cli.cli.context_class
 
 unblob.plugins.hookimpl
 File.from_bytes
+# public API, chunk coverage is checked with ChunkIndex
+Chunk.contains
 
 iterbits
 round_down
+
+# io.RawIOBase protocol, called by the io machinery
+BufferReader.readable
+BufferReader.readinto
+DecompressorReader.readable
+DecompressorReader.readinto
+XZStreamsReader.readable
+XZStreamsReader.readinto
+
+# socketserver protocol, and the API of the daemon for embedding it
+_Server.daemon_threads
+_RequestHandler.handle
+Daemon.stop